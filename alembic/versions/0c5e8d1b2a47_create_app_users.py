@@ -0,0 +1,43 @@
+"""create app_users
+
+Revision ID: 0c5e8d1b2a47
+Revises: 
+Create Date: 2023-03-06 18:20:02.118940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0c5e8d1b2a47'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# the schema as it was before ids were stored as uuids
+ROLES = sa.Enum("USER", "MODERATOR", "ADMIN", "BANNED", name="userroleenum")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "app_users",
+        sa.Column("id", sa.String(length=26), nullable=False),
+        sa.Column("email", sa.String(length=100), nullable=False),
+        sa.Column("alias", sa.String(length=20), nullable=False),
+        sa.Column("password", sa.String(length=200), nullable=False),
+        sa.Column("last_login",
+                  sa.DateTime(timezone=False),
+                  nullable=False,
+                  server_default=sa.text("TIMEZONE('utc', CURRENT_TIMESTAMP)")),
+        sa.Column("revoked_at", sa.DateTime(timezone=False), nullable=True),
+        sa.Column("confirmed", sa.Boolean(), nullable=False),
+        sa.Column("role", ROLES, nullable=False, server_default="USER"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+        sa.UniqueConstraint("alias"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("app_users")
+    ROLES.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,92 @@
+"""store user ids as 16 byte uuid
+
+Revision ID: 4f1c2a9e7b3d
+Revises: 0c5e8d1b2a47
+Create Date: 2023-03-06 18:22:41.516302
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '4f1c2a9e7b3d'
+down_revision = '0c5e8d1b2a47'
+branch_labels = None
+depends_on = None
+
+# Crockford base32 <-> uuid conversion, kept in the database for ad-hoc queries.
+ULID_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION ulid_to_uuid(ulid text) RETURNS uuid AS $$
+DECLARE
+    alphabet text := '0123456789ABCDEFGHJKMNPQRSTVWXYZ';
+    bits bit varying := B'';
+    hex text := '';
+    pos int;
+BEGIN
+    IF length(ulid) <> 26 THEN
+        RAISE EXCEPTION 'invalid ulid: %', ulid;
+    END IF;
+    FOR i IN 1..26 LOOP
+        pos := position(substr(upper(ulid), i, 1) in alphabet);
+        IF pos = 0 THEN
+            RAISE EXCEPTION 'invalid ulid: %', ulid;
+        END IF;
+        bits := bits || (pos - 1)::bit(5);
+    END LOOP;
+    -- 26 * 5 = 130 bits, the 2 leading bits are always zero
+    bits := substring(bits from 3);
+    FOR i IN 0..31 LOOP
+        hex := hex || to_hex(substring(bits from i * 4 + 1 for 4)::bit(4)::int);
+    END LOOP;
+    RETURN hex::uuid;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE STRICT;
+
+CREATE OR REPLACE FUNCTION uuid_to_ulid(id uuid) RETURNS text AS $$
+DECLARE
+    alphabet text := '0123456789ABCDEFGHJKMNPQRSTVWXYZ';
+    bits bit(130);
+    result text := '';
+BEGIN
+    bits := B'00' || ('x' || replace(id::text, '-', ''))::bit(128);
+    FOR i IN 0..25 LOOP
+        result := result || substr(alphabet, substring(bits from i * 5 + 1 for 5)::bit(5)::int + 1, 1);
+    END LOOP;
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE STRICT;
+"""
+
+
+def _id_is_uuid() -> bool:
+    columns = sa.inspect(op.get_bind()).get_columns("app_users")
+    return any(c["name"] == "id" and isinstance(c["type"], sa.Uuid) for c in columns)
+
+
+def upgrade() -> None:
+    op.execute(ULID_FUNCTIONS)
+    if not context.is_offline_mode() and _id_is_uuid():  # created by init_db's create_all from the current models
+        return
+    op.alter_column(
+        "app_users",
+        "id",
+        type_=postgresql.UUID(as_uuid=True),
+        existing_type=sa.String(length=26),
+        existing_nullable=False,
+        postgresql_using="ulid_to_uuid(id)",
+    )
+
+
+def downgrade() -> None:
+    op.execute(ULID_FUNCTIONS)
+    op.alter_column(
+        "app_users",
+        "id",
+        type_=sa.String(length=26),
+        existing_type=postgresql.UUID(as_uuid=True),
+        existing_nullable=False,
+        postgresql_using="uuid_to_ulid(id)",
+    )
+    op.execute("DROP FUNCTION IF EXISTS ulid_to_uuid(text);")
+    op.execute("DROP FUNCTION IF EXISTS uuid_to_ulid(uuid);")
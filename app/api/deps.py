@@ -1,6 +1,7 @@
 from typing import List
 from fastapi import Depends, HTTPException, status
 
+from app.core import revocations
 from app.core.exceptions import RevokedTokenException
 from app.schemas.user_schema import UserCreateIn
 from app import crud
@@ -36,6 +37,16 @@ def get_current_user(required_roles: List[str] = None) -> User:
 	async def current_user(token: str = Depends(auth_bearer)) -> User:
 		payload = validate_token(token)
 		user_id = payload.sub
+		# shared with the other workers, rejects revoked tokens and roles before any query
+		if revocation := revocations.lookup(user_id):
+			if revocation.revokes(payload.iat):
+				raise RevokedTokenException(token_type="access_token")
+			if required_roles and revocation.role and revocation.role not in required_roles:
+				raise HTTPException(
+					status_code=403,
+					detail=f"a {revocation.role.lower()} cannot perform this action",
+				)
+
 		user: User = await crud.user.get(id=user_id)
 		if not user:
 			raise HTTPException(status_code=404, detail="user does not exist")
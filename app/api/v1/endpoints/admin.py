@@ -1,15 +1,43 @@
+import csv
+import io
+import json
+import os
+import time
 from datetime import datetime
-from fastapi import Depends, status, HTTPException, APIRouter
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple
+from fastapi import Depends, status, HTTPException, APIRouter, Query, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi_async_sqlalchemy import db
 from loguru import logger
+from pydantic import ValidationError
 
 from app import crud
 from app.api import deps
+from app.core import profiler, tracing
+from app.core.config import config
+from app.core.security import hash_pass_many
+from app.core.tracing import TracedRoute
 from app.models.user_model import User, UserRoleEnum
-from app.schemas.admin_schema import (AdminSetUserRole, AdminBanUser)
+from app.schemas.admin_schema import (
+	AdminSetUserRole,
+	AdminBanUser,
+	AdminImportOut,
+	AdminImportUser,
+	ExportFormatEnum,
+)
 from app.schemas.response_schema import (
-	create_response, )
+	GetResponseBase,
+	PostResponseBase,
+	create_response,
+)
+from app.schemas.user_schema import UserOutFull
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
+
+EXPORT_MEDIA_TYPES = {
+	ExportFormatEnum.NDJSON: "application/x-ndjson",
+	ExportFormatEnum.CSV: "text/csv",
+}
 
 
 @router.post("/ban-user", status_code=status.HTTP_200_OK)  # POST /admin/ban-user
@@ -52,7 +80,194 @@ async def set_user_role(
 		"role": data.role,
 	})
 
-	logger.success(
-		f"'{current_user.alias}' ({current_user.id}) has set user role: '{user.alias}' -> {data.role}"
+	logger.success("'{}' ({}) has set user role: '{}' -> {}", current_user.alias, current_user.id,
+		user.alias, data.role)
+	return create_response(message="role updated", data=None)
+
+
+async def _ndjson_chunks(partitions: AsyncIterator[List[tuple]]) -> AsyncIterator[str]:
+	async for rows in partitions:
+		yield "".join(UserOutFull.from_orm(row).json() + "\n" for row in rows)
+
+
+async def _csv_chunks(partitions: AsyncIterator[List[tuple]]) -> AsyncIterator[str]:
+	fields = list(UserOutFull.__fields__)
+	buffer = io.StringIO()
+	writer = csv.DictWriter(buffer, fieldnames=fields)
+	writer.writeheader()
+	async for rows in partitions:
+		for row in rows:
+			user = UserOutFull.from_orm(row)
+			writer.writerow({field: getattr(user, field) for field in fields})
+		yield buffer.getvalue()
+		buffer.seek(0)
+		buffer.truncate()
+	if buffer.tell():
+		yield buffer.getvalue()
+
+
+@router.get("/users/export")  # GET /admin/users/export
+async def export_users(
+	format: ExportFormatEnum = ExportFormatEnum.NDJSON,
+	role: UserRoleEnum | None = None,
+	search_string: str | None = Query(default=None, min_length=3, max_length=20),
+	fetch_size: int = Query(default=config.EXPORT_FETCH_SIZE, ge=10, le=10_000),
+	current_user: User = Depends(deps.get_current_user(required_roles=[UserRoleEnum.ADMIN])),
+) -> StreamingResponse:
+	"""Streams every matching user as NDJSON or CSV over a server side cursor."""
+	query = crud.user.filter_users(crud.user.row_query(), search_string=search_string, role=role)
+	partitions = crud.user.stream_rows(query=query.order_by(User.id), fetch_size=fetch_size)
+	chunks = _ndjson_chunks(partitions) if format == ExportFormatEnum.NDJSON else _csv_chunks(
+		partitions)
+
+	logger.info("'{}' ({}) is exporting users as {}", current_user.alias, current_user.id,
+		format.value)
+	return StreamingResponse(
+		chunks,
+		media_type=EXPORT_MEDIA_TYPES[format],
+		headers={"Content-Disposition": f"attachment; filename=users.{format.value}"},
 	)
-	return create_response(message="role updated", data=None)
\ No newline at end of file
+
+
+def _import_rows(content: str,
+	format: ExportFormatEnum) -> Iterator[Tuple[int, Dict | None, str | None]]:
+	"""Yields (line, fields, error) from an uploaded file; fields is None with an error."""
+	if format == ExportFormatEnum.CSV:
+		reader = csv.DictReader(io.StringIO(content))
+		try:
+			for fields in reader:
+				if reader.restkey in fields:  # more values than the header has columns
+					yield reader.line_num, None, "unexpected extra fields"
+					continue
+				yield reader.line_num, {key: value for key, value in fields.items() if value}, None
+		except csv.Error as e:
+			raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+				detail=f"line {reader.line_num}: malformed csv: {e}")
+		return
+
+	for line, raw in enumerate(content.splitlines(), start=1):
+		if not raw.strip():
+			continue
+		try:
+			fields = json.loads(raw)
+		except ValueError:
+			fields = None
+		if isinstance(fields, dict):
+			yield line, fields, None
+		else:
+			yield line, None, "invalid json object"
+
+
+def _validation_message(error: ValidationError) -> str:
+	return "; ".join(
+		f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in error.errors())
+
+
+@router.post("/users/import")  # POST /admin/users/import
+async def import_users(
+	file: UploadFile,
+	format: ExportFormatEnum | None = None,
+	current_user: User = Depends(deps.get_current_user(required_roles=[UserRoleEnum.ADMIN])),
+) -> PostResponseBase[AdminImportOut]:
+	"""
+	Bulk creates users from an NDJSON or CSV upload (the export formats), in any role but
+	admin. Passwords are hashed across a process pool and rows are loaded with COPY.
+	Responds with a per-line error report.
+	"""
+	started = time.perf_counter()
+	if format is None:
+		is_csv = (file.filename or "").lower().endswith(".csv")
+		format = ExportFormatEnum.CSV if is_csv else ExportFormatEnum.NDJSON
+	content = await file.read(config.IMPORT_MAX_BYTES + 1)
+	if len(content) > config.IMPORT_MAX_BYTES:
+		raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+			detail=f"an import is limited to {config.IMPORT_MAX_BYTES} bytes")
+	try:
+		content = content.decode("utf-8-sig")
+	except UnicodeDecodeError:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+			detail="the file must be utf-8 encoded")
+
+	received = 0
+	valid: List[Tuple[int, AdminImportUser]] = []
+	errors: List[Dict] = []
+	emails, aliases = set(), set()
+	for line, fields, error in _import_rows(content, format):
+		received += 1
+		if received > config.IMPORT_MAX_ROWS:
+			raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+				detail=f"an import is limited to {config.IMPORT_MAX_ROWS} rows")
+		if fields is None:
+			errors.append({"line": line, "error": error})
+			continue
+		try:
+			data = AdminImportUser(**fields)
+		except ValidationError as e:
+			errors.append({"line": line, "error": _validation_message(e)})
+			continue
+		if data.email.lower() in emails:
+			errors.append({"line": line, "error": "duplicate email address in this file"})
+		elif data.alias in aliases:
+			errors.append({"line": line, "error": "duplicate alias in this file"})
+		else:
+			emails.add(data.email.lower())
+			aliases.add(data.alias)
+			valid.append((line, data))
+
+	imported = 0
+	if valid:
+		hashes = await hash_pass_many([data.password for _, data in valid])
+		conflicts = await crud.user.import_users(
+			users=[(line, data, password) for (line, data), password in zip(valid, hashes)])
+		errors.extend({"line": line, "error": error} for line, error in conflicts)
+		imported = len(valid) - len(conflicts)
+
+	elapsed = time.perf_counter() - started
+	errors.sort(key=lambda error: error["line"])
+	logger.success("'{}' ({}) imported {} users ({} failed) in {:.2f}s", current_user.alias,
+		current_user.id, imported, len(errors), elapsed)
+	return create_response(
+		message=f"{imported} user(s) imported",
+		data={
+		"received": received,
+		"imported": imported,
+		"failed": len(errors),
+		"errors": errors,
+		"elapsed_seconds": round(elapsed, 3),
+		"rows_per_second": round(imported / elapsed, 1) if elapsed else 0.0,
+		},
+	)
+
+
+@router.get("/profile", response_class=PlainTextResponse)  # GET /admin/profile
+async def profile_worker(
+	seconds: float = Query(default=10, gt=0, le=config.PROFILER_MAX_SECONDS),
+	rate: int = Query(default=100, ge=1, le=1000, description="samples per second"),
+	tasks: bool = Query(default=True, description="include suspended asyncio tasks"),
+	current_user: User = Depends(deps.get_current_user(required_roles=[UserRoleEnum.ADMIN])),
+) -> PlainTextResponse:
+	"""
+	Samples the worker serving this request and returns collapsed stacks for a flamegraph.
+	Thread stacks are rooted at `thread:<name>`, suspended tasks at `awaiting`.
+	"""
+	await db.session.close()  # don't hold a pooled connection while sampling
+	stacks, samples = await profiler.profile(seconds, rate=rate, tasks=tasks)
+	logger.info("'{}' ({}) profiled worker {} for {}s ({} samples)", current_user.alias,
+		current_user.id, os.getpid(), seconds, samples)
+	return PlainTextResponse(stacks,
+		headers={
+		"X-Profile-Samples": str(samples),
+		"X-Profile-Pid": str(os.getpid())
+		})
+
+
+@router.get("/traces")  # GET /admin/traces
+async def get_traces(
+	limit: int = Query(default=20, ge=1, le=1000),
+	min_duration_ms: float = Query(default=0.0, ge=0),
+	name: str | None = Query(default=None, description="matches part of the root span name"),
+	current_user: User = Depends(deps.get_current_user(required_roles=[UserRoleEnum.ADMIN])),
+) -> GetResponseBase[List[Dict[str, Any]]]:
+	"""Lists the latest sampled request traces, newest first, with their spans in start order."""
+	traces = tracing.recent(limit, min_duration_ms=min_duration_ms, name=name)
+	return create_response(data=traces, message=f"{len(traces)} trace(s)")
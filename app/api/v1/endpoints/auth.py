@@ -1,9 +1,13 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
+from typing import List, Tuple
 from fastapi import Depends, status, HTTPException, APIRouter, Response
 from loguru import logger
 
 from app import crud
 from app.api import deps
+from app.core import jobs, revocations
+from app.core.ratelimit import RateLimit, Scope
+from app.core.tracing import TracedRoute
 from app.core.exceptions import RevokedTokenException, IdNotFoundException
 from app.models.user_model import User
 from app.core.security import create_token, validate_token, verify_hash
@@ -16,12 +20,22 @@ from app.schemas.response_schema import (
 	PostResponseBase,
 	create_response,
 )
-from app.utils.time_util import compare_datetimes
+from app.utils.time_util import compare_datetimes, utc_now
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
+login_limit = RateLimit(config.RATE_LIMIT_LOGIN, name="login")  # one budget for both logins
+account_limit = RateLimit(config.RATE_LIMIT_ACCOUNT, by=Scope.USER)
 
-@router.post("/register", status_code=status.HTTP_201_CREATED)  # POST /auth/register
+
+@jobs.handler("stamp_login")
+async def stamp_logins(logins: List[Tuple[str, datetime]]):
+	await crud.user.stamp_logins(logins=logins)
+
+
+@router.post("/register",
+	status_code=status.HTTP_201_CREATED,
+	dependencies=[Depends(RateLimit(config.RATE_LIMIT_REGISTER))])  # POST /auth/register
 async def create_user(
 	response: Response, new_user: UserCreateIn = Depends(deps.user_doesnt_exist)
 ) -> PostResponseBase[TokensOut]:
@@ -31,7 +45,7 @@ async def create_user(
 			detail=f"password and confirmation must match")
 
 	user = await crud.user.create_user(data=new_user)
-	logger.success(f"ew user created: {user.email}:{new_user.alias}")
+	logger.success("new user created: {}:{}", user.email, new_user.alias)
 
 	access_token = create_token(user.id, token_type="access_token")
 	refresh_token = create_token(user.id, token_type="refresh_token")
@@ -46,7 +60,7 @@ async def create_user(
 	)
 
 
-@router.post("/login")  # POST /auth/login
+@router.post("/login", dependencies=[Depends(login_limit)])  # POST /auth/login
 async def login(
 	response: Response,
 	data: LogIn,
@@ -60,7 +74,7 @@ async def login(
 	refresh_token = create_token(user.id, token_type="refresh_token")
 	response.set_cookie(key="refresh_token", value=f"Bearer {refresh_token}", httponly=True)
 
-	await crud.user.stamp_login(user=user)
+	await jobs.enqueue("stamp_login", (user.id, utc_now()))
 
 	return create_response(
 		message=f"login succeeded",
@@ -71,7 +85,7 @@ async def login(
 	)
 
 
-@router.post("/access-token")  # POST /auth/access-token
+@router.post("/access-token", dependencies=[Depends(login_limit)])  # POST /auth/access-token
 async def get_access_token(data: LogIn) -> PostResponseBase[TokenOut]:
 	"""Optional access-only login for direct API usage."""
 	user = await crud.user.verify(email=data.email, password=data.password)
@@ -82,7 +96,7 @@ async def get_access_token(data: LogIn) -> PostResponseBase[TokenOut]:
 		token_type="access_token",
 		expires_delta=access_token_expires)
 
-	await crud.user.stamp_login(user=user)
+	await jobs.enqueue("stamp_login", (user.id, utc_now()))
 
 	return create_response(
 		message=f"token granted",
@@ -93,7 +107,8 @@ async def get_access_token(data: LogIn) -> PostResponseBase[TokenOut]:
 	)
 
 
-@router.get("/refresh-access")  # POST /auth/refresh-access
+@router.get("/refresh-access",
+	dependencies=[Depends(RateLimit(config.RATE_LIMIT_REFRESH))])  # POST /auth/refresh-access
 async def get_new_access_token(
 	response: Response,
 	refresh_token: str = Depends(deps.auth_cookie),
@@ -105,6 +120,9 @@ async def get_new_access_token(
 	"""
 	payload = validate_token(refresh_token)
 	user_id = payload.sub
+	if (revocation := revocations.lookup(user_id)) and revocation.revokes(payload.iat):
+		raise RevokedTokenException(token_type="refresh_token")
+
 	user = await crud.user.get(id=user_id)
 	if not user:
 		raise IdNotFoundException(User, id=user_id)
@@ -119,7 +137,7 @@ async def get_new_access_token(
 	if continuous:
 		refresh_token = create_token(user_id, token_type="refresh_token")
 		response.set_cookie(key="refresh_token", value=f"Bearer {refresh_token}", httponly=True)
-		await crud.user.stamp_login(user=user)
+		await jobs.enqueue("stamp_login", (user.id, utc_now()))
 		message = "both tokens refreshed"
 
 	return create_response(
@@ -131,17 +149,18 @@ async def get_new_access_token(
 	)
 
 
-@router.delete("/tokens")  # DELETE /auth/tokens
+@router.delete("/tokens", dependencies=[Depends(account_limit)])  # DELETE /auth/tokens
 async def revoke_tokens(current_user: User = Depends(deps.get_current_user()), ) -> None:
 	"""Allows a user to log out from all sessions by invalidating any previously issued tokens."""
 	# A regular front-end login route could simply delete the cookie for that session.
 	await crud.user.revoke_access(user=current_user)
-	logger.info(f"user logged out: {current_user.alias}")
+	logger.info("user logged out: {}", current_user.alias)
 
 	return create_response(message=f"tokens revoked", data=None)
 
 
-@router.post("/update-password")  # POST /auth/update-password
+@router.post("/update-password",
+	dependencies=[Depends(account_limit)])  # POST /auth/update-password
 async def update_password(
 		data: UpdatePassIn,
 		current_user: User = Depends(deps.get_current_user()),
@@ -155,8 +174,7 @@ async def update_password(
 			detail="confirmation does not match the desired password")
 
 	await crud.user.update_password(user=current_user, new_pass=data.new_pass)
-	await crud.user.revoke_access(user=current_user)
-	logger.success(f"user {current_user.alias} has update their password")
+	logger.success("user {} has update their password", current_user.alias)
 
 	# Could be a RedirectResponse to the front-end login
 	return create_response(message=f"password updated - please log in again", data=None)
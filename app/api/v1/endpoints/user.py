@@ -1,11 +1,14 @@
-from fastapi import (APIRouter, Depends, Query)
+from datetime import datetime, timedelta
+from typing import List
+from fastapi import (APIRouter, Depends, HTTPException, Query, status)
 from fastapi_pagination import Params
-from sqlalchemy import func, select
 from loguru import logger
 
 from app import crud
 from app.models import User
 from app.api import deps
+from app.core.budget import budget
+from app.core.coalesce import CoalescingRoute, coalesced
 from app.core.exceptions import (IdNotFoundException, UserSelfDeleteException)
 from app.models.user_model import UserRoleEnum
 from app.schemas.base_schema import OrderEnum, ULID
@@ -15,32 +18,79 @@ from app.schemas.response_schema import (
 	GetResponsePaginated,
 	DeleteResponseBase,
 )
-from app.schemas.user_schema import (UserOut, UserOutFull)
+from app.schemas.user_schema import (UserOut, UserOutFull, SignupCountOut)
+from app.utils import ulid
+from app.utils.time_util import utc_now
 
-router = APIRouter()
+router = APIRouter(route_class=CoalescingRoute)
+
+
+def registration_range(
+	registered_after: datetime | None = None,
+	registered_before: datetime | None = None,
+) -> tuple[datetime | None, datetime | None]:
+	"""Optional registration time bounds; naive datetimes are treated as UTC."""
+	if (registered_after and registered_before  # compared as the ULID bounds, naive or not
+		and ulid.datetime_ms(registered_after) >= ulid.datetime_ms(registered_before)):
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+			detail="registered_after must precede registered_before")
+	return registered_after, registered_before
 
 
 @router.get("s")  #GET /users/
+@budget(2.0)
 async def list_users(
 	params: Params = Depends(),
 	search_string: str | None = Query(default=None, min_length=3, max_length=20),
+	registered: tuple[datetime | None, datetime | None] = Depends(registration_range),
 ) -> GetResponsePaginated[UserOut]:
 	"""Retrieve a list users. Requires admin or moderator role."""
-	if search_string:
-		query = (select(User).filter(func.similarity(User.alias, search_string) > 0.4)
-					)  # using tgrm
-		users = await crud.user.get_multi_paginated(query=query, params=params)
-	else:
-		users = await crud.user.get_multi_paginated(params=params)
+	registered_after, registered_before = registered
+	query = crud.user.filter_users(crud.user.row_query(), search_string=search_string)
+	query = crud.user.filter_created(query, after=registered_after, before=registered_before)
+	users = await crud.user.get_rows_paginated(query=query, params=params)
 
 	message = "user(s) retrieved" if users.data.total else "no users found"
-	return create_response(data=users, message=message, meta={"search_string": search_string})
+	return create_response(data=users,
+		message=message,
+		meta={
+		"search_string": search_string,
+		"registered_after": registered_after,
+		"registered_before": registered_before,
+		})
+
+
+@router.get("s/signups")  #GET /users/signups
+@budget(2.0)
+async def get_signups_by_day(
+	registered: tuple[datetime | None, datetime | None] = Depends(registration_range),
+	current_user: User = Depends(
+	deps.get_current_user(required_roles=[UserRoleEnum.ADMIN, UserRoleEnum.MODERATOR])),
+) -> GetResponseBase[List[SignupCountOut]]:
+	"""Daily signup counts, defaulting to the last 30 days. Requires admin or moderator role."""
+	registered_after, registered_before = registered
+	if not registered_after and not registered_before:
+		registered_after = utc_now() - timedelta(days=30)
+	counts = await crud.user.get_count_by_day(after=registered_after, before=registered_before)
+	return create_response(
+		data=[{
+		"day": day,
+		"count": count
+		} for day, count in counts],
+		message="signups retrieved",
+		meta={
+		"registered_after": registered_after,
+		"registered_before": registered_before
+		},
+	)
 
 
 @router.get("s/new")  #GET /users/new
+@coalesced()
+@budget(1.0)
 async def list_new_users(params: Params = Depends(), ) -> GetResponsePaginated[UserOut]:
 	"""Retrieve a paginated list of the newest users."""
-	users = await crud.user.get_multi_paginated_ordered(params=params,
+	users = await crud.user.get_rows_paginated(params=params,
 		order_by="id",
 		order=OrderEnum.DESC)  #ULID is sortable
 
@@ -49,6 +99,7 @@ async def list_new_users(params: Params = Depends(), ) -> GetResponsePaginated[U
 
 
 @router.get("s/{role_name}")  #GET /users/:ROLE
+@budget(2.0)
 async def list_users_by_role_name(
 	role_name: UserRoleEnum,
 	params: Params = Depends(),
@@ -56,14 +107,16 @@ async def list_users_by_role_name(
 	deps.get_current_user(required_roles=[UserRoleEnum.ADMIN, UserRoleEnum.MODERATOR])),
 ) -> GetResponsePaginated[UserOutFull]:
 	"""Retrieve a list users by role. Requires admin or moderator role."""
-	query = (select(User).filter(User.role == role_name))
-	users = await crud.user.get_multi_paginated(query=query, params=params)
+	query = crud.user.filter_users(crud.user.row_query(), role=role_name)
+	users = await crud.user.get_rows_paginated(query=query, params=params)
 
 	message = "user(s) retrieved" if users.data.total else "no users found"
 	return create_response(data=users, message=message)
 
 
 @router.get("/count")  # GET /user/count
+@coalesced()
+@budget(1.0)
 async def get_user_count() -> GetResponseBase:
 	"""Retrieve the total number of users."""
 	user_count = await crud.user.get_count()
@@ -73,7 +126,7 @@ async def get_user_count() -> GetResponseBase:
 @router.get("/{user_id}")  # GET /user/:ID
 async def get_user_by_id(user_id: ULID, ) -> GetResponseBase[UserOut]:
 	"""Retrieve a user"""
-	if user := await crud.user.get(id=user_id):
+	if user := await crud.user.get_row(id=user_id):
 		return create_response(data=user, message="user retrieved")
 	else:
 		raise IdNotFoundException(User, id=user_id)
@@ -93,5 +146,5 @@ async def remove_user(
 		raise UserSelfDeleteException()
 
 	await crud.user.remove(id=user_id)
-	logger.success(f"'{current_user.alias}' ({current_user.id}) deleted user: '{user.alias}'")
+	logger.success("'{}' ({}) deleted user: '{}'", current_user.alias, current_user.id, user.alias)
 	return create_response(data=user, message=f"User {user.alias} removed.")
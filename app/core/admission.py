@@ -0,0 +1,115 @@
+"""
+Adaptive admission control, shedding load before requests pile up on the database pool.
+
+Each worker admits a limited number of concurrent requests and answers the rest at
+once with a 503 and `Retry-After`, rather than letting them wait for a pooled
+connection until their clients give up. The limit follows AIMD: while the worker is
+busy and healthy it grows by one per `limit` completed requests, and when event-loop
+lag or pool wait exceed their targets it drops to ADMISSION_BACKOFF times the requests
+in flight, at most every DECREASE_INTERVAL.
+
+Paths get a priority class: CRITICAL ones (health checks, metrics) are never shed,
+HIGH ones (token refresh) are admitted up to HIGH_HEADROOM times the limit.
+"""
+import time
+from enum import Enum
+from typing import Dict
+
+from fastapi.responses import JSONResponse
+
+from app.core import eventloop, metrics
+from app.core.config import config
+from app.db import instrumentation
+
+DECREASE_INTERVAL = 0.25  # lets a decrease take effect before judging the next one
+HIGH_HEADROOM = 1.5
+
+admission_limit = metrics.gauge("usagi_admission_limit",
+	"Concurrent requests this worker currently admits")
+rejected = metrics.counter("usagi_admission_rejected_total",
+	"Requests shed by admission control, per priority class", ["priority"])
+
+
+class Priority(str, Enum):
+	NORMAL = "normal"
+	HIGH = "high"
+	CRITICAL = "critical"
+
+
+class Limiter:
+
+	def __init__(self, minimum: int, maximum: int):
+		self.minimum = minimum
+		self.maximum = maximum
+		self.limit = float(maximum)  # no congestion seen yet
+		self.in_flight = 0
+		self.decreased_at = 0.0
+		admission_limit.labels().set(maximum)
+
+	def congested(self) -> bool:
+		return (eventloop.lag.value * 1000 > config.ADMISSION_MAX_LOOP_LAG_MS
+			or instrumentation.pool_wait.value * 1000 > config.ADMISSION_MAX_POOL_WAIT_MS)
+
+	def acquire(self, priority: Priority) -> bool:
+		if priority is not Priority.CRITICAL:
+			limit = self.limit * HIGH_HEADROOM if priority is Priority.HIGH else self.limit
+			if self.in_flight >= limit:
+				return False
+		self.in_flight += 1
+		return True
+
+	def release(self):
+		busy = self.in_flight * 2 >= self.limit  # only a limit in use has earned growing
+		self.in_flight -= 1
+		if self.congested():
+			now = time.monotonic()
+			if now - self.decreased_at < DECREASE_INTERVAL:
+				return
+			self.decreased_at = now
+			self.limit = max(self.minimum,
+				min(self.limit, self.in_flight + 1) * config.ADMISSION_BACKOFF)
+		elif busy and self.limit < self.maximum:
+			self.limit = min(self.maximum, self.limit + 1 / self.limit)
+		else:
+			return
+		admission_limit.labels().set(self.limit)
+
+
+_limiter: Limiter | None = None
+
+
+def start():
+	"""Admission control reads the loop lag of `eventloop`, which must be running too."""
+	global _limiter
+	if config.ADMISSION_ENABLED:
+		_limiter = Limiter(config.ADMISSION_MIN_LIMIT, config.ADMISSION_MAX_LIMIT)
+
+
+def stop():
+	global _limiter
+	_limiter = None
+
+
+class AdmissionMiddleware:
+	"""Sheds requests above the adaptive concurrency limit, passes everything before `start`."""
+
+	def __init__(self, app, priorities: Dict[str, Priority] | None = None):
+		self.app = app
+		self.priorities = priorities or {}
+
+	async def __call__(self, scope, receive, send):
+		limiter = _limiter
+		if scope["type"] != "http" or limiter is None:
+			return await self.app(scope, receive, send)
+
+		priority = self.priorities.get(scope["path"], Priority.NORMAL)
+		if not limiter.acquire(priority):
+			rejected.labels(priority.value).inc()
+			response = JSONResponse({"detail": "the server is overloaded, retry later"},
+				status_code=503,
+				headers={"Retry-After": str(config.ADMISSION_RETRY_AFTER)})
+			return await response(scope, receive, send)
+		try:
+			await self.app(scope, receive, send)
+		finally:
+			limiter.release()
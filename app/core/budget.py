@@ -0,0 +1,103 @@
+"""
+Per-route latency budgets.
+
+	@router.get("s")
+	@budget(2.0)
+	async def list_users(...): ...
+
+A budgeted route's handler, dependencies and serialization included, is cancelled
+once its budget is spent and the route answers 504. Every transaction it begins runs
+`SET LOCAL statement_timeout` with the budget left minus STATEMENT_MARGIN, so Postgres
+usually cancels a slow statement first: the connection then goes back to the pool
+clean and the route answers 503. When the handler is cancelled instead, the session's
+connection may be halfway through a statement, so it is invalidated rather than
+returned to the pool. Both cases count in `usagi_budget_exceeded_total`.
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response
+from fastapi_async_sqlalchemy import db
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.exceptions import RouteTimeoutException, StatementTimeoutException
+from app.core.tracing import TracedRoute
+
+STATEMENT_MARGIN = 0.05  # seconds left to the handler after its last statement is cancelled
+QUERY_CANCELED = "57014"  # sqlstate of a statement cancelled by statement_timeout
+
+exceeded = metrics.counter("usagi_budget_exceeded_total",
+	"Requests that ran out of their route's budget, by whether the handler or a statement "
+	"was cancelled", ["route", "reason"])
+
+_deadline: ContextVar[float | None] = ContextVar("budget_deadline", default=None)
+
+
+def budget(seconds: float):
+	"""Gives an endpoint `seconds` to respond, routed through a `BudgetedRoute`."""
+
+	def decorator(endpoint: Callable) -> Callable:
+		endpoint.__budget__ = seconds
+		return endpoint
+
+	return decorator
+
+
+def _set_statement_timeout(session, transaction, connection):
+	deadline = _deadline.get()
+	if deadline is None or connection.dialect.name != "postgresql":
+		return
+	timeout_ms = max(int((deadline - time.monotonic() - STATEMENT_MARGIN) * 1000), 1)
+	connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+
+def install():
+	"""Applies budgets to the transactions of every session, like SQLAlchemyMiddleware's."""
+	if not event.contains(Session, "after_begin", _set_statement_timeout):
+		event.listen(Session, "after_begin", _set_statement_timeout)
+
+
+def _sqlstate(error: DBAPIError) -> str | None:
+	orig = error.orig
+	return getattr(orig, "sqlstate", None) or getattr(orig.__cause__, "sqlstate", None)
+
+
+async def _discard_connection():
+	try:
+		await db.session.invalidate()
+	except Exception as e:
+		logger.warning("unable to invalidate a cancelled request's connection: {!r}", e)
+
+
+class BudgetedRoute(TracedRoute):
+	"""A TracedRoute enforcing the budget of endpoints marked with `budget`."""
+
+	def get_route_handler(self) -> Callable[[Request], Awaitable[Response]]:
+		handler = super().get_route_handler()
+		seconds = getattr(self.endpoint, "__budget__", None)
+		if seconds is None:
+			return handler
+
+		async def budgeted_handler(request: Request) -> Response:
+			token = _deadline.set(time.monotonic() + seconds)  # copied into wait_for's task
+			try:
+				return await asyncio.wait_for(handler(request), seconds)
+			except asyncio.TimeoutError:
+				exceeded.labels(self.path, "timeout").inc()
+				await _discard_connection()
+				raise RouteTimeoutException(seconds)
+			except DBAPIError as e:
+				if _sqlstate(e) != QUERY_CANCELED:
+					raise
+				exceeded.labels(self.path, "statement_timeout").inc()
+				raise StatementTimeoutException(seconds)
+			finally:
+				_deadline.reset(token)
+
+		return budgeted_handler
@@ -0,0 +1,105 @@
+"""
+Single-flight coalescing of identical GET requests.
+
+While a coalesced route is computing the response for a key (path, query string and,
+with `per_user`, the credentials), identical requests wait for that response instead
+of running their own queries. Nothing is kept once the flight lands, so a response is
+never older than a request that was in flight when it arrived.
+
+	@router.get("/count")
+	@coalesced()
+	async def get_user_count(): ...
+
+Followers skip the route's dependencies, so only opt in routes that are public or
+keyed `per_user`, and that return a complete (non-streaming) response.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from fastapi import Request, Response
+
+from app.core import metrics
+from app.core.budget import BudgetedRoute
+
+coalesced_requests = metrics.counter("usagi_coalesced_requests_total",
+	"Requests to coalesced routes, by whether they computed the response or shared one",
+	["route", "role"])
+
+Snapshot = Tuple[int, List[Tuple[bytes, bytes]], bytes]  # status, raw headers, body
+
+
+def coalesced(per_user: bool = False):
+	"""Marks an endpoint for single-flight; `per_user` keys flights by the credentials too."""
+
+	def decorator(endpoint: Callable) -> Callable:
+		endpoint.__coalesce__ = per_user
+		return endpoint
+
+	return decorator
+
+
+class SingleFlight:
+
+	def __init__(self):
+		self.flights: Dict[Hashable, asyncio.Future] = {}
+
+	async def do(self, key: Hashable, compute: Callable[[], Awaitable], on_share=None):
+		"""Returns `compute()`'s result, shared with every call for `key` while it runs."""
+		if (flight := self.flights.get(key)) is not None:
+			try:
+				result = await asyncio.shield(flight)
+			except asyncio.CancelledError:
+				if flight.cancelled():  # the leader went away, not us: lead a new flight
+					return await self.do(key, compute, on_share)
+				raise
+			if on_share:
+				on_share()
+			return result
+
+		flight = self.flights[key] = asyncio.get_running_loop().create_future()
+		try:
+			result = await compute()
+		except asyncio.CancelledError:
+			flight.cancel()
+			raise
+		except BaseException as e:
+			flight.set_exception(e)
+			flight.exception()  # retrieved, even when nobody was waiting
+			raise
+		else:
+			flight.set_result(result)
+			return result
+		finally:
+			del self.flights[key]
+
+
+_flights = SingleFlight()
+
+
+class CoalescingRoute(BudgetedRoute):
+	"""A BudgetedRoute running endpoints marked `coalesced` through single-flight."""
+
+	def get_route_handler(self) -> Callable[[Request], Awaitable[Response]]:
+		handler = super().get_route_handler()
+		per_user = getattr(self.endpoint, "__coalesce__", None)
+		if per_user is None:
+			return handler
+
+		async def compute(request: Request) -> Snapshot:
+			coalesced_requests.labels(self.path, "leader").inc()
+			response = await handler(request)
+			# copied now, middleware appends to a sent response's header list
+			return response.status_code, list(response.raw_headers), response.body
+
+		async def coalescing_handler(request: Request) -> Response:
+			if request.method != "GET":
+				return await handler(request)
+			key = (self.path, request.url.path, tuple(sorted(request.query_params.multi_items())),
+				request.headers.get("authorization") if per_user else None)
+			status, headers, body = await _flights.do(key, lambda: compute(request),
+				coalesced_requests.labels(self.path, "follower").inc)
+			response = Response(body, status_code=status)
+			response.raw_headers = list(headers)
+			return response
+
+		return coalescing_handler
@@ -0,0 +1,159 @@
+"""
+Negotiated response compression.
+
+`CompressionMiddleware` compresses text-like responses of at least `minimum_size`
+bytes with brotli, when the optional `brotli` package is installed, or gzip, whichever
+the client's Accept-Encoding prefers. A complete body is compressed in one go; a
+streamed one (exports, files, and any response behind a BaseHTTPMiddleware) is held
+until `minimum_size` bytes or its end have arrived, then compressed message by message
+and flushed after each, so neither the whole body nor a client waiting on a slow stream
+is held back. Responses that are already encoded, like precompressed static files, pass
+untouched; a strong ETag of a response compressed here is weakened.
+"""
+import zlib
+from typing import List, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+	import brotli
+except ImportError:  # gzip only
+	brotli = None
+
+ENCODINGS: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip", )
+COMPRESSIBLE_TYPES = {
+	"application/javascript",
+	"application/json",
+	"application/x-ndjson",
+	"application/xml",
+	"image/svg+xml",
+}
+
+
+def compressible(content_type: str) -> bool:
+	media_type = content_type.partition(";")[0].strip().lower()
+	return (media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+		or media_type.endswith(("+json", "+xml")))
+
+
+def negotiate(accept_encoding: str, available: Tuple[str, ...] = ENCODINGS) -> str | None:
+	"""The encoding of `available` the client weights highest, earlier ones winning ties."""
+	weights = {}
+	for part in accept_encoding.lower().split(","):
+		name, _, params = part.partition(";")
+		name = name.strip()
+		q = 1.0
+		for param in params.split(";"):
+			key, _, value = param.strip().partition("=")
+			if key == "q":
+				try:
+					q = float(value)
+				except ValueError:
+					q = 0.0
+		for encoding in (available if name == "*" else (name, )):
+			if encoding in available and (name != "*" or encoding not in weights):
+				weights[encoding] = q
+	best = max(available, key=lambda encoding: weights.get(encoding, 0.0), default=None)
+	return best if weights.get(best, 0.0) > 0 else None
+
+
+class Compressor:
+	"""One stream of `encoding`; `compress` returns what can be sent so far."""
+
+	def __init__(self, encoding: str, gzip_level: int = 6, brotli_quality: int = 4):
+		self.encoding = encoding
+		if encoding == "br":
+			self.brotli = brotli.Compressor(quality=brotli_quality)
+		else:
+			self.zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # 31: gzip framing
+
+	def compress(self, data: bytes, flush: bool = False) -> bytes:
+		if self.encoding == "br":
+			return self.brotli.process(data) + (self.brotli.flush() if flush else b"")
+		return self.zlib.compress(data) + (self.zlib.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+
+	def finish(self, data: bytes = b"") -> bytes:
+		if self.encoding == "br":
+			return self.brotli.process(data) + self.brotli.finish()
+		return self.zlib.compress(data) + self.zlib.flush()
+
+
+def compress(data: bytes, encoding: str, level: int | None = None) -> bytes:
+	"""All of `data` at once, `level` defaults to the strongest, as for precompression."""
+	if encoding == "br":
+		return brotli.compress(data, quality=11 if level is None else level)
+	return Compressor(encoding, gzip_level=9 if level is None else level).finish(data)
+
+
+class CompressionMiddleware:
+	"""Compresses eligible responses with the encoding negotiated from Accept-Encoding."""
+
+	def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6,
+		brotli_quality: int = 4):
+		self.app = app
+		self.minimum_size = minimum_size
+		self.gzip_level = gzip_level
+		self.brotli_quality = brotli_quality
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			return await self.app(scope, receive, send)
+		encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+		if encoding is None:
+			return await self.app(scope, receive, send)
+
+		start = None
+		compressor: Compressor | None = None
+		passthrough = False
+		buffered: List[bytes] = []  # a streamed body's start, until it reaches minimum_size
+		buffered_size = 0
+
+		async def send_wrapper(message):
+			nonlocal start, compressor, passthrough, buffered_size
+			if passthrough:
+				return await send(message)
+			if message["type"] == "http.response.start":
+				headers = Headers(raw=message["headers"])
+				status = message["status"]
+				length = headers.get("content-length", "")
+				if ("content-encoding" in headers or status < 200 or status in (204, 304)
+					or not compressible(headers.get("content-type", ""))
+					or length.isdigit() and int(length) < self.minimum_size):
+					passthrough = True
+					return await send(message)
+				start = message  # held until the body is known to be large enough
+				return
+			if message["type"] != "http.response.body":
+				return await send(message)
+
+			body = message.get("body", b"")
+			more_body = message.get("more_body", False)
+			if compressor is None:
+				if more_body and buffered_size + len(body) < self.minimum_size:
+					buffered.append(body)
+					buffered_size += len(body)
+					return
+				body = b"".join((*buffered, body))
+				buffered.clear()
+				headers = MutableHeaders(scope=start)
+				headers.add_vary_header("Accept-Encoding")
+				if not more_body and len(body) < self.minimum_size:
+					passthrough = True
+					await send(start)
+					return await send({"type": "http.response.body", "body": body})
+				compressor = Compressor(encoding, self.gzip_level, self.brotli_quality)
+				headers["Content-Encoding"] = encoding
+				if (etag := headers.get("etag")) and not etag.startswith("W/"):
+					headers["ETag"] = f"W/{etag}"  # the strong one names the identity bytes
+				if more_body:
+					del headers["Content-Length"]
+				else:
+					body = compressor.finish(body)
+					headers["Content-Length"] = str(len(body))
+					await send(start)
+					return await send({"type": "http.response.body", "body": body})
+				await send(start)
+			body = compressor.compress(body, flush=True) if more_body else compressor.finish(body)
+			await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+		await self.app(scope, receive, send_wrapper)
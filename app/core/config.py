@@ -2,18 +2,17 @@ import os
 from pydantic import BaseSettings, validator, EmailStr, AnyHttpUrl
 from pathlib import Path
 from enum import Enum
+from typing import Dict
 
 # optionally load a different env file -> .env.<CONFIG_MODE>
 config_mode = os.getenv("CONFIG_MODE")
 env_filename = ".env" if config_mode is None else ".env."+config_mode
 
-if config_mode and not os.path.isfile(env_filename):
-	raise FileNotFoundError(f"Config file '{env_filename}' was not found. CONFIG_MODE={config_mode}")
-
 
 class BaseConfig(BaseSettings):
 	# Shell environment variables will have precedence
 	API_VERSION: str = "v1"
+	API_V1_STR: str = "/api/v1"
 	PROJECT_NAME: str = "Usagi API"
 	ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 1  # 1 hour
 	REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 100  # 100 days
@@ -25,6 +24,64 @@ class BaseConfig(BaseSettings):
 
 	DB_POOL_SIZE: int = 5 
 	DB_MAX_OVERFLOW = 10
+	DB_CONNECTION_BUDGET: int | None = None  # postgres connections all workers may hold at once
+	DB_LISTEN: bool = True  # keep a LISTEN connection for writes on other nodes
+	DB_NOTIFY_CHANNEL: str = "usagi_invalidation"
+	DB_LISTEN_KEEPALIVE: float = 30.0  # seconds between checks of the listener connection
+	DB_SLOW_QUERY_MS: float = 200.0  # statements at least this slow are logged
+	DB_N_PLUS_ONE_THRESHOLD: int = 0  # warn on statements repeated this often per request, 0 is off
+	ACCESS_LOG: bool = True  # one line per request with its db query count and time
+
+	SERVER_HOST: str = "0.0.0.0"
+	SERVER_PORT: int = 8000
+	WEB_CONCURRENCY: int | None = None  # workers of `python -m app.server`, defaults to the cpu count
+	SERVER_PRELOAD: bool = True  # build the app once in the master before forking
+	WORKER_MAX_REQUESTS: int = 10_000  # replace a worker after this many requests, 0 never does
+	WORKER_MAX_REQUESTS_JITTER: int = 1000
+	GRACEFUL_TIMEOUT: float = 30.0  # seconds in-flight requests get to finish on shutdown
+
+	REVOCATION_TABLE_PATH: Path | None = None  # shared by the workers of a host, under /dev/shm
+	REVOCATION_TABLE_SLOTS: int = 1 << 16  # revoked or banned users it can hold, 32 bytes each
+
+	JOB_QUEUE_SIZE: int = 10_000  # background jobs per worker before enqueueing waits
+	JOB_BATCH_SIZE: int = 500
+	JOB_MAX_ATTEMPTS: int = 5
+	JOB_RETRY_SECONDS: float = 0.5  # doubles with every attempt
+	JOB_DRAIN_SECONDS: float = 10.0
+
+	RATE_LIMIT_ENABLED: bool = True
+	RATE_LIMIT_STORAGE: str | None = None  # redis://[:password@]host:port/db, in process when unset
+	RATE_LIMIT_TIMEOUT: float = 0.25  # seconds to wait on the store before allowing the request
+	RATE_LIMIT_LOGIN: str = "10/minute"  # per client ip, for login and access-token
+	RATE_LIMIT_REGISTER: str = "5/hour"  # per client ip
+	RATE_LIMIT_REFRESH: str = "60/minute"  # per client ip, refresh cookies carry no bearer user
+	RATE_LIMIT_ACCOUNT: str = "30/minute"  # per user, for token revocation and password
+
+	LOOP_LAG_INTERVAL: float = 0.1  # seconds between event-loop lag samples
+	LOOP_BLOCK_THRESHOLD_MS: float = 250.0  # log the stack of longer stalls, 0 disables the watchdog
+	LOOP_DEBUG: bool = False  # asyncio debug mode, logs every slow callback; development only
+
+	ADMISSION_ENABLED: bool = True  # shed requests with a 503 when the worker is congested
+	ADMISSION_MIN_LIMIT: int = 4  # concurrent requests per worker the limit never goes below
+	ADMISSION_MAX_LIMIT: int = 256
+	ADMISSION_MAX_LOOP_LAG_MS: float = 50.0  # congestion signals, averaged over about a second
+	ADMISSION_MAX_POOL_WAIT_MS: float = 100.0
+	ADMISSION_BACKOFF: float = 0.9  # multiplies the requests in flight on congestion
+	ADMISSION_RETRY_AFTER: int = 1  # seconds, sent with 503 responses
+
+	COMPRESSION_ENABLED: bool = True
+	COMPRESSION_MIN_SIZE: int = 1024  # bytes, smaller responses aren't worth compressing
+	COMPRESSION_GZIP_LEVEL: int = 6
+	COMPRESSION_BROTLI_QUALITY: int = 4  # when the brotli package is installed
+	STATIC_MAX_AGE: int = 3600  # seconds, for static urls without a content hash
+	STATIC_CACHE_MAX_FILE_SIZE: int = 1 << 20  # larger static files are streamed from disk
+
+	OPENAPI_SCHEMA_PATH: Path | None = None  # prebuilt schema, `python -m app.core.openapi` writes it
+
+	EXPORT_FETCH_SIZE: int = 1000  # rows per server side cursor fetch
+	IMPORT_MAX_ROWS: int = 100_000
+	IMPORT_MAX_BYTES: int = 64 << 20  # uploads are rejected before parsing above this
+	HASH_WORKERS: int | None = None  # bulk password hashing processes, defaults to the cpu count
 
 	INIT_ADMIN_EMAIL: EmailStr = "Reisen@admin.net"
 	INIT_ADMIN_ALIAS: str = "Reisen"
@@ -33,6 +90,18 @@ class BaseConfig(BaseSettings):
 	SECRET_KEY: str
 	ENCRYPT_KEY: str
 
+	METRICS_ENABLED: bool = True
+	METRICS_MULTIPROC_DIR: Path | None = None  # set when running several workers
+	METRICS_FLUSH_SECONDS: float = 5.0
+
+	TRACE_SAMPLE_RATE: float = 0.0  # fraction of requests traced, 0 disables tracing
+	TRACE_MIN_DURATION_MS: float = 0.0  # only keep traces at least this slow
+	TRACE_BUFFER_SIZE: int = 200  # recent traces kept per worker for /admin/traces
+	TRACE_EXPORT_PATH: Path | None = None  # append traces as OTLP JSON lines
+
+	PROFILER_MAX_SECONDS: int = 60
+	PROFILER_COOLDOWN_SECONDS: float = 60.0  # per worker, after a profile ends
+
 	BACKEND_CORS_ORIGINS: list[str] | list[AnyHttpUrl] = ["http://localhost", "http://localhost:8080"]
 
 	@validator("BACKEND_CORS_ORIGINS", pre=True)
@@ -48,7 +117,32 @@ class BaseConfig(BaseSettings):
 		case_sensitive=False
 		env_file = env_filename
 
-config = BaseConfig()
+_config: BaseConfig | None = None
+
+
+def get_config() -> BaseConfig:
+	"""The settings, read from the environment and env file on first use."""
+	global _config
+	if _config is None:
+		if config_mode and not os.path.isfile(env_filename):
+			raise FileNotFoundError(
+				f"Config file '{env_filename}' was not found. CONFIG_MODE={config_mode}")
+		_config = BaseConfig()
+	return _config
+
+
+class LazyConfig:
+	"""Stands in for the settings so importing a module that uses them reads nothing."""
+	__slots__ = ()
+
+	def __getattr__(self, name: str):
+		return getattr(_config or get_config(), name)
+
+	def __setattr__(self, name: str, value):
+		setattr(get_config(), name, value)
+
+
+config: BaseConfig = LazyConfig()  # type: ignore
 
 class LoggingLevel(str, Enum):
 	"""
@@ -64,6 +158,16 @@ class LoggingLevel(str, Enum):
 	TRACE: str = "TRACE"
 
 
+class LoggingMode(str, Enum):
+	TEXT = "text"  # colorized lines, formatted on a loguru queue thread
+	JSON = "json"  # compact JSON lines, batched by a background writer
+
+
+class LoggingOverflow(str, Enum):
+	DROP = "drop"
+	BLOCK = "block"
+
+
 class LoggingConfig(BaseSettings):
 	"""Configure your service logging using a LoggingSettings instance.
 
@@ -78,6 +182,12 @@ class LoggingConfig(BaseSettings):
 		retention (str): when to remove logfiles. (default: "1 months")
 		backtrace (bool): whether the formatted exception trace should be extended entirely
 		diagnose (bool): whether variables should be displayed during exception handling - should be enabled only for bebugging.
+		mode (str): "text" or "json". (default: "text")
+		queue_size (int): json mode, records buffered before the overflow policy applies. (default: 10000)
+		overflow (str): json mode, "drop" or "block" callers when the buffer is full. (default: "drop")
+		batch_size (int): json mode, the most records written at once. (default: 512)
+		flush_interval (float): json mode, seconds a partial batch may wait. (default: 0.5)
+		sample_rates (dict): fraction of records kept per level, e.g. {"DEBUG": 0.01}. (default: {})
 
 	"""
 
@@ -93,6 +203,12 @@ class LoggingConfig(BaseSettings):
 	retention: str = "1 months"
 	backtrace: bool = True
 	diagnose: bool = False
+	mode: LoggingMode = LoggingMode.TEXT
+	queue_size: int = 10_000
+	overflow: LoggingOverflow = LoggingOverflow.DROP
+	batch_size: int = 512
+	flush_interval: float = 0.5
+	sample_rates: Dict[LoggingLevel, float] = {}
 
 	class Config:
 		env_prefix = "logging_" 
@@ -0,0 +1,126 @@
+"""
+Event-loop lag monitor and blocked-loop watchdog.
+
+A task sleeping LOOP_LAG_INTERVAL measures how late it wakes up, which is how long any
+ready callback has to wait for the loop. Samples go to `usagi_event_loop_lag_seconds`
+and into `lag`, the average admission control reads. Each wakeup is also a heartbeat
+for a watchdog thread: when the loop misses one by LOOP_BLOCK_THRESHOLD_MS, it grabs
+the loop thread's stack, finds the request being served from the ASGI scope on it and
+logs both, once per stall. Neither does more than wake up a few times a second until
+the loop stalls.
+
+LOOP_DEBUG also turns on asyncio's debug mode, which times every callback and logs the
+slow ones: thorough, but too costly outside development.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+from loguru import logger
+
+from app.core import metrics
+from app.core.config import config
+from app.utils.ewma import Ewma
+
+STACK_LIMIT = 40  # innermost frames logged
+
+lag = Ewma()  # seconds, decays within about a second once the loop is idle
+lag_seconds = metrics.histogram("usagi_event_loop_lag_seconds",
+	"How late the event loop ran a timer that was due",
+	buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0))
+stalls = metrics.counter("usagi_event_loop_blocked_total",
+	"Event-loop stalls longer than LOOP_BLOCK_THRESHOLD_MS, per route being served", ["route"])
+
+
+def serving(frame) -> str:
+	"""The request of the innermost http ASGI scope on the stack, "-" outside requests."""
+	while frame is not None:
+		code = frame.f_code
+		if "scope" in code.co_varnames or "scope" in code.co_freevars:
+			scope = frame.f_locals.get("scope")
+			if isinstance(scope, dict) and scope.get("type") == "http":
+				route = scope.get("route")
+				return f"{scope['method']} {route.path if route is not None else scope['path']}"
+		frame = frame.f_back
+	return "-"
+
+
+class Watchdog(threading.Thread):
+	"""Reports the stack of the loop thread when its heartbeat is late by `threshold` seconds."""
+
+	def __init__(self, loop_thread_id: int, interval: float, threshold: float):
+		super().__init__(name="loop-watchdog", daemon=True)
+		self.loop_thread_id = loop_thread_id
+		self.interval = interval
+		self.threshold = threshold
+		self.heartbeat = time.monotonic()
+		self.stopped = threading.Event()
+
+	def run(self):
+		reported = None  # the heartbeat after which the last reported stall began
+		while not self.stopped.wait(self.threshold / 2):
+			heartbeat = self.heartbeat
+			stalled = time.monotonic() - heartbeat - self.interval
+			if stalled >= self.threshold and heartbeat != reported:
+				if self.report(heartbeat, stalled):
+					reported = heartbeat
+
+	def report(self, heartbeat: float, stalled: float) -> bool:
+		frame = sys._current_frames().get(self.loop_thread_id)
+		if frame is None:
+			return False
+		try:
+			route = serving(frame)
+			stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT))
+		finally:
+			del frame
+		if self.heartbeat != heartbeat:  # the loop moved on while we looked, the stack is innocent
+			return False
+		stalls.labels(route).inc()
+		logger.warning("event loop blocked for {:.0f}ms+ serving {}, at:\n{}", stalled * 1000, route,
+			stack)
+		return True
+
+
+_task: asyncio.Task | None = None
+_watchdog: Watchdog | None = None
+
+
+async def _sample(interval: float, watchdog: Watchdog | None):
+	loop = asyncio.get_running_loop()
+	observe = lag_seconds.labels().observe
+	while True:
+		start = loop.time()
+		await asyncio.sleep(interval)
+		now = loop.time()
+		sample = max(now - start - interval, 0.0)
+		lag.update(sample)
+		observe(sample)
+		if watchdog is not None:
+			watchdog.heartbeat = time.monotonic()
+
+
+def start():
+	"""Starts monitoring the running loop, from a task on it."""
+	global _task, _watchdog
+	loop = asyncio.get_running_loop()
+	interval = config.LOOP_LAG_INTERVAL
+	threshold = config.LOOP_BLOCK_THRESHOLD_MS / 1000
+	if threshold > 0:
+		_watchdog = Watchdog(threading.get_ident(), interval, threshold)
+		_watchdog.start()
+	if config.LOOP_DEBUG:
+		loop.set_debug(True)
+		loop.slow_callback_duration = threshold or 0.1
+	_task = asyncio.create_task(_sample(interval, _watchdog), name="loop-lag")
+
+
+def stop():
+	global _task, _watchdog
+	if _task is not None:
+		_task.cancel()
+	if _watchdog is not None:
+		_watchdog.stopped.set()
+	_task = _watchdog = None
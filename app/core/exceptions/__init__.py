@@ -3,6 +3,9 @@ from .common_exceptions import (
 	IdNotFoundException,
 	NameExistsException,
 	NameNotFoundException,
+	RouteTimeoutException,
+	StatementTimeoutException,
+	TooManyRequestsException,
 )
 from .auth_exceptions import (
 	RevokedTokenException, )
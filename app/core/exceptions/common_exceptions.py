@@ -1,3 +1,4 @@
+import math
 from typing import Any, Dict, Generic, Type, TypeVar
 from fastapi import HTTPException, status
 
@@ -85,3 +86,53 @@ class NameExistsException(HTTPException, Generic[ModelType]):
 			detail=f"the {model.__name__.lower()} name already exists",
 			headers=headers,
 		)
+
+
+class TooManyRequestsException(HTTPException):
+
+	def __init__(
+		self,
+		retry_after: float,
+		detail: Any = None,
+		headers: Dict[str, Any] | None = None,
+	) -> None:
+		super().__init__(
+			status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+			detail=detail or "too many requests",
+			headers={
+			"Retry-After": str(max(math.ceil(retry_after), 1)),
+			**(headers or {})
+			},
+		)
+
+
+class RouteTimeoutException(HTTPException):
+
+	def __init__(
+		self,
+		budget: float,
+		headers: Dict[str, Any] | None = None,
+	) -> None:
+		super().__init__(
+			status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+			detail=f"the request exceeded its {budget * 1000:.0f}ms budget",
+			headers=headers,
+		)
+
+
+class StatementTimeoutException(HTTPException):
+
+	def __init__(
+		self,
+		budget: float,
+		retry_after: float = 1,
+		headers: Dict[str, Any] | None = None,
+	) -> None:
+		super().__init__(
+			status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+			detail=f"the database didn't answer within the request's {budget * 1000:.0f}ms budget",
+			headers={
+			"Retry-After": str(max(math.ceil(retry_after), 1)),
+			**(headers or {})
+			},
+		)
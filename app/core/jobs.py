@@ -0,0 +1,175 @@
+"""
+In-process queue for side effects that can run after the response is sent.
+
+Endpoints `await enqueue(kind, payload)`, which only waits while the queue is full.
+A consumer task takes everything queued at once, groups it by kind and hands each
+group to its handler in a single call, inside its own database session, so a burst of
+logins costs one UPDATE. A failed group is retried with exponential backoff up to
+JOB_MAX_ATTEMPTS, and on shutdown queued and retrying jobs get JOB_DRAIN_SECONDS to
+finish. Before `start` (scripts, benchmarks) jobs run inline.
+"""
+import asyncio
+import time
+from itertools import groupby
+from typing import Any, Awaitable, Callable, Dict, List
+
+from fastapi_async_sqlalchemy import db
+from loguru import logger
+
+from app.core import metrics
+from app.core.config import config
+
+Handler = Callable[[List[Any]], Awaitable[None]]
+
+_handlers: Dict[str, Handler] = {}
+
+jobs_total = metrics.counter("usagi_jobs_total", "Background jobs by kind and outcome",
+	["kind", "outcome"])
+job_latency = metrics.histogram("usagi_job_latency_seconds",
+	"Seconds from enqueueing a background job to its completion", ["kind"])
+queue_depth = metrics.gauge("usagi_job_queue_depth", "Background jobs waiting to run")
+
+
+class Job:
+	__slots__ = ("kind", "payload", "enqueued", "attempts")
+
+	def __init__(self, kind: str, payload: Any):
+		self.kind = kind
+		self.payload = payload
+		self.enqueued = time.perf_counter()
+		self.attempts = 0
+
+
+def handler(kind: str):
+	"""Registers the handler of a job kind, it receives the payloads of a batch."""
+
+	def decorator(fn: Handler) -> Handler:
+		_handlers[kind] = fn
+		return fn
+
+	return decorator
+
+
+class JobQueue:
+
+	def __init__(self, capacity: int, batch_size: int):
+		self.queue: asyncio.Queue[Job] = asyncio.Queue(capacity)
+		self.batch_size = batch_size
+		self.retrying: Dict[asyncio.TimerHandle, List[Job]] = {}
+		self.draining = False
+		self.consumer = asyncio.create_task(self._consume(), name="jobs")
+
+	async def _consume(self):
+		queue = self.queue
+		while True:
+			batch = [await queue.get()]
+			while len(batch) < self.batch_size and not queue.empty():
+				batch.append(queue.get_nowait())
+			queue_depth.labels().set(queue.qsize())
+			batch.sort(key=lambda job: job.kind)  # stable, jobs of a kind keep their order
+			for kind, jobs in groupby(batch, key=lambda job: job.kind):
+				await self.execute(kind, list(jobs))
+			for _ in batch:
+				queue.task_done()
+
+	async def execute(self, kind: str, jobs: List[Job]):
+		error = await _run(kind, jobs)
+		if error is None:
+			return
+		# retried jobs rejoin behind new ones, so a group mixes attempt counts
+		if exhausted := [job for job in jobs if job.attempts >= config.JOB_MAX_ATTEMPTS]:
+			_failed(kind, exhausted, error)
+		retry = [job for job in jobs if job.attempts < config.JOB_MAX_ATTEMPTS]
+		if not retry:
+			return
+		jobs_total.labels(kind, "retried").inc(len(retry))
+		if self.draining:
+			logger.warning("{} {} job(s) failed, retrying now: {!r}", len(retry), kind, error)
+			self._requeue(retry)  # before task_done, or the drain could end without them
+			return
+		retry.sort(key=lambda job: job.attempts)
+		for attempts, group in groupby(retry, key=lambda job: job.attempts):
+			delay = config.JOB_RETRY_SECONDS * 2**(attempts - 1)
+			group = list(group)
+			logger.warning("{} {} job(s) failed, retrying in {}s: {!r}", len(group), kind, delay,
+				error)
+			self._schedule(delay, group)
+
+	def _schedule(self, delay: float, jobs: List[Job]):
+		timer = asyncio.get_running_loop().call_later(delay, lambda: self._retry(timer))
+		self.retrying[timer] = jobs
+
+	def _retry(self, timer: asyncio.TimerHandle):
+		self._requeue(self.retrying.pop(timer))
+
+	def _requeue(self, jobs: List[Job]):
+		for job in jobs:
+			try:
+				self.queue.put_nowait(job)
+			except asyncio.QueueFull:  # a retry doesn't wait behind new work
+				asyncio.create_task(self.queue.put(job))
+
+	async def drain(self, timeout: float):
+		self.draining = True
+		for timer in list(self.retrying):  # retry now rather than after the process is gone
+			timer.cancel()
+			self._retry(timer)
+		try:
+			await asyncio.wait_for(self.queue.join(), timeout)
+		except asyncio.TimeoutError:
+			pass
+		self.consumer.cancel()
+		if lost := self.queue.qsize() + sum(len(jobs) for jobs in self.retrying.values()):
+			logger.error("{} background job(s) didn't finish before shutdown", lost)
+		for timer in self.retrying:
+			timer.cancel()
+
+
+async def _run(kind: str, jobs: List[Job]) -> Exception | None:
+	for job in jobs:
+		job.attempts += 1
+	try:
+		async with db():
+			await _handlers[kind]([job.payload for job in jobs])
+	except Exception as e:
+		return e
+	now = time.perf_counter()
+	jobs_total.labels(kind, "done").inc(len(jobs))
+	latency = job_latency.labels(kind)
+	for job in jobs:
+		latency.observe(now - job.enqueued)
+	return None
+
+
+def _failed(kind: str, jobs: List[Job], error: Exception):
+	jobs_total.labels(kind, "failed").inc(len(jobs))
+	logger.opt(exception=error).error("{} {} job(s) failed after {} attempt(s)", len(jobs), kind,
+		jobs[0].attempts)
+
+
+_queue: JobQueue | None = None
+
+
+def start():
+	global _queue
+	_queue = JobQueue(config.JOB_QUEUE_SIZE, config.JOB_BATCH_SIZE)
+
+
+async def stop():
+	global _queue
+	if _queue is not None:
+		queue, _queue = _queue, None  # later jobs run inline
+		await queue.drain(config.JOB_DRAIN_SECONDS)
+
+
+async def enqueue(kind: str, payload: Any):
+	"""Queues a job, waiting for room when the queue is full."""
+	if kind not in _handlers:
+		raise KeyError(f"no handler for {kind} jobs")
+	job = Job(kind, payload)
+	if _queue is None:
+		if error := await _run(kind, [job]):
+			_failed(kind, [job], error)
+		return
+	await _queue.queue.put(job)
+	queue_depth.labels().set(_queue.queue.qsize())
@@ -1,11 +1,17 @@
+import json
 import logging
+import queue
+import random
 import sys
+import threading
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, List, TextIO
 
 from loguru import logger
 from loguru._logger import Logger
 
-from .config import LoggingConfig
+from .config import LoggingConfig, LoggingMode, LoggingOverflow
 
 # Reference: gucharbon - https://github.com/tiangolo/fastapi/issues/2019
 
@@ -28,6 +34,125 @@ class InterceptHandler(logging.Handler):
         )
 
 
+_LOGURU_LEVELS = {"TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"}
+
+
+class FastInterceptHandler(logging.Handler):
+    """
+    InterceptHandler without the frame walk: the stdlib logger name, function and line
+    are passed along as extra fields instead of locating the caller.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._loggers: Dict[str, Logger] = {}
+
+    def emit(self, record):
+        bound = self._loggers.get(record.name)
+        if bound is None:
+            bound = self._loggers[record.name] = logger.bind(logger=record.name)
+        if record.exc_info:
+            bound = bound.opt(exception=record.exc_info)
+        level = record.levelname if record.levelname in _LOGURU_LEVELS else record.levelno
+        # keyword arguments land in extra, overriding this handler's own location
+        bound.log(level, "{}", record.getMessage(), function=record.funcName, line=record.lineno)
+
+
+class BatchedJSONSink:
+    """
+    Loguru sink handing records to a writer thread through a bounded queue. The writer
+    serializes them to JSON lines and writes up to `batch_size` at once, so callers only
+    pay for an enqueue. A full queue drops records (reported by the writer) or blocks.
+    """
+
+    def __init__(self, stream: TextIO, queue_size: int, batch_size: int, flush_interval: float,
+                 block: bool):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block = block
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()  # counted by caller threads, reset by the writer
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, message):
+        try:
+            self.queue.put(message.record, block=self.block)
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    @staticmethod
+    def serialize(record: Dict) -> str:
+        data = {
+            "time": record["time"].isoformat(timespec="milliseconds"),
+            "level": record["level"].name,
+            "message": record["message"],
+            "logger": record["name"],
+            "function": record["function"],
+            "line": record["line"],
+        }
+        if record["extra"]:
+            data.update(record["extra"])
+        if record["exception"]:
+            exception = record["exception"]
+            data["exception"] = "".join(
+                logging.Formatter().formatException(
+                    (exception.type, exception.value, exception.traceback)))
+        return json.dumps(data, separators=(",", ":"), default=str)
+
+    def _write(self, records: List[Dict]):
+        lines = [self.serialize(record) for record in records]
+        with self.dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.append(json.dumps({
+                "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "level": "WARNING",
+                "message": f"dropped {dropped} log records",
+            }, separators=(",", ":")))
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except (OSError, ValueError):  # closed or broken stream, nothing to report to
+            pass
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                records = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                records = []
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in records:
+                stopping = True
+                records = [record for record in records if record is not None]
+            if records or self.dropped:
+                self._write(records)
+
+
+def level_sampler(sample_rates: Dict[str, float]):
+    """Loguru filter keeping the given fraction of the records of each listed level."""
+    rates = {str(getattr(level, "value", level)).upper(): rate for level, rate in sample_rates.items()}
+
+    def sample(record) -> bool:
+        rate = rates.get(record["level"].name)
+        return rate is None or random.random() < rate
+
+    return sample
+
+
 def setup_logger(
     level: str,
     format: str,
@@ -36,6 +161,12 @@ def setup_logger(
     retention: str | None = None, 
     backtrace: bool | None = None, 
     diagnose: bool | None = None, 
+    mode: LoggingMode = LoggingMode.TEXT,
+    queue_size: int = 10_000,
+    overflow: LoggingOverflow = LoggingOverflow.DROP,
+    batch_size: int = 512,
+    flush_interval: float = 0.5,
+    sample_rates: Dict[str, float] | None = None,
 ) -> Logger:
     """Define the global logger to be used by your entire service.
     Arguments:
@@ -44,6 +175,9 @@ def setup_logger(
         filepath: the path where to store the logfiles.
         rotation: when to rotate the logfile.
         retention: when to remove logfiles.
+        mode: "text", or "json" for batched JSON lines on stdout.
+        queue_size, overflow, batch_size, flush_interval: the json mode writer's buffering.
+        sample_rates: fraction of records kept per level.
     Returns:
         the logger to be used by the service.
     References:
@@ -55,16 +189,30 @@ def setup_logger(
     logger.remove()
     # Cath all existing loggers
     LOGGERS = [logging.getLogger(name) for name in logging.root.manager.loggerDict]
+    json_mode = mode == LoggingMode.JSON
+    record_filter = level_sampler(sample_rates) if sample_rates else None
     # Add stdout logger
-    logger.add(
-        sys.stdout,
-        enqueue=True,
-        colorize=True,
-        backtrace=backtrace,
-        level=level.upper(),
-        format=format,
-        diagnose=diagnose,
-    )
+    if json_mode:
+        logger.add(
+            BatchedJSONSink(sys.stdout, queue_size, batch_size, flush_interval,
+                            block=overflow == LoggingOverflow.BLOCK),
+            level=level.upper(),
+            format="{message}",
+            filter=record_filter,
+            backtrace=False,
+            diagnose=False,
+        )
+    else:
+        logger.add(
+            sys.stdout,
+            enqueue=True,
+            colorize=True,
+            backtrace=backtrace,
+            level=level.upper(),
+            format=format,
+            diagnose=diagnose,
+            filter=record_filter,
+        )
     # Optionally add filepath logger
     if filepath:
         Path(filepath).parent.mkdir(parents=True, exist_ok=True)
@@ -77,12 +225,15 @@ def setup_logger(
             backtrace=True,
             level=level.upper(),
             format=format,
+            serialize=json_mode,
+            filter=record_filter,
         )
+    intercept_handler = FastInterceptHandler if json_mode else InterceptHandler
     # Overwrite config of standard library root logger
-    logging.basicConfig(handlers=[InterceptHandler()], level=0)
+    logging.basicConfig(handlers=[intercept_handler()], level=0, force=True)
     # Overwrite handlers of all existing loggers from standard library logging
     for _logger in LOGGERS:
-        _logger.handlers = [InterceptHandler()]
+        _logger.handlers = [intercept_handler()]
         _logger.propagate = False
 
     return logger
@@ -108,4 +259,10 @@ def setup_logger_from_config(settings: LoggingConfig | None = None) -> Logger:
         settings.retention,
         settings.backtrace,
         settings.diagnose,
+        settings.mode,
+        settings.queue_size,
+        settings.overflow,
+        settings.batch_size,
+        settings.flush_interval,
+        settings.sample_rates,
     )
\ No newline at end of file
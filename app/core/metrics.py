@@ -0,0 +1,369 @@
+"""
+In-process metrics with a Prometheus text exposition.
+
+Metric children are created once per label set and then only incremented, so the hot
+path is a dict lookup and an addition. With several workers, each one periodically
+writes a snapshot to `METRICS_MULTIPROC_DIR` and `/metrics` merges every snapshot.
+The counters and histograms of exited workers are folded into one archive file, so
+neither recycled workers nor reused pids lose or pile up samples.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from loguru import logger
+
+ARCHIVE = "metrics_archive.json"  # cleared with the workers' files on server start
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4"  # starlette appends the charset
+
+
+class CounterChild:
+	__slots__ = ("value", )
+
+	def __init__(self):
+		self.value = 0.0
+
+	def inc(self, amount: float = 1.0):
+		self.value += amount
+
+
+class GaugeChild(CounterChild):
+	__slots__ = ()
+
+	def dec(self, amount: float = 1.0):
+		self.value -= amount
+
+	def set(self, value: float):
+		self.value = value
+
+
+class HistogramChild:
+	__slots__ = ("bounds", "counts", "sum")
+
+	def __init__(self, bounds: Tuple[float, ...]):
+		self.bounds = bounds
+		self.counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+		self.sum = 0.0
+
+	def observe(self, value: float):
+		self.counts[bisect_left(self.bounds, value)] += 1
+		self.sum += value
+
+
+class Metric:
+	type = ""
+	child_class = CounterChild
+
+	def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+		self.name = name
+		self.help = help
+		self.labelnames = tuple(labelnames)
+		self.children: Dict[Tuple[str, ...], object] = {}
+
+	def _new_child(self):
+		return self.child_class()
+
+	def labels(self, *values: str):
+		"""The child for a label set, created on first use and reused afterwards."""
+		child = self.children.get(values)
+		if child is None:
+			if len(values) != len(self.labelnames):
+				raise ValueError(f"{self.name} expects labels {self.labelnames}")
+			child = self.children[values] = self._new_child()
+		return child
+
+	def snapshot(self) -> Dict:
+		return {
+			"type": self.type,
+			"help": self.help,
+			"labelnames": self.labelnames,
+			"samples": [[list(values), child.value] for values, child in self.children.items()],
+		}
+
+
+class Counter(Metric):
+	type = "counter"
+
+
+class Gauge(Metric):
+	type = "gauge"
+	child_class = GaugeChild
+
+
+class Histogram(Metric):
+	type = "histogram"
+
+	def __init__(self, name, help, labelnames=(), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+		super().__init__(name, help, labelnames)
+		self.buckets = tuple(sorted(buckets))
+
+	def _new_child(self):
+		return HistogramChild(self.buckets)
+
+	def snapshot(self) -> Dict:
+		return {
+			"type": self.type,
+			"help": self.help,
+			"labelnames": self.labelnames,
+			"buckets": self.buckets,
+			"samples": [[list(values), [child.counts, child.sum]]
+				for values, child in self.children.items()],
+		}
+
+
+class Registry:
+
+	def __init__(self):
+		self.metrics: Dict[str, Metric] = {}
+
+	def register(self, metric: Metric) -> Metric:
+		if metric.name in self.metrics:
+			raise ValueError(f"metric {metric.name} is already registered")
+		self.metrics[metric.name] = metric
+		return metric
+
+	def snapshot(self) -> Dict:
+		return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+	return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+	return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name: str,
+	help: str,
+	labelnames: Iterable[str] = (),
+	buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+	return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+# -~-~ exposition ~-~-
+def _escape(value: str) -> str:
+	return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+	pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+	if extra:
+		pairs.append(extra)
+	return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format(value: float) -> str:
+	return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(snapshot: Dict) -> str:
+	"""Prometheus text format (0.0.4) of a registry snapshot."""
+	lines: List[str] = []
+	for name, metric in sorted(snapshot.items()):
+		lines.append(f"# HELP {name} {metric['help']}")
+		lines.append(f"# TYPE {name} {metric['type']}")
+		labelnames = metric["labelnames"]
+		for values, value in metric["samples"]:
+			if metric["type"] != "histogram":
+				lines.append(f"{name}{_labels(labelnames, values)} {_format(value)}")
+				continue
+			counts, total = value
+			cumulative = 0
+			for bound, count in zip(list(metric["buckets"]) + ["+Inf"], counts):
+				cumulative += count
+				le = 'le="+Inf"' if bound == "+Inf" else f'le="{_format(bound)}"'
+				lines.append(f"{name}_bucket{_labels(labelnames, values, le)} {cumulative}")
+			lines.append(f"{name}_sum{_labels(labelnames, values)} {_format(total)}")
+			lines.append(f"{name}_count{_labels(labelnames, values)} {cumulative}")
+	return "\n".join(lines) + "\n"
+
+
+# -~-~ multiprocess aggregation ~-~-
+def _pid_alive(pid: int) -> bool:
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+
+def merge(snapshots: Iterable[Dict]) -> Dict:
+	"""Sums snapshots: counter and gauge values per label set, histogram buckets and sums."""
+	merged: Dict[str, Dict] = {}
+	for snapshot in snapshots:
+		for name, metric in snapshot.items():
+			target = merged.setdefault(name, {**metric, "samples": {}})
+			for values, value in metric["samples"]:
+				key = tuple(values)
+				if metric["type"] == "histogram":
+					counts, total = target["samples"].get(key, ([0] * len(value[0]), 0.0))
+					target["samples"][key] = ([a + b for a, b in zip(counts, value[0])],
+						total + value[1])
+				else:
+					target["samples"][key] = target["samples"].get(key, 0.0) + value
+	for metric in merged.values():
+		metric["samples"] = [[list(key), value] for key, value in metric["samples"].items()]
+	return merged
+
+
+def _read(path: Path) -> Dict | None:
+	try:
+		return json.loads(path.read_text())
+	except (OSError, ValueError):
+		return None  # gone, or being replaced
+
+
+class MultiprocessStore:
+	"""Exchanges registry snapshots between the workers of a host through a directory."""
+
+	def __init__(self, directory: Path, registry: Registry = REGISTRY):
+		self.directory = Path(directory)
+		self.registry = registry
+		self.directory.mkdir(parents=True, exist_ok=True)
+		if self.path.exists():  # left by an exited worker with our pid
+			self.archive([self.path])
+
+	@property
+	def path(self) -> Path:
+		return self.directory / f"metrics_{os.getpid()}.json"
+
+	def flush(self):
+		tmp = self.path.with_suffix(".tmp")
+		tmp.write_text(json.dumps(self.registry.snapshot()))
+		os.replace(tmp, self.path)
+
+	def archive(self, paths: List[Path]):
+		"""
+		Adds the counters and histograms of exited workers' files to the archive, then
+		deletes the files; gauges die with their worker.
+		"""
+		with open(self.directory / "metrics_archive.lock", "w") as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)  # another worker may be archiving the same files
+			archive = self.directory / ARCHIVE
+			snapshots = [_read(archive) or {}]
+			for path in paths:
+				if (snapshot := _read(path)) is not None:
+					snapshots.append({
+						name: metric
+						for name, metric in snapshot.items() if metric["type"] != "gauge"
+					})
+			if len(snapshots) > 1:
+				tmp = archive.with_suffix(".tmp")
+				tmp.write_text(json.dumps(merge(snapshots)))
+				os.replace(tmp, archive)
+			for path in paths:
+				path.unlink(missing_ok=True)
+
+	def collect(self) -> Dict:
+		self.flush()
+		snapshots, exited = [], []
+		for path in self.directory.glob("metrics_*.json"):
+			try:
+				pid = int(path.stem.split("_")[1])
+			except ValueError:
+				continue  # the archive, read below
+			if not _pid_alive(pid):
+				exited.append(path)
+			elif (snapshot := _read(path)) is not None:
+				snapshots.append(snapshot)
+		if exited:
+			self.archive(exited)
+		if (archive := _read(self.directory / ARCHIVE)) is not None:
+			snapshots.append(archive)
+		return merge(snapshots)
+
+	async def run(self, interval: float):
+		while True:
+			await asyncio.sleep(interval)
+			try:
+				self.flush()
+			except OSError as e:
+				logger.warning("unable to write metrics snapshot: {}", e)
+
+
+_store: MultiprocessStore | None = None
+
+
+def enable_multiprocess(directory: Path) -> MultiprocessStore:
+	global _store
+	_store = MultiprocessStore(directory)
+	return _store
+
+
+def disable_multiprocess():
+	global _store
+	if _store is not None:
+		_store.flush()
+	_store = None
+
+
+def exposition() -> str:
+	"""The current metrics of this worker, or of every worker in multiprocess mode."""
+	return render(_store.collect() if _store else REGISTRY.snapshot())
+
+
+# -~-~ http ~-~-
+HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+http_requests = counter("usagi_http_requests_total", "HTTP requests by route and status class",
+	("method", "route", "status"))
+http_duration = histogram("usagi_http_request_duration_seconds", "HTTP request latency",
+	("method", "route"))
+http_in_flight = gauge("usagi_http_requests_in_flight", "HTTP requests being processed")
+
+
+class _RouteStats:
+	__slots__ = ("statuses", "duration")
+
+	def __init__(self, method: str, route: str):
+		self.statuses = [http_requests.labels(method, route, status) for status in STATUS_CLASSES]
+		self.duration = http_duration.labels(method, route)
+
+
+class MetricsMiddleware:
+	"""Records request counts, status classes, in-flight requests and latency per route."""
+
+	def __init__(self, app):
+		self.app = app
+		self.in_flight = http_in_flight.labels()
+		self.routes: Dict[Tuple[str, str], _RouteStats] = {}
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			return await self.app(scope, receive, send)
+
+		start = time.perf_counter()
+		status_code = 500
+
+		async def send_wrapper(message):
+			nonlocal status_code
+			if message["type"] == "http.response.start":
+				status_code = message["status"]
+			await send(message)
+
+		self.in_flight.inc()
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			self.in_flight.dec()
+			route = scope.get("route")
+			method = scope["method"] if scope["method"] in HTTP_METHODS else "OTHER"
+			key = (method, route.path if route is not None else "<unmatched>")
+			stats = self.routes.get(key)
+			if stats is None:  # bounded: known methods times declared routes
+				stats = self.routes[key] = _RouteStats(*key)
+			stats.statuses[min(max(status_code // 100, 1), 5) - 1].inc()
+			stats.duration.observe(time.perf_counter() - start)
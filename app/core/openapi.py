@@ -0,0 +1,189 @@
+"""
+The OpenAPI schema, generated once and served from memory.
+
+Generating it walks every route and its generic response models, far too slow for the
+first request after each worker start. `SchemaCache` builds it in a thread in the
+background at startup and serves the JSON bytes, precompressed, with an ETag. The
+schema is keyed by a fingerprint of the route table (paths, methods, endpoints,
+parameters and the fields of the models they use) and only rebuilt when that changes.
+
+With OPENAPI_SCHEMA_PATH set, a built schema is written there with its fingerprint, and
+a worker starting with a matching file just reads it. Build it ahead with
+
+	python -m app.core.openapi [path]
+"""
+import argparse
+import asyncio
+import json
+import os
+from hashlib import sha1
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+import fastapi
+import pydantic
+from fastapi import FastAPI, Request, Response
+from fastapi.dependencies.utils import get_flat_dependant
+from fastapi.routing import APIRoute
+from loguru import logger
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from app.core import compression
+from app.core.config import config
+
+
+class Document(NamedTuple):
+	fingerprint: str
+	body: bytes
+	variants: Dict[str, bytes]  # encoding: compressed body
+	etag: str
+
+
+def _describe_model(model, seen: set, parts: List[str]):
+	if not isinstance(model, type) or not issubclass(model, BaseModel) or model in seen:
+		return
+	seen.add(model)
+	for name, field in model.__fields__.items():
+		parts.append(f"{model.__module__}.{model.__qualname__}.{name}: {field.outer_type_!r} "
+			f"{field.required} {field.default!r} {field.field_info.description!r}")
+		for sub_field in [field, *(field.sub_fields or ())]:
+			_describe_model(sub_field.type_, seen, parts)
+
+
+def fingerprint(app: FastAPI) -> str:
+	"""Changes with anything the schema is generated from, short of a model's docstring."""
+	parts = [fastapi.__version__, pydantic.VERSION, app.title, app.version, app.openapi_version,
+		app.description]
+	models: set = set()
+	for route in app.routes:
+		if not isinstance(route, APIRoute):
+			parts.append(f"{type(route).__name__} {getattr(route, 'path', '')}")
+			continue
+		if not route.include_in_schema:
+			continue
+		endpoint = route.endpoint
+		parts.append(repr((route.path, sorted(route.methods), route.name, route.operation_id,
+			route.status_code, route.tags, route.summary, route.description, route.deprecated,
+			f"{endpoint.__module__}.{endpoint.__qualname__}")))
+		dependant = get_flat_dependant(route.dependant)
+		for param in (*dependant.path_params, *dependant.query_params, *dependant.header_params,
+			*dependant.cookie_params, *dependant.body_params):
+			parts.append(repr((param.name, param.outer_type_, param.required, param.field_info)))
+			_describe_model(param.type_, models, parts)
+		for field in (route.body_field, route.response_field):
+			if field is not None:
+				_describe_model(field.type_, models, parts)
+	return sha1("\n".join(parts).encode()).hexdigest()
+
+
+def render(app: FastAPI) -> bytes:
+	"""The schema as FastAPI's own route would serialize it."""
+	app.openapi_schema = None
+	return json.dumps(app.openapi(), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _document(body: bytes, fingerprint: str) -> Document:
+	variants = {encoding: compression.compress(body, encoding) for encoding in compression.ENCODINGS}
+	return Document(fingerprint, body, variants, f'"{sha1(body).hexdigest()[:16]}"')
+
+
+def _fingerprint_path(path: Path) -> Path:
+	return path.with_name(path.name + ".fingerprint")
+
+
+def read(path: Path, fingerprint: str) -> bytes | None:
+	"""The schema at `path`, None unless it was built from the same route table."""
+	try:
+		if _fingerprint_path(path).read_text().strip() != fingerprint:
+			return None
+		return path.read_bytes()
+	except FileNotFoundError:
+		return None
+
+
+def write(path: Path, body: bytes, fingerprint: str):
+	"""Replaces both files atomically, other workers may be reading them."""
+	for target, data in ((path, body), (_fingerprint_path(path), fingerprint.encode())):
+		temporary = target.with_name(f".{target.name}.{os.getpid()}")
+		temporary.write_bytes(data)
+		os.replace(temporary, target)
+
+
+class SchemaCache:
+	"""Serves the app's schema, building it at most once per route table."""
+
+	def __init__(self, app: FastAPI, path: Path | None = None):
+		self.app = app
+		self.path = path
+		self.document: Document | None = None
+		self.routes: tuple = ()  # the route objects `document` was checked against
+		self.building: asyncio.Task | None = None
+
+	def warm(self):
+		"""Builds the schema in the background, so the first request doesn't wait on it."""
+		asyncio.create_task(self.get()).add_done_callback(_log_failure)
+
+	async def get(self) -> Document:
+		routes = tuple(map(id, self.app.routes))
+		while self.document is None or routes != self.routes:
+			current = fingerprint(self.app)
+			if self.document is not None and self.document.fingerprint == current:
+				self.routes = routes
+				break
+			if self.building is None:
+				self.building = asyncio.create_task(self._build(current))
+			building = self.building  # a build for older routes is followed by another
+			try:
+				await asyncio.shield(building)
+			finally:
+				if self.building is building and building.done():
+					self.building = None
+		return self.document
+
+	async def _build(self, fingerprint: str):
+		body = read(self.path, fingerprint) if self.path else None
+		if body is None:
+			body = await run_in_threadpool(render, self.app)
+			logger.info("openapi schema built, {} bytes", len(body))
+			if self.path:
+				await run_in_threadpool(write, self.path, body, fingerprint)
+		self.document = await run_in_threadpool(_document, body, fingerprint)
+
+	async def respond(self, request: Request) -> Response:
+		document = await self.get()
+		headers = {"ETag": document.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+		body = document.body
+		encoding = compression.negotiate(request.headers.get("accept-encoding", ""),
+			tuple(document.variants))
+		if encoding is not None:
+			body = document.variants[encoding]
+			headers["ETag"] = f"W/{document.etag}"  # as CachedStaticFiles does
+		if document.etag in request.headers.get("if-none-match", ""):  # either form
+			return Response(status_code=304, headers=headers)
+		if encoding is not None:
+			headers["Content-Encoding"] = encoding
+		return Response(body, media_type="application/json", headers=headers)
+
+
+def _log_failure(task: asyncio.Task):
+	if not task.cancelled() and task.exception():
+		logger.opt(exception=task.exception()).error("unable to build the openapi schema")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Build the OpenAPI schema ahead of startup.")
+	parser.add_argument("path", nargs="?", type=Path, help="defaults to OPENAPI_SCHEMA_PATH")
+	args = parser.parse_args()
+	path = args.path or config.OPENAPI_SCHEMA_PATH
+	if path is None:
+		parser.error("no path given and OPENAPI_SCHEMA_PATH is unset")
+
+	from app.main import create_app
+	app = create_app()
+	write(path, render(app), fingerprint(app))
+	logger.info("openapi schema written to {}", path)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,132 @@
+"""
+On-demand sampling profiler for the current worker.
+
+A profile starts a daemon thread that, at a fixed rate, records the stack of every
+other thread and the await chain of every suspended asyncio task, then exits. Samples
+are returned as collapsed stacks (`frame;frame;frame count`) for flamegraph.pl or
+speedscope. No thread, hook or tracer exists between profiles.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Dict, List, Tuple
+
+from app.core.config import config
+from app.core.exceptions import TooManyRequestsException
+
+_available_at = 0.0  # monotonic time the next profile may start
+
+
+class Sampler(threading.Thread):
+
+	def __init__(self, loop: asyncio.AbstractEventLoop, seconds: float, rate: int, tasks: bool):
+		super().__init__(name="profiler", daemon=True)
+		self.loop = loop
+		self.seconds = seconds
+		self.interval = 1 / rate
+		self.tasks = tasks
+		self.stacks: Counter[str] = Counter()
+		self.samples = 0
+		self.stopped = threading.Event()
+		self.done = loop.create_future()
+		self._frame_names: Dict[CodeType, str] = {}
+
+	def _frame_name(self, code: CodeType) -> str:
+		name = self._frame_names.get(code)
+		if name is None:
+			name = self._frame_names[code] = (
+				f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+		return name
+
+	def _thread_stack(self, frame: FrameType | None) -> List[str]:
+		names = []
+		while frame is not None:
+			names.append(self._frame_name(frame.f_code))
+			frame = frame.f_back
+		names.reverse()
+		return names
+
+	def _await_chain(self, coro) -> List[str]:
+		"""Frames from a task's coroutine down to the innermost one it is suspended in."""
+		names = []
+		while coro is not None:
+			frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None) or getattr(
+				coro, "gi_frame", None)
+			if frame is None:
+				break
+			names.append(self._frame_name(frame.f_code))
+			coro = getattr(coro, "cr_await", None) or getattr(coro, "ag_await", None) or getattr(
+				coro, "gi_yieldfrom", None)
+		return names
+
+	def sample(self):
+		me = threading.get_ident()
+		threads = {thread.ident: thread.name for thread in threading.enumerate()}
+		for ident, frame in sys._current_frames().items():
+			if ident != me:
+				stack = [f"thread:{threads.get(ident, ident)}", *self._thread_stack(frame)]
+				self.stacks[";".join(stack)] += 1
+
+		if self.tasks:
+			try:
+				running = asyncio.current_task(self.loop)
+				tasks = asyncio.all_tasks(self.loop)
+			except RuntimeError:  # the task set changed while being copied
+				tasks = ()
+			for task in tasks:
+				if task is not running and (chain := self._await_chain(task.get_coro())):
+					self.stacks[";".join(["awaiting", *chain])] += 1
+		self.samples += 1
+
+	def run(self):
+		# the loop thread otherwise only yields the GIL to the sampler every 5ms, at
+		# blocking calls like select(), hiding short bursts of CPU work
+		switch_interval = sys.getswitchinterval()
+		sys.setswitchinterval(min(switch_interval, self.interval / 10))
+		try:
+			deadline = next_sample = time.monotonic()
+			deadline += self.seconds
+			while time.monotonic() < deadline:
+				self.sample()
+				next_sample += self.interval
+				if self.stopped.wait(max(next_sample - time.monotonic(), 0)):
+					break
+		finally:
+			sys.setswitchinterval(switch_interval)
+			try:
+				self.loop.call_soon_threadsafe(self._finish)
+			except RuntimeError:  # the loop closed
+				pass
+
+	def _finish(self):
+		if not self.done.done():
+			self.done.set_result(None)
+
+	def collapsed(self) -> str:
+		return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+async def profile(seconds: float, rate: int = 100, tasks: bool = True) -> Tuple[str, int]:
+	"""
+	Samples this worker for `seconds` at `rate` Hz and returns the collapsed stacks and
+	sample count. One profile runs at a time, followed by PROFILER_COOLDOWN_SECONDS.
+	"""
+	global _available_at
+	now = time.monotonic()
+	if now < _available_at:
+		raise TooManyRequestsException(retry_after=_available_at - now,
+			detail="a profile is running or ran recently on this worker")
+	_available_at = now + seconds + config.PROFILER_COOLDOWN_SECONDS
+
+	sampler = Sampler(asyncio.get_running_loop(), seconds, rate, tasks)
+	sampler.start()
+	try:
+		await sampler.done
+	finally:
+		sampler.stopped.set()
+		_available_at = time.monotonic() + config.PROFILER_COOLDOWN_SECONDS
+	return sampler.collapsed(), sampler.samples
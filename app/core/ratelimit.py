@@ -0,0 +1,314 @@
+"""
+Rate limiting with the generic cell rate algorithm (GCRA).
+
+A limit of `n/period` admits one request every `period / n` seconds with bursts of up
+to `n`. Per key, the only state is the theoretical arrival time (TAT) of the next
+request, so a check is one read and one write. Keys are kept in process, so each
+worker enforces its own budget, or with RATE_LIMIT_STORAGE=redis://... in any server
+speaking the Redis protocol, where the check is a Lua script shared by every worker.
+
+Limits are route dependencies:
+
+	@router.post("/login", dependencies=[Depends(RateLimit("10/minute", by=Scope.IP))])
+
+Responses carry `RateLimit-Limit`, `RateLimit-Remaining` and `RateLimit-Reset`, a
+rejection is a 429 with `Retry-After`. When the store is unreachable requests are let
+through rather than failing the route.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from enum import Enum
+from hashlib import sha1
+from typing import Deque, Dict, NamedTuple, Tuple
+from urllib.parse import urlparse
+
+from fastapi import HTTPException, Request, Response
+from loguru import logger
+
+from app.core import metrics
+from app.core.config import config
+from app.core.exceptions import TooManyRequestsException
+from app.core.security import validate_token
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+CONNECT_TIMEOUT = 2.0
+CONNECT_BACKOFF = 5.0  # seconds requests are let through untried after a failed connect
+
+rate_limited = metrics.counter("usagi_rate_limited_total",
+	"Requests rejected by a rate limit, per route and scope", ["route", "scope"])
+
+
+class Scope(str, Enum):
+	IP = "ip"
+	USER = "user"  # the access token's subject, the client ip without a valid token
+	ROUTE = "route"  # one budget shared by every client
+
+
+class Decision(NamedTuple):
+	allowed: bool
+	remaining: int
+	reset: float  # seconds until the full burst is available again
+	retry_after: float  # seconds until the next request would be allowed
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+	"""'10/minute' -> (10, 60.0); the period may have a count, as in '100/15minute'."""
+	limit, _, period = rate.partition("/")
+	digits = "".join(c for c in period if c.isdigit())
+	unit = period[len(digits):].strip().rstrip("s")
+	if unit not in PERIODS or int(limit) < 1:
+		raise ValueError(f"invalid rate {rate!r}, expected e.g. '10/minute'")
+	return int(limit), (int(digits) if digits else 1) * PERIODS[unit]
+
+
+class MemoryStore:
+	"""TATs in a dict; expired keys are swept once it doubles in size since the last sweep."""
+
+	def __init__(self):
+		self.tats: Dict[str, float] = {}
+		self.sweep_at = 1024
+
+	async def check(self, key: str, limit: int, period: float) -> Decision:
+		now = time.monotonic()
+		interval = period / limit
+		tat = max(self.tats.get(key, now), now)
+		allow_at = tat + interval - period
+		if now < allow_at:
+			return Decision(False, 0, tat - now, allow_at - now)
+		self.tats[key] = tat + interval
+		if len(self.tats) >= self.sweep_at:
+			self.tats = {key: tat for key, tat in self.tats.items() if tat > now}
+			self.sweep_at = max(len(self.tats) * 2, 1024)
+		remaining = math.floor((now - allow_at) / interval + 1e-9)  # not 1.999.. for 2
+		return Decision(True, remaining, tat + interval - now, 0.0)
+
+
+# keys expire once the burst is fully replenished; times are microseconds from TIME
+GCRA_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+local interval = period / limit
+local tat = math.max(tonumber(redis.call('GET', KEYS[1])) or now, now)
+local allow_at = tat + interval - period
+if now < allow_at then
+	return {0, 0, math.ceil(tat - now), math.ceil(allow_at - now)}
+end
+redis.call('SET', KEYS[1], string.format('%d', tat + interval), 'PX',
+	math.ceil((tat + interval - now) / 1000))
+return {1, math.floor((now - allow_at) / interval + 1e-9), math.ceil(tat + interval - now), 0}
+"""
+
+
+class RedisError(Exception):
+	pass
+
+
+class RedisConnection:
+	"""A minimal pipelining RESP client: replies resolve the oldest waiting command."""
+
+	def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		self.reader = reader
+		self.writer = writer
+		self.waiting: Deque[asyncio.Future] = deque()
+		self.receiver = asyncio.create_task(self._receive())
+
+	@staticmethod
+	def encode(args: Tuple) -> bytes:
+		parts = [b"*%d\r\n" % len(args)]
+		for arg in args:
+			arg = arg if isinstance(arg, bytes) else str(arg).encode()
+			parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+		return b"".join(parts)
+
+	async def execute(self, *args):
+		if self.receiver.done():
+			raise ConnectionError("redis connection closed")
+		future = asyncio.get_running_loop().create_future()
+		self.waiting.append(future)
+		self.writer.write(self.encode(args))
+		return await future
+
+	async def _reply(self):
+		line = await self.reader.readuntil(b"\r\n")
+		kind, value = line[:1], line[1:-2]
+		if kind == b"+":
+			return value.decode()
+		if kind == b"-":
+			return RedisError(value.decode())
+		if kind == b":":
+			return int(value)
+		if kind == b"$":
+			return None if value == b"-1" else (await self.reader.readexactly(int(value) + 2))[:-2]
+		if kind == b"*":
+			return None if value == b"-1" else [await self._reply() for _ in range(int(value))]
+		raise RedisError(f"unexpected reply {line!r}")
+
+	async def _receive(self):
+		try:
+			while True:
+				reply = await self._reply()
+				future = self.waiting.popleft()
+				if not future.done():
+					if isinstance(reply, RedisError):
+						future.set_exception(reply)
+					else:
+						future.set_result(reply)
+		except (OSError, EOFError, asyncio.IncompleteReadError, IndexError) as e:
+			while self.waiting:
+				future = self.waiting.popleft()
+				if not future.done():
+					future.set_exception(ConnectionError(f"redis connection lost: {e!r}"))
+			self.writer.close()
+
+	def close(self):
+		self.receiver.cancel()
+		self.writer.close()
+
+
+class RedisStore:
+	"""Checks bounded by RATE_LIMIT_TIMEOUT, connecting included; connects back off on failure."""
+
+	def __init__(self, url: str):
+		parsed = urlparse(url)
+		self.host = parsed.hostname or "localhost"
+		self.port = parsed.port or 6379
+		self.password = parsed.password
+		self.db = int(parsed.path.lstrip("/") or 0)
+		self.connection: RedisConnection | None = None
+		self.connecting: asyncio.Task | None = None
+		self.retry_at = 0.0
+		self.script_sha = sha1(GCRA_SCRIPT.encode()).hexdigest()
+
+	async def _open(self) -> RedisConnection:
+		reader, writer = await asyncio.open_connection(self.host, self.port)
+		connection = RedisConnection(reader, writer)
+		try:
+			if self.password:
+				await connection.execute("AUTH", self.password)
+			if self.db:
+				await connection.execute("SELECT", self.db)
+		except BaseException:
+			connection.close()
+			raise
+		return connection
+
+	async def _connect(self) -> RedisConnection:
+		try:
+			self.connection = await asyncio.wait_for(self._open(), CONNECT_TIMEOUT)
+			return self.connection
+		except BaseException:
+			self.retry_at = time.monotonic() + CONNECT_BACKOFF
+			raise
+		finally:
+			self.connecting = None
+
+	async def _connection(self) -> RedisConnection:
+		if self.connection is not None and not self.connection.receiver.done():
+			return self.connection
+		if self.connecting is None:
+			if time.monotonic() < self.retry_at:
+				raise ConnectionError("redis unreachable, not retrying yet")
+			self.connecting = asyncio.create_task(self._connect())
+			self.connecting.add_done_callback(_retrieve)
+		# shielded, so requests giving up on the timeout leave the attempt to later ones
+		return await asyncio.shield(self.connecting)
+
+	async def _check(self, key: str, limit: int, period: float) -> Decision:
+		connection = await self._connection()
+		args = (1, key, limit, int(period * 1_000_000))
+		try:
+			reply = await connection.execute("EVALSHA", self.script_sha, *args)
+		except RedisError as e:
+			if not str(e).startswith("NOSCRIPT"):
+				raise
+			reply = await connection.execute("EVAL", GCRA_SCRIPT, *args)
+		allowed, remaining, reset, retry_after = reply
+		return Decision(bool(allowed), remaining, reset / 1e6, retry_after / 1e6)
+
+	async def check(self, key: str, limit: int, period: float) -> Decision:
+		return await asyncio.wait_for(self._check(key, limit, period), config.RATE_LIMIT_TIMEOUT)
+
+	def close(self):
+		if self.connecting is not None:
+			self.connecting.cancel()
+		if self.connection is not None:
+			self.connection.close()
+
+
+def _retrieve(task: asyncio.Task):
+	if not task.cancelled():
+		task.exception()  # logged by the requests that waited on it, if any did
+
+
+_store: MemoryStore | RedisStore | None = None
+
+
+def get_store() -> MemoryStore | RedisStore:
+	global _store
+	if _store is None:
+		url = config.RATE_LIMIT_STORAGE
+		_store = RedisStore(url) if url else MemoryStore()
+	return _store
+
+
+def close_store():
+	global _store
+	if isinstance(_store, RedisStore):
+		_store.close()
+	_store = None
+
+
+def _client_ip(request: Request) -> str:
+	return request.client.host if request.client else "unknown"
+
+
+def _user(request: Request) -> str:
+	scheme, _, token = request.headers.get("authorization", "").partition(" ")
+	if scheme.lower() == "bearer" and token:
+		try:
+			return f"user:{validate_token(token).sub}"
+		except HTTPException:
+			pass
+	return f"ip:{_client_ip(request)}"
+
+
+class RateLimit:
+	"""A route dependency admitting `rate` requests per client of the given scope."""
+
+	def __init__(self, rate: str, by: Scope = Scope.IP, name: str | None = None):
+		self.rate = rate
+		self.limit, self.period = parse_rate(rate)
+		self.by = by
+		self.name = name  # shares a budget between routes using the same name
+
+	async def __call__(self, request: Request, response: Response):
+		if not config.RATE_LIMIT_ENABLED:
+			return
+		route = self.name or f"{request.method} {request.scope['route'].path}"
+		if self.by == Scope.IP:
+			identity = f"ip:{_client_ip(request)}"
+		elif self.by == Scope.USER:
+			identity = _user(request)
+		else:
+			identity = "all"
+		try:
+			decision = await get_store().check(f"rl:{route}:{identity}", self.limit, self.period)
+		except (OSError, ConnectionError, RedisError, asyncio.TimeoutError) as e:
+			logger.warning("rate limit store unavailable, allowing the request: {!r}", e)
+			return
+
+		headers = {
+			"RateLimit-Limit": str(self.limit),
+			"RateLimit-Remaining": str(decision.remaining),
+			"RateLimit-Reset": str(math.ceil(decision.reset)),
+		}
+		if not decision.allowed:
+			rate_limited.labels(route, self.by.value).inc()
+			raise TooManyRequestsException(decision.retry_after,
+				detail=f"rate limit of {self.rate} exceeded",
+				headers=headers)
+		response.headers.update(headers)
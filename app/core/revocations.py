@@ -0,0 +1,234 @@
+"""
+Host-wide table of revoked and banned users, shared by every worker through mmap.
+
+The file holds a fixed-size open-addressed hash of user id -> (revoked_at, role),
+probed linearly from bits of the ULID's random part. Readers take no lock: a seqlock
+counter in the header, odd while a write is in progress, tells them to retry a probe
+that raced a writer. Writers serialize through flock on the same file. A writer killed
+mid-write leaves the counter odd: whoever next holds the lock evens it, and readers
+give up after READ_RETRIES, leaving the check to the database.
+
+Only users with a `revoked_at` or a ban are stored, plus later role changes of users
+already stored, so a token issued before its user's revocation is rejected without
+touching the database. Each worker upserts those rows from the database at startup,
+and again whenever its invalidation listener reconnects, and re-reads single users as
+other nodes write them. A full table stops taking new users and lookups then miss.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import NamedTuple
+
+from fastapi_async_sqlalchemy import db
+from loguru import logger
+from sqlalchemy import or_, select
+
+from app.core.config import config
+from app.models.user_model import User, UserRoleEnum
+from app.utils import ulid
+
+MAGIC = b"USAGIRV1"
+HEADER = struct.Struct("<8sIIQ")  # magic, slots, used, seq
+HEADER_SIZE = 64
+SEQ_OFFSET = 16
+SLOT = struct.Struct("<16sqB7x")  # user id, revoked_at (epoch microseconds), role
+EMPTY = bytes(16)
+MAX_LOAD = 0.9
+READ_RETRIES = 1000
+ROLES = [None, *UserRoleEnum]  # stored as their index, 0 is unknown
+
+
+class Revocation(NamedTuple):
+	revoked_at: int  # epoch microseconds, 0 when never revoked
+	role: UserRoleEnum | None
+
+	def revokes(self, issued_at: datetime) -> bool:
+		return epoch_us(issued_at) < self.revoked_at
+
+
+def epoch_us(dt: datetime) -> int:
+	"""Naive datetimes are UTC, as everywhere in this app."""
+	if dt.tzinfo is None:
+		dt = dt.replace(tzinfo=timezone.utc)
+	return int(dt.timestamp() * 1_000_000)
+
+
+def default_path() -> Path:
+	directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+	return Path(directory) / f"usagi-{config.DB_NAME}-revocations"
+
+
+class RevocationTable:
+
+	def __init__(self, path: Path, slots: int):
+		self.path = Path(path)
+		self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+		with self.locked():
+			if os.fstat(self.fd).st_size < HEADER_SIZE:
+				slots = 1 << max(slots - 1, 1).bit_length()  # a power of two, for masking
+				os.ftruncate(self.fd, HEADER_SIZE + slots * SLOT.size)
+				os.pwrite(self.fd, HEADER.pack(MAGIC, slots, 0, 0), 0)
+			magic, slots, _, _ = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+			if magic != MAGIC:
+				raise ValueError(f"{self.path} is not a revocation table")
+			# an existing table keeps its size, workers may still map it
+			self.slots = slots
+			self.mask = slots - 1
+			self.full = False  # warned about
+			self.mm = mmap.mmap(self.fd, HEADER_SIZE + slots * SLOT.size)
+			self._repair()
+
+	@contextmanager
+	def locked(self):
+		fcntl.flock(self.fd, fcntl.LOCK_EX)
+		try:
+			yield
+		finally:
+			fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+	def _repair(self):
+		"""Evens a counter left odd by a writer that died; no live one can hold the lock."""
+		seq = struct.unpack_from("<Q", self.mm, SEQ_OFFSET)[0]
+		if seq & 1:
+			struct.pack_into("<Q", self.mm, SEQ_OFFSET, seq + 1)
+			logger.warning("revocation table {} was left mid-write, recovered", self.path)
+
+	def _recover(self):
+		try:
+			fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+		except BlockingIOError:
+			return  # a live writer, merely slow
+		try:
+			self._repair()
+		finally:
+			fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+	def _probe(self, key: bytes) -> tuple[int, bytes]:
+		"""The offset of `key`'s slot, or of the empty slot ending its probe sequence."""
+		index = int.from_bytes(key[8:], "little") & self.mask
+		mm = self.mm
+		for _ in range(self.slots):
+			offset = HEADER_SIZE + index * SLOT.size
+			found = mm[offset:offset + 16]
+			if found == key or found == EMPTY:
+				return offset, found
+			index = (index + 1) & self.mask
+		return -1, EMPTY
+
+	def get(self, key: bytes) -> Revocation | None:
+		"""None when `key` isn't stored, or can't be read now, either way the database decides."""
+		mm = self.mm
+		for _ in range(READ_RETRIES):
+			seq = struct.unpack_from("<Q", mm, SEQ_OFFSET)[0]
+			if seq & 1:
+				os.sched_yield()  # a writer is halfway through, in another process
+				continue
+			offset, found = self._probe(key)
+			if found == key:
+				_, revoked_at, role = SLOT.unpack_from(mm, offset)
+			if struct.unpack_from("<Q", mm, SEQ_OFFSET)[0] == seq:
+				return Revocation(revoked_at, ROLES[role]) if found == key else None
+		self._recover()
+		return None
+
+	def put(self, key: bytes, revoked_at: int, role: UserRoleEnum, insert: bool = True):
+		"""Stores `key`, keeping the later revoked_at; only updates existing keys unless `insert`."""
+		mm = self.mm
+		with self.locked():
+			self._repair()
+			offset, found = self._probe(key)
+			if found == EMPTY:
+				used = struct.unpack_from("<I", mm, 12)[0]
+				if not insert or offset < 0:
+					return
+				if used >= self.slots * MAX_LOAD:
+					if not self.full:
+						self.full = True
+						logger.warning("revocation table {} is full ({} users)", self.path, used)
+					return
+				struct.pack_into("<I", mm, 12, used + 1)
+			else:
+				revoked_at = max(revoked_at, SLOT.unpack_from(mm, offset)[1])
+			seq = struct.unpack_from("<Q", mm, SEQ_OFFSET)[0]
+			struct.pack_into("<Q", mm, SEQ_OFFSET, seq + 1)
+			SLOT.pack_into(mm, offset, key, revoked_at, ROLES.index(role))
+			struct.pack_into("<Q", mm, SEQ_OFFSET, seq + 2)
+
+	def close(self):
+		self.mm.close()
+		os.close(self.fd)
+
+
+_table: RevocationTable | None = None
+
+
+def open_table() -> RevocationTable:
+	global _table
+	if _table is None:
+		path = config.REVOCATION_TABLE_PATH or default_path()
+		_table = RevocationTable(path, config.REVOCATION_TABLE_SLOTS)
+	return _table
+
+
+def close_table():
+	global _table
+	if _table is not None:
+		_table.close()
+	_table = None
+
+
+def _key(user_id: str) -> bytes | None:
+	return ulid.to_bytes(user_id) if ulid.is_valid(user_id) else None
+
+
+def lookup(user_id: str) -> Revocation | None:
+	"""The user's revocation, None when not revoked or the table isn't open in this process."""
+	if _table is None or (key := _key(user_id)) is None:
+		return None
+	return _table.get(key)
+
+
+def record(user: User):
+	"""Publishes the user's revoked_at and role to every worker on this host."""
+	if _table is None:
+		return
+	revoked = user.revoked_at is not None or user.role == UserRoleEnum.BANNED
+	_table.put(ulid.to_bytes(str(user.id)),
+		epoch_us(user.revoked_at) if user.revoked_at else 0,
+		user.role,
+		insert=revoked)
+
+
+async def load(db_session):
+	"""Upserts every revoked or banned user, correcting roles an earlier run left behind."""
+	response = await db_session.execute(
+		select(User.id, User.revoked_at, User.role).where(
+		or_(User.revoked_at.is_not(None), User.role == UserRoleEnum.BANNED)))
+	count = 0
+	for user in response:
+		record(user)
+		count += 1
+	logger.info("revocation table {} loaded {} users", _table.path, count)
+
+
+async def refresh(user_id: str, version: int):
+	"""Re-reads one user after a write on any node."""
+	async with db():
+		response = await db.session.execute(
+			select(User.id, User.revoked_at, User.role).where(User.id == user_id))
+		if user := response.first():
+			record(user)
+
+
+async def sync():
+	"""Runs `load` in its own session, a worker whose database is down still starts."""
+	try:
+		async with db():
+			await load(db.session)
+	except Exception as e:
+		logger.warning("unable to load the revocation table: {!r}", e)
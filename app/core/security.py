@@ -1,5 +1,8 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
-from typing import Any, Dict
+from typing import Any, Dict, List
 from jose import jwt
 from passlib.context import CryptContext
 from pydantic import ValidationError
@@ -9,11 +12,15 @@ from fastapi.security.utils import get_authorization_scheme_param
 from fastapi.openapi.models import OAuthFlows as OAuthFlowsModel
 
 from app.core.config import config
+from app.core.tracing import traced
 from app.schemas.auth_schema import TokenPayload, TokenType
 from app.utils.time_util import utc_now
 
 pwd_context = CryptContext(schemes=["pbkdf2_sha512"], deprecated="auto")
 TOKEN_ALGORITHM = "HS256"
+HASH_CHUNK_SIZE = 64
+
+_hash_pool: ProcessPoolExecutor | None = None
 
 class AuthAccessBearer(OAuth2):
 	def __init__(
@@ -79,6 +86,7 @@ class AuthRefreshCookie(OAuth2):
 		return param
 
 
+@traced()
 def create_token(
 	subject: str | Any, token_type: TokenType, expires_delta: timedelta = None, 
 ) -> str:
@@ -100,6 +108,7 @@ def create_token(
 	return encoded_jwt
 
 
+@traced()
 def validate_token(
 	token: str) -> TokenPayload:
 	"""Validates a token and returns the payload."""
@@ -116,10 +125,35 @@ def validate_token(
 	
 	return payload
 
+@traced()
 def verify_hash(plain_password: str, hashed_password: str) -> bool:
 	return pwd_context.verify(plain_password, hashed_password)
 
+@traced()
 def hash_pass(password: str) -> str:
 	return pwd_context.hash(password)
 
-
+def hash_passes(passwords: List[str]) -> List[str]:
+	return [pwd_context.hash(password) for password in passwords]
+
+async def hash_pass_many(passwords: List[str]) -> List[str]:
+	"""Hashes passwords in chunks across a process pool, off the event loop."""
+	global _hash_pool
+	if _hash_pool is None:
+		# spawn: forking a worker that runs an event loop and logging threads is unsafe
+		_hash_pool = ProcessPoolExecutor(max_workers=config.HASH_WORKERS,
+			mp_context=multiprocessing.get_context("spawn"))
+	loop = asyncio.get_running_loop()
+	chunks = [
+		passwords[i:i + HASH_CHUNK_SIZE] for i in range(0, len(passwords), HASH_CHUNK_SIZE)
+	]
+	hashed = await asyncio.gather(
+		*[loop.run_in_executor(_hash_pool, hash_passes, chunk) for chunk in chunks])
+	return [password for chunk in hashed for password in chunk]
+
+
+def shutdown_hash_pool() -> None:
+	global _hash_pool
+	if _hash_pool is not None:
+		_hash_pool.shutdown(cancel_futures=True)
+		_hash_pool = None
@@ -0,0 +1,135 @@
+"""
+Static files served from memory, with precompressed variants and long-lived caching.
+
+`CachedStaticFiles` reads each file once per worker, with the `.br`/`.gz` siblings
+written by the build step, and answers from memory with an ETag and the variant the
+client accepts. URLs carrying the file's content hash, as made by `versioned`, are
+served `immutable` for a year; others are cached for STATIC_MAX_AGE and revalidated.
+Files above STATIC_CACHE_MAX_FILE_SIZE are streamed from disk as before. Changed
+files are picked up by new workers, i.e. on deploy.
+
+	python -m app.core.static [directory] [--min-size 1024]  # precompress, at build time
+"""
+import argparse
+import mimetypes
+import os
+from hashlib import sha1
+from pathlib import Path
+from typing import Dict, NamedTuple
+
+from fastapi.staticfiles import StaticFiles
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import Response
+
+from app.core import compression
+from app.core.config import config
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class StaticFile(NamedTuple):
+	body: bytes
+	variants: Dict[str, bytes]  # encoding: precompressed body
+	media_type: str
+	etag: str
+	version: str
+
+
+def load(path: Path) -> StaticFile:
+	body = path.read_bytes()
+	variants = {}
+	for encoding in compression.ENCODINGS:
+		variant = path.with_name(path.name + SUFFIXES[encoding])
+		if variant.is_file() and variant.stat().st_mtime >= path.stat().st_mtime:
+			variants[encoding] = variant.read_bytes()  # an older one would be stale
+	version = sha1(body).hexdigest()[:16]
+	media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+	return StaticFile(body, variants, media_type, f'"{version}"', version)
+
+
+class CachedStaticFiles(StaticFiles):
+	"""StaticFiles keeping small files, and their precompressed variants, in memory."""
+
+	def __init__(self, *, directory: str | os.PathLike, **kwargs):
+		super().__init__(directory=directory, **kwargs)
+		self.files: Dict[str, StaticFile] = {}  # misses aren't kept, any path could be asked
+
+	def _lookup(self, path: str) -> StaticFile | None:
+		if path in self.files:
+			return self.files[path]
+		full_path, stat = self.lookup_path(path)
+		if (stat is None or not os.path.isfile(full_path)
+			or stat.st_size > config.STATIC_CACHE_MAX_FILE_SIZE):
+			return None
+		file = self.files[path] = load(Path(full_path))
+		return file
+
+	def versioned(self, path: str, mount: str = "/static") -> str:
+		"""The URL of `path` with its content hash, which responses may cache forever."""
+		file = self._lookup(path)
+		return f"{mount}/{path}" + (f"?v={file.version}" if file else "")
+
+	async def get_response(self, path: str, scope) -> Response:
+		if scope["method"] not in ("GET", "HEAD"):
+			return await super().get_response(path, scope)
+		file = self.files.get(path) or await run_in_threadpool(self._lookup, path)
+		if file is None:
+			return await super().get_response(path, scope)
+
+		version = QueryParams(scope["query_string"]).get("v")
+		headers = {
+			"ETag": file.etag,
+			"Cache-Control": IMMUTABLE if version == file.version else
+			f"public, max-age={config.STATIC_MAX_AGE}",
+		}
+		if file.variants:
+			headers["Vary"] = "Accept-Encoding"
+		request_headers = Headers(scope=scope)
+		body = file.body
+		encoding = compression.negotiate(request_headers.get("accept-encoding", ""),
+			tuple(file.variants))
+		if encoding is not None:
+			body = file.variants[encoding]
+			headers["ETag"] = f"W/{file.etag}"  # other bytes than the identity's strong one
+		if file.etag in request_headers.get("if-none-match", ""):  # either form
+			return Response(status_code=304, headers=headers)
+		if encoding is not None:
+			headers["Content-Encoding"] = encoding
+		return Response(body, media_type=file.media_type, headers=headers)
+
+
+def precompress(directory: Path, minimum_size: int) -> int:
+	"""Writes `.gz`, and `.br` with brotli installed, next to each compressible file."""
+	written = 0
+	for path in sorted(directory.rglob("*")):
+		if not path.is_file() or path.suffix in SUFFIXES.values():
+			continue
+		media_type = mimetypes.guess_type(path.name)[0] or ""
+		if not compression.compressible(media_type) or path.stat().st_size < minimum_size:
+			continue
+		body = path.read_bytes()
+		for encoding in compression.ENCODINGS:
+			variant = path.with_name(path.name + SUFFIXES[encoding])
+			compressed = compression.compress(body, encoding)
+			if len(compressed) < len(body) * 0.9:  # not worth a second copy otherwise
+				variant.write_bytes(compressed)
+				written += 1
+			elif variant.exists():
+				variant.unlink()
+	return written
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Precompress static assets.")
+	parser.add_argument("directory", nargs="?", default="static", type=Path)
+	parser.add_argument("--min-size", type=int, default=1024, help="smaller files stay as is")
+	args = parser.parse_args()
+	written = precompress(args.directory, args.min_size)
+	logger.info("wrote {} precompressed file(s) in {}", written, args.directory)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,333 @@
+"""
+Minimal in-process tracing.
+
+`span(name)` times a block as a child of the current span, which is propagated through
+a contextvar so awaits and spawned tasks keep their parent. Requests are sampled at the
+root with probability TRACE_SAMPLE_RATE. Outside a sampled request, `span` and the
+`traced` wrappers cost one contextvar lookup and return a shared no-op.
+
+Finished traces are kept in a ring buffer served by /admin/traces and, when
+TRACE_EXPORT_PATH is set, appended to it as OTLP JSON lines by a writer thread.
+"""
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List
+
+from fastapi.routing import APIRoute
+
+from app.core.config import config
+
+
+class Trace:
+	__slots__ = ("trace_id", "root", "spans", "endpoint_end")
+
+	def __init__(self, root_name: str, attributes: Dict):
+		self.trace_id = os.urandom(16).hex()
+		self.spans: List[Span] = []
+		self.endpoint_end = 0  # ns, when the endpoint function returned
+		self.root = Span(self, root_name, attributes=attributes)
+
+	def to_dict(self) -> Dict:
+		root = self.root
+		return {
+			"trace_id": self.trace_id,
+			"name": root.name,
+			"start": root.start / 1e9,
+			"duration_ms": root.duration_ms,
+			"attributes": root.attributes,
+			"spans": [{
+				"span_id": f"{span.span_id:016x}",
+				"parent_id": f"{span.parent_id:016x}" if span.parent_id else None,
+				"name": span.name,
+				"offset_ms": (span.start - root.start) / 1e6,
+				"duration_ms": span.duration_ms,
+				"attributes": span.attributes,
+			} for span in sorted(self.spans, key=lambda span: span.start)],
+		}
+
+
+class Span:
+	__slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attributes", "_token")
+
+	def __init__(self, trace: Trace, name: str, parent_id: int = 0, attributes: Dict | None = None):
+		self.trace = trace
+		self.span_id = random.getrandbits(64) or 1
+		self.parent_id = parent_id
+		self.name = name
+		self.start = self.end = 0
+		self.attributes = attributes or {}
+
+	@property
+	def duration_ms(self) -> float:
+		return (self.end - self.start) / 1e6
+
+	def set_attribute(self, key: str, value: Any):
+		self.attributes[key] = value
+
+	def __enter__(self) -> "Span":
+		self.start = time.time_ns()
+		self._token = _current.set(self)
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.end = time.time_ns()
+		_current.reset(self._token)
+		if exc_type is not None:
+			self.attributes["error"] = exc_type.__name__
+		self.trace.spans.append(self)
+		if not self.parent_id:
+			_finish(self.trace)
+
+
+class NoopSpan:
+	__slots__ = ()
+
+	def set_attribute(self, key: str, value: Any):
+		pass
+
+	def __enter__(self) -> "NoopSpan":
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		pass
+
+
+NOOP = NoopSpan()
+_current: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+def current_span() -> Span | None:
+	return _current.get()
+
+
+def start_trace(name: str, **attributes) -> Span | NoopSpan:
+	"""A root span, or the no-op when this trace isn't sampled."""
+	if config.TRACE_SAMPLE_RATE <= 0 or random.random() >= config.TRACE_SAMPLE_RATE:
+		return NOOP
+	return Trace(name, attributes).root
+
+
+def span(name: str, **attributes) -> Span | NoopSpan:
+	"""A child of the current span, or the no-op outside a sampled trace."""
+	parent = _current.get()
+	if parent is None:
+		return NOOP
+	return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def traced(name: str | None = None):
+	"""Wraps a function (sync or async) in a span named after it."""
+
+	def decorator(fn: Callable) -> Callable:
+		label = name or fn.__qualname__
+
+		if asyncio.iscoroutinefunction(fn):
+
+			@wraps(fn)
+			async def async_wrapper(*args, **kwargs):
+				parent = _current.get()
+				if parent is None:
+					return await fn(*args, **kwargs)
+				with Span(parent.trace, label, parent.span_id):
+					return await fn(*args, **kwargs)
+
+			return async_wrapper
+
+		@wraps(fn)
+		def wrapper(*args, **kwargs):
+			parent = _current.get()
+			if parent is None:
+				return fn(*args, **kwargs)
+			with Span(parent.trace, label, parent.span_id):
+				return fn(*args, **kwargs)
+
+		return wrapper
+
+	return decorator
+
+
+class TracedMethods:
+	"""Mixin tracing every public coroutine method of each class that inherits it."""
+
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		for attr, value in list(vars(cls).items()):
+			if not attr.startswith("_") and asyncio.iscoroutinefunction(value):
+				setattr(cls, attr, traced(f"{cls.__name__}.{attr}")(value))
+
+
+class TracedRoute(APIRoute):
+	"""Traces the endpoint function and marks where response serialization begins."""
+
+	def __init__(self, path: str, endpoint: Callable, **kwargs):
+		label = f"endpoint {endpoint.__name__}"
+		# include_router rebuilds routes from their already wrapped endpoints
+		if asyncio.iscoroutinefunction(endpoint) and not hasattr(endpoint, "__traced__"):
+			original = endpoint
+
+			@wraps(original)
+			async def endpoint(*args, **kwargs):
+				parent = _current.get()
+				if parent is None:
+					return await original(*args, **kwargs)
+				with Span(parent.trace, label, parent.span_id) as endpoint_span:
+					result = await original(*args, **kwargs)
+				parent.trace.endpoint_end = endpoint_span.end
+				return result
+
+			endpoint.__traced__ = True
+
+		super().__init__(path, endpoint, **kwargs)
+
+
+class TracingMiddleware:
+	"""
+	Roots a trace per sampled request, adding `serialize` (endpoint return to response
+	start) and `write response` (response start to the last body message) spans.
+	"""
+
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			return await self.app(scope, receive, send)
+		root = start_trace(f"{scope['method']} {scope['path']}")
+		if root is NOOP:
+			return await self.app(scope, receive, send)
+
+		response_start = 0
+
+		async def send_wrapper(message):
+			nonlocal response_start
+			if message["type"] == "http.response.start":
+				response_start = time.time_ns()
+				root.attributes["http.status_code"] = message["status"]
+				if root.trace.endpoint_end:
+					add_span(root, "serialize", root.trace.endpoint_end, response_start)
+			await send(message)
+			if message["type"] == "http.response.body" and not message.get("more_body"):
+				add_span(root, "write response", response_start, time.time_ns())
+
+		with root:
+			try:
+				await self.app(scope, receive, send_wrapper)
+			finally:
+				if route := scope.get("route"):
+					root.name = f"{scope['method']} {route.path}"
+
+
+def add_span(parent: Span, name: str, start: int, end: int):
+	"""Records an already finished span."""
+	child = Span(parent.trace, name, parent.span_id)
+	child.start, child.end = start, end
+	parent.trace.spans.append(child)
+
+
+# -~-~ storage and export ~-~-
+_traces: Deque[Trace] | None = None
+_exporter: "OTLPFileExporter | None" = None
+
+
+def _finish(trace: Trace):
+	global _traces, _exporter
+	if trace.root.duration_ms < config.TRACE_MIN_DURATION_MS:
+		return
+	if _traces is None:
+		_traces = deque(maxlen=config.TRACE_BUFFER_SIZE)
+	_traces.append(trace)
+	if config.TRACE_EXPORT_PATH:
+		if _exporter is None:
+			_exporter = OTLPFileExporter(config.TRACE_EXPORT_PATH)
+		_exporter.export(trace)
+
+
+def recent(limit: int = 20, min_duration_ms: float = 0.0, name: str | None = None) -> List[Dict]:
+	"""The latest buffered traces, newest first."""
+	found = []
+	for trace in reversed(_traces or ()):
+		root = trace.root
+		if root.duration_ms >= min_duration_ms and (name is None or name in root.name):
+			found.append(trace.to_dict())
+			if len(found) >= limit:
+				break
+	return found
+
+
+def otlp(trace: Trace) -> Dict:
+	"""A trace as an OTLP/JSON ExportTraceServiceRequest."""
+
+	def attributes(values: Dict) -> List[Dict]:
+		typed = []
+		for key, value in values.items():
+			if isinstance(value, bool):
+				typed.append({"key": key, "value": {"boolValue": value}})
+			elif isinstance(value, int):
+				typed.append({"key": key, "value": {"intValue": str(value)}})
+			elif isinstance(value, float):
+				typed.append({"key": key, "value": {"doubleValue": value}})
+			else:
+				typed.append({"key": key, "value": {"stringValue": str(value)}})
+		return typed
+
+	return {
+		"resourceSpans": [{
+			"resource": {
+				"attributes": attributes({"service.name": config.PROJECT_NAME})
+			},
+			"scopeSpans": [{
+				"scope": {
+					"name": __name__
+				},
+				"spans": [{
+					"traceId": trace.trace_id,
+					"spanId": f"{span.span_id:016x}",
+					**({
+						"parentSpanId": f"{span.parent_id:016x}"
+					} if span.parent_id else {}),
+					"name": span.name,
+					"kind": 1 if span.parent_id else 2,  # internal, server
+					"startTimeUnixNano": str(span.start),
+					"endTimeUnixNano": str(span.end),
+					"attributes": attributes(span.attributes),
+					"status": {
+						"code": 2 if "error" in span.attributes else 0
+					},
+				} for span in trace.spans],
+			}],
+		}],
+	}
+
+
+class OTLPFileExporter:
+	"""Appends traces to a file as OTLP JSON lines from a writer thread, dropping when behind."""
+
+	def __init__(self, path: Path, queue_size: int = 1000):
+		self.path = Path(path)
+		self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+		threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+	def export(self, trace: Trace):
+		try:
+			self.queue.put_nowait(trace)
+		except queue.Full:
+			pass
+
+	def _run(self):
+		self.path.parent.mkdir(parents=True, exist_ok=True)
+		while True:
+			batch = [self.queue.get()]
+			while not self.queue.empty() and len(batch) < 100:
+				batch.append(self.queue.get_nowait())
+			with self.path.open("a") as file:
+				file.writelines(json.dumps(otlp(trace), separators=(",", ":")) + "\n"
+					for trace in batch)
@@ -1,16 +1,25 @@
-from typing import Any, Dict, Generic, List, Type, TypeVar
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Generic, List, Tuple, Type, TypeVar
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.sql.expression import Select
 from sqlalchemy import exc, select, func
 from pydantic import BaseModel
 from fastapi import HTTPException
 from fastapi_pagination.ext.async_sqlalchemy import paginate
+from fastapi_pagination.ext.sqlalchemy import count_query, paginate_query
+from fastapi_pagination.api import create_page
+from fastapi_pagination.utils import verify_params
 from fastapi_async_sqlalchemy import db
 from fastapi_pagination import Params, Page
 from fastapi.encoders import jsonable_encoder
 
+from app.core.tracing import TracedMethods
+from app.db import invalidation
 from app.schemas.base_schema import ULID, OrderEnum
-from app.models.base_model import Base
+from app.models.base_model import Base, row_model, ulid_timestamp_ms
+from app.utils import ulid
+
+MS_PER_DAY = 86_400_000
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -19,20 +28,23 @@ SchemaType = TypeVar("SchemaType", bound=BaseModel)
 T = TypeVar("T", bound=Base)
 
 
-class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+class CRUDBase(TracedMethods, Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
-	def __init__(self, model: Type[ModelType]):
+	def __init__(self, model: Type[ModelType], row_type: Type[tuple] | None = None):
 		"""
 		Default generic CRUD methods.
 		**Parameters**
 		* `model`: A SQLModel model class
-		* `schema`: A Pydantic model (schema) class
+		* `row_type`: A tuple-backed read model for the `*_row(s)` methods (see `row_model`)
 		"""
 		self.model = model
+		self.row_type = row_type or row_model(model)
 
 	async def get(self, *, id: ULID,
 		db_session: AsyncSession | None = None) -> ModelType | None:
 		db_session = db_session or db.session
+		if not ulid.is_valid(id):  # no row has it, and it can't be bound as a uuid
+			return None
 		query = select(self.model).where(self.model.id == id)
 		response = await db_session.execute(query)
 		return response.scalar_one_or_none()
@@ -44,6 +56,9 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 		db_session: AsyncSession | None = None,
 	) -> List[ModelType] | None:
 		db_session = db_session or db.session
+		list_ids = [id for id in list_ids if ulid.is_valid(id)]
+		if not list_ids:
+			return []
 		response = await db_session.execute(
 			select(self.model).where(self.model.id.in_(list_ids)))
 		return response.scalars().all()
@@ -54,6 +69,108 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 			select(func.count()).select_from(select(self.model).subquery()))
 		return response.scalar_one()
 
+	def row_query(self) -> Select:
+		"""A Core select of the model's table. Its rows bypass the ORM identity map."""
+		return select(self.model.__table__)
+
+	async def get_row(self, *, id: ULID, db_session: AsyncSession | None = None) -> tuple | None:
+		db_session = db_session or db.session
+		if not ulid.is_valid(id):
+			return None
+		response = await db_session.execute(self.row_query().where(self.model.id == id))
+		row = response.first()
+		return self.row_type._make(row) if row else None
+
+	async def get_rows(
+		self,
+		*,
+		skip: int = 0,
+		limit: int = 100,
+		query: Select | None = None,
+		db_session: AsyncSession | None = None,
+	) -> List[tuple]:
+		db_session = db_session or db.session
+		if query is None:
+			query = self.row_query().offset(skip).limit(limit).order_by(self.model.id)
+		response = await db_session.execute(query)
+		return list(map(self.row_type._make, response))
+
+	async def get_rows_paginated(
+		self,
+		*,
+		params: Params | None = Params(),
+		query: Select | None = None,
+		order_by: str | None = None,
+		order: OrderEnum | None = OrderEnum.ASC,
+		db_session: AsyncSession | None = None,
+	) -> Page[tuple]:
+		"""Paginated read-only rows, for endpoints that only serialize their results."""
+		db_session = db_session or db.session
+		if query is None:
+			query = self.row_query()
+		if order_by is not None:
+			columns = self.model.__table__.columns
+			column = columns[order_by] if order_by in columns else self.model.id
+			query = query.order_by(column.asc() if order == OrderEnum.ASC else column.desc())
+		params, _ = verify_params(params, "limit-offset")
+		total = (await db_session.execute(count_query(query))).scalar_one()
+		response = await db_session.execute(paginate_query(query, params))
+		return create_page(list(map(self.row_type._make, response)), total, params)
+
+	async def stream_rows(
+		self,
+		*,
+		query: Select | None = None,
+		fetch_size: int = 1000,
+	) -> AsyncIterator[List[tuple]]:
+		"""
+		Yields read-only rows in partitions of `fetch_size` over a server side cursor, so
+		memory stays flat regardless of the table size. Runs in its own session: it is
+		meant to outlive the request's session as the body of a streaming response.
+		"""
+		if query is None:
+			query = self.row_query().order_by(self.model.id)
+		async with db():
+			result = await db.session.stream(query.execution_options(yield_per=fetch_size))
+			async for partition in result.partitions():
+				yield list(map(self.row_type._make, partition))
+
+	def filter_created(
+		self,
+		query: Select[T],
+		*,
+		after: datetime | None = None,
+		before: datetime | None = None,
+	) -> Select[T]:
+		"""
+		Restricts a query to rows created in [after, before) using the time prefix of the
+		ULID primary key, which postgres answers with a primary key index range scan.
+		"""
+		if after:
+			query = query.where(self.model.id >= ulid.min_for(after))
+		if before:
+			query = query.where(self.model.id < ulid.min_for(before))
+		return query
+
+	async def get_count_by_day(
+		self,
+		*,
+		after: datetime | None = None,
+		before: datetime | None = None,
+		db_session: AsyncSession | None = None,
+	) -> List[Tuple[date, int]]:
+		"""Number of rows created per (UTC) day, aggregated in SQL from the ULID timestamps."""
+		db_session = db_session or db.session
+		days = self.filter_created(
+			select((ulid_timestamp_ms(self.model.id) // MS_PER_DAY).label("day")),
+			after=after,
+			before=before,
+		).subquery()
+		response = await db_session.execute(
+			select(days.c.day, func.count().label("count")).group_by(days.c.day).order_by(days.c.day))
+		epoch = ulid.EPOCH.date()
+		return [(epoch + timedelta(days=int(row.day)), row.count) for row in response]
+
 	async def get_multi(
 		self,
 		*,
@@ -171,6 +288,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 				setattr(obj, field, update_data[field])
 
 		db_session.add(obj)
+		await invalidation.publish(db_session, self.model.__tablename__, obj.id)
 		await db_session.commit()
 		await db_session.refresh(obj)
 		return obj
@@ -180,5 +298,6 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 		response = await db_session.execute(select(self.model).where(self.model.id == id))
 		obj = response.scalar_one()
 		await db_session.delete(obj)
+		await invalidation.publish(db_session, self.model.__tablename__, obj.id)
 		await db_session.commit()
 		return obj
\ No newline at end of file
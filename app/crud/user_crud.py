@@ -1,18 +1,72 @@
-from sqlalchemy import func, select
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import func, select, text, update
+from sqlalchemy.sql.expression import Select
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from pydantic import EmailStr
 from fastapi_async_sqlalchemy import db
 
+from app.core import revocations
 from app.core.exceptions import UserIsBannedException
 from app.crud.base_crud import CRUDBase
+from app.db import invalidation
+from app.schemas.admin_schema import AdminImportUser
 from app.schemas.user_schema import UserCreateIn, UserUpdateIn
-from app.models.user_model import User, UserRoleEnum
+from app.models.user_model import User, UserRow, UserRoleEnum
 from app.core.security import verify_hash, hash_pass
+from app.utils import ulid
 from app.utils.time_util import utc_now
 
+IMPORT_TABLE = "app_users_import"
+IMPORT_COLUMNS = ["line", "id", "email", "alias", "password", "role", "confirmed"]
+IMPORT_STAGING = f"""
+CREATE TEMP TABLE {IMPORT_TABLE} (
+	line integer NOT NULL,
+	id uuid NOT NULL,
+	email varchar(100) NOT NULL,
+	alias varchar(20) NOT NULL,
+	password varchar(200) NOT NULL,
+	role text NOT NULL,
+	confirmed boolean NOT NULL
+) ON COMMIT DROP
+"""
+# Inserts every staged row that doesn't collide with an existing user and reports the others.
+IMPORT_MERGE = f"""
+WITH inserted AS (
+	INSERT INTO {User.__tablename__} (id, email, alias, password, role, confirmed)
+	SELECT s.id, s.email, s.alias, s.password, CAST(s.role AS {User.role.type.name}), s.confirmed
+	FROM {IMPORT_TABLE} s
+	WHERE NOT EXISTS (SELECT 1 FROM {User.__tablename__} u WHERE lower(u.email) = lower(s.email))
+	ON CONFLICT DO NOTHING
+	RETURNING id
+)
+SELECT s.line,
+	CASE WHEN EXISTS (SELECT 1 FROM {User.__tablename__} u WHERE lower(u.email) = lower(s.email))
+	THEN 'a user with this email address already exists'
+	ELSE 'a user with this alias already exists' END AS error
+FROM {IMPORT_TABLE} s
+WHERE s.id NOT IN (SELECT id FROM inserted)
+ORDER BY s.line
+"""
+
 
 class CRUDUser(CRUDBase[User, UserCreateIn, UserUpdateIn]):  #
 
+	def filter_users(
+		self,
+		query: Select,
+		*,
+		search_string: str | None = None,
+		role: UserRoleEnum | None = None,
+	) -> Select:
+		"""Applies the filters shared by the user listing endpoints."""
+		if search_string:
+			query = query.filter(func.similarity(User.alias, search_string) > 0.4)  # using tgrm
+		if role:
+			query = query.filter(User.role == role)
+		return query
+
 	async def get_by_email(self, *, email: str,
 		db_session: None | AsyncSession = None) -> User | None:
 		db_session = db_session or db.session
@@ -39,6 +93,38 @@ class CRUDUser(CRUDBase[User, UserCreateIn, UserUpdateIn]):  #
 		await db_session.refresh(user_obj)
 		return user_obj
 
+	async def import_users(
+		self,
+		*,
+		users: List[Tuple[int, AdminImportUser, str]],
+		db_session: None | AsyncSession = None,
+	) -> List[Tuple[int, str]]:
+		"""
+		Bulk creates (line, user, password hash) entries: COPY into a staging table, then a
+		single merge into app_users. Returns the (line, reason) of every conflicting row.
+		"""
+		db_session = db_session or db.session
+		await db_session.execute(text(IMPORT_STAGING))  # also opens the transaction
+		connection = await db_session.connection()
+		raw_connection = await connection.get_raw_connection()
+		await raw_connection.driver_connection.copy_records_to_table(
+			IMPORT_TABLE,
+			columns=IMPORT_COLUMNS,
+			records=[(
+			line,
+			uuid.UUID(bytes=ulid.to_bytes(ulid.new())),
+			data.email,
+			data.alias,
+			password_hash,
+			data.role.value,
+			data.confirmed,
+			) for line, data, password_hash in users],
+		)
+		response = await db_session.execute(text(IMPORT_MERGE))
+		conflicts = [(row.line, row.error) for row in response]
+		await db_session.commit()
+		return conflicts
+
 	async def verify(self, *, email: EmailStr, password: str) -> User | None:
 		""" Verifies a users login credentials """
 		user = await self.get_by_email(email=email)
@@ -51,19 +137,34 @@ class CRUDUser(CRUDBase[User, UserCreateIn, UserUpdateIn]):  #
 		return user
 
 	async def update_password(self, *, user: User, new_pass: str):
+		"""Sets a new password and revokes every token issued before it, in one commit."""
 		user.password = hash_pass(new_pass)
+		user.revoked_at = utc_now()
 		db.session.add(user)
+		await invalidation.publish(db.session, User.__tablename__, user.id)
 		await db.session.commit()
+		revocations.record(user)
+
+	async def update(self, *, obj: User, new: UserUpdateIn | Dict[str, Any],
+		db_session: AsyncSession | None = None) -> User:
+		user = await super().update(obj=obj, new=new, db_session=db_session)
+		revocations.record(user)  # bans and role changes
+		return user
 
 	async def revoke_access(self, *, user: User):
 		user.revoked_at = utc_now()
 		db.session.add(user)
+		await invalidation.publish(db.session, User.__tablename__, user.id)
 		await db.session.commit()
+		revocations.record(user)
 
-	async def stamp_login(self, *, user: User):
-		user.last_login = utc_now()
-		db.session.add(user)
+	async def stamp_logins(self, *, logins: List[Tuple[str, datetime]]):
+		"""Sets last_login for many (user id, time) pairs with one executemany UPDATE."""
+		await db.session.execute(update(User), [{
+			"id": user_id,
+			"last_login": at
+		} for user_id, at in logins])
 		await db.session.commit()
 
 
-user = CRUDUser(User)
+user = CRUDUser(User, row_type=UserRow)
@@ -0,0 +1,151 @@
+"""
+Attributes every SQL statement to the request that issued it.
+
+Engine-wide `before/after_cursor_execute` hooks time each statement and add it to the
+`QueryStats` of the current request, held in a contextvar. `QueryStatsMiddleware`
+exposes the totals as a `Server-Timing` header and in the access log, logs slow
+statements and, when enabled, flags statements repeated within one request (N+1).
+`TimedQueuePool` measures how long checkouts wait for a pooled connection.
+"""
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.datastructures import MutableHeaders
+
+from app.core import metrics
+from app.core.config import config
+from app.utils.ewma import Ewma
+
+_whitespace = re.compile(r"\s+")
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_value_lists = re.compile(r"\((?:\s*\$?\?\s*,)+\s*\$?\?\s*\)")
+
+slow_queries = metrics.counter("usagi_db_slow_queries_total",
+	"SQL statements slower than DB_SLOW_QUERY_MS")
+pool_wait_seconds = metrics.histogram("usagi_db_pool_wait_seconds",
+	"Seconds a checkout waited for a pooled connection, opening overflow ones included")
+pool_wait = Ewma()  # recent checkout waits of this worker, read by admission control
+
+
+@lru_cache(maxsize=1024)
+def normalize(statement: str) -> str:
+	"""Collapses whitespace, literals and expanded IN lists so similar statements group."""
+	statement = _literals.sub("?", _whitespace.sub(" ", statement).strip())
+	return _value_lists.sub("(...)", statement)
+
+
+class QueryStats:
+	__slots__ = ("count", "duration", "slowest", "slowest_statement", "statements")
+
+	def __init__(self, track_statements: bool = False):
+		self.count = 0
+		self.duration = 0.0
+		self.slowest = 0.0
+		self.slowest_statement = None
+		self.statements = Counter() if track_statements else None
+
+	def record(self, statement: str, duration: float):
+		self.count += 1
+		self.duration += duration
+		if duration > self.slowest:
+			self.slowest = duration
+			self.slowest_statement = statement
+		if self.statements is not None:
+			self.statements[statement] += 1
+
+
+_current: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> QueryStats | None:
+	return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	duration = time.perf_counter() - conn.info["query_start"].pop()
+	stats = _current.get()
+	if stats is not None:
+		stats.record(statement, duration)
+	if duration * 1000 >= config.DB_SLOW_QUERY_MS:
+		slow_queries.labels().inc()
+		logger.warning("slow query ({:.1f}ms): {}", duration * 1000, normalize(statement))
+
+
+def install():
+	"""Hooks every engine, including the one SQLAlchemyMiddleware creates."""
+	if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+		event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+		event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryStatsMiddleware:
+	"""Collects the statements of each request into a `QueryStats`."""
+
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			return await self.app(scope, receive, send)
+
+		stats = QueryStats(track_statements=config.DB_N_PLUS_ONE_THRESHOLD > 0)
+		token = _current.set(stats)
+		start = time.perf_counter()
+		status_code = 500
+
+		async def send_wrapper(message):
+			nonlocal status_code
+			if message["type"] == "http.response.start":
+				status_code = message["status"]
+				elapsed = (time.perf_counter() - start) * 1000
+				MutableHeaders(scope=message).append(
+					"Server-Timing",
+					f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", '
+					f"db-slowest;dur={stats.slowest * 1000:.1f}, app;dur={elapsed:.1f}",
+				)
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			_current.reset(token)
+			path = scope["route"].path if "route" in scope else scope["path"]
+			if config.ACCESS_LOG:
+				logger.info(
+					"{method} {path} {status} {duration_ms:.1f}ms db={db_queries}q/{db_ms:.1f}ms",
+					method=scope["method"],
+					path=path,
+					status=status_code,
+					duration_ms=(time.perf_counter() - start) * 1000,
+					db_queries=stats.count,
+					db_ms=stats.duration * 1000,
+				)
+			if stats.statements:
+				for statement, count in stats.statements.items():
+					if count >= config.DB_N_PLUS_ONE_THRESHOLD:
+						logger.warning("possible N+1 in {} {}: {} identical statements: {}",
+							scope["method"], path, count, normalize(statement))
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+	"""The asyncio queue pool, timing every checkout; waits grow first when the pool is short."""
+
+	def _do_get(self):
+		start = time.perf_counter()
+		try:
+			return super()._do_get()
+		finally:
+			waited = time.perf_counter() - start
+			pool_wait_seconds.labels().observe(waited)
+			pool_wait.update(waited)
@@ -0,0 +1,117 @@
+"""
+Cross-node invalidation bus over Postgres LISTEN/NOTIFY.
+
+Writes call `publish` inside their transaction, so the `table:id:version` notification
+is delivered on commit and never for a rolled back write. Each worker holds one
+dedicated listener connection, outside the pool, that dispatches notifications to the
+handlers subscribed for the table.
+
+Notifications sent while a listener is disconnected are lost, so every (re)connect
+runs the resync callbacks once LISTEN is active again. A cache that resyncs can't keep
+a stale entry, e.g. a user banned on another node while this one was cut off.
+"""
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import asyncpg
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from app.core import metrics
+from app.core.config import config
+
+OnChange = Callable[[str, int], Awaitable[None]]  # (id, version)
+OnResync = Callable[[], Awaitable[None]]
+
+_handlers: Dict[str, List[OnChange]] = {}
+_resyncs: List[OnResync] = []
+_pending: set[asyncio.Task] = set()  # running handlers, referenced until done
+
+notifications = metrics.counter("usagi_invalidations_total",
+	"Invalidation notifications received, per table", ["table"])
+reconnects = metrics.counter("usagi_invalidation_reconnects_total",
+	"Listener connections opened after the first one")
+
+
+def subscribe(table: str, on_change: OnChange, on_resync: OnResync | None = None):
+	"""Calls `on_change` for every write to `table`, `on_resync` after each (re)connect."""
+	_handlers.setdefault(table, []).append(on_change)
+	if on_resync is not None:
+		_resyncs.append(on_resync)
+
+
+def unsubscribe_all():
+	_handlers.clear()
+	_resyncs.clear()
+
+
+async def publish(db_session: AsyncSession, table: str, id: str):
+	"""Queues a notification on the session's transaction, it is sent on commit."""
+	if db_session.get_bind().dialect.name != "postgresql":
+		return
+	await db_session.execute(text("SELECT pg_notify(:channel, :payload)"), {
+		"channel": config.DB_NOTIFY_CHANNEL,
+		"payload": f"{table}:{id}:{time.time_ns() // 1000}",
+	})
+
+
+def _dispatch(connection, pid: int, channel: str, payload: str):
+	try:
+		table, id, version = payload.split(":")
+		version = int(version)
+	except ValueError:
+		logger.warning("ignoring malformed invalidation {!r}", payload)
+		return
+	notifications.labels(table).inc()
+	for on_change in _handlers.get(table, ()):
+		task = asyncio.create_task(on_change(id, version))
+		_pending.add(task)
+		task.add_done_callback(_finished)
+
+
+def _finished(task: asyncio.Task):
+	_pending.discard(task)
+	if not task.cancelled() and task.exception():
+		logger.opt(exception=task.exception()).error("invalidation handler failed")
+
+
+async def _resync():
+	for on_resync in _resyncs:
+		try:
+			await on_resync()
+		except Exception:
+			logger.exception("invalidation resync failed")
+
+
+async def listen(dsn: str):
+	"""Runs until cancelled, reconnecting with exponential backoff."""
+	delay = 1.0
+	connected_before = False
+	while True:
+		try:
+			connection = await asyncpg.connect(dsn, timeout=10)
+		except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+			logger.warning("invalidation listener can't connect, retrying in {:.0f}s: {!r}",
+				delay, e)
+			await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+			delay = min(delay * 2, 30.0)
+			continue
+
+		try:
+			await connection.add_listener(config.DB_NOTIFY_CHANNEL, _dispatch)
+			if connected_before:
+				reconnects.labels().inc()
+			connected_before = True
+			await _resync()  # whatever was written while we weren't listening
+			delay = 1.0
+			while True:  # notifications arrive on their own, this only notices a dead link
+				await asyncio.sleep(config.DB_LISTEN_KEEPALIVE)
+				await connection.fetchval("SELECT 1", timeout=10)
+		except (OSError, asyncio.TimeoutError, asyncpg.PostgresError,
+			asyncpg.InterfaceError) as e:
+			logger.warning("invalidation listener lost its connection: {!r}", e)
+		finally:
+			connection.terminate()  # closing would wait on a connection that may be gone
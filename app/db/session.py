@@ -1,26 +1,36 @@
+from functools import lru_cache
+
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.ext.asyncio.session import AsyncSession
 
 from app.core.config import config
 
 connect_args = {"check_same_thread": False}
 
-async_db_uri = f"postgresql+asyncpg://{config.DB_USER}:{config.DB_PASS}@{config.DB_HOST}/{config.DB_NAME}"
-print(f"database url: async_db_uri")
-
-engine = create_async_engine(
-	async_db_uri,
-	echo=True,
-	future=True,
-	pool_size=config.DB_POOL_SIZE,
-	max_overflow=config.DB_MAX_OVERFLOW,
-)
-
-SessionLocal = sessionmaker(
-	autocommit=False,
-	autoflush=False,
-	bind=engine,
-	class_=AsyncSession,
-	expire_on_commit=False,
-)
+
+def database_url() -> str:
+	return f"postgresql+asyncpg://{config.DB_USER}:{config.DB_PASS}@{config.DB_HOST}:{config.DB_PORT}/{config.DB_NAME}"
+
+
+@lru_cache
+def get_engine() -> AsyncEngine:
+	"""The engine for scripts outside the app, which uses SQLAlchemyMiddleware's own."""
+	return create_async_engine(
+		database_url(),
+		echo=True,
+		future=True,
+		pool_size=config.DB_POOL_SIZE,
+		max_overflow=config.DB_MAX_OVERFLOW,
+	)
+
+
+@lru_cache
+def get_sessionmaker() -> sessionmaker:
+	return sessionmaker(
+		autocommit=False,
+		autoflush=False,
+		bind=get_engine(),
+		class_=AsyncSession,
+		expire_on_commit=False,
+	)
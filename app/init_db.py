@@ -2,17 +2,17 @@ import asyncio
 from sqlalchemy import text
 
 from app.db.init_data import init_data
-from app.db.session import SessionLocal, engine
+from app.db.session import get_engine, get_sessionmaker
 from app.models import Base
 
 
 async def create_init_data() -> None:
-	async with SessionLocal() as session:
+	async with get_sessionmaker()() as session:
 		await init_data(session)
 
 
 async def create_all():
-	async with engine.begin() as conn:
+	async with get_engine().begin() as conn:
 		print("-- Dropping Tables --")
 		await conn.run_sync(Base.metadata.drop_all)
 		print("-- Creating Tables --")
@@ -20,7 +20,7 @@ async def create_all():
 
 
 async def create_extensions():
-	async with engine.begin() as conn:
+	async with get_engine().begin() as conn:
 		try:
 			await conn.execute(text("CREATE EXTENSION pg_trgm;"))
 			await conn.execute(text("CREATE EXTENSION btree_gin;"))
@@ -29,7 +29,7 @@ async def create_extensions():
 
 
 async def create_indexes():
-	async with engine.connect() as conn:
+	async with get_engine().connect() as conn:
 		await conn.execution_options(isolation_level="AUTOCOMMIT")
 		query = "CREATE INDEX CONCURRENTLY ix_app_users_trgm_alias ON app_users USING gin (alias gin_trgm_ops);"
 		await conn.execute(text(query))
@@ -1,71 +1,156 @@
+import asyncio
+
 from starlette.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 from fastapi_pagination import add_pagination
-from fastapi_async_sqlalchemy import db, SQLAlchemyMiddleware
+from fastapi_async_sqlalchemy import SQLAlchemyMiddleware
 from fastapi.openapi.docs import get_redoc_html
 from loguru import logger
 
+from app.core import (admission, budget, compression, eventloop, jobs, metrics, openapi,
+	ratelimit, revocations, tracing)
 from app.core.config import config, config_mode
 from app.core.logging import setup_logger_from_config
-from app.api.v1.api import api_router as api_v1
-
-async_db_url = f"postgresql+asyncpg://{config.DB_USER}:{config.DB_PASS}@{config.DB_HOST}/{config.DB_NAME}"
-openapi_url = f"{config.API_V1_STR}/openapi.json"
-
-app = FastAPI(
-	title=config.PROJECT_NAME,
-	version=config.API_VERSION,
-	openapi_url=openapi_url,
-	docs_url=None,
-	redoc_url=None,
-)
-
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-# db access via middleware
-app.add_middleware(
-	SQLAlchemyMiddleware,
-	db_url=async_db_url,
-	engine_args={
-	"echo": False,
-	"pool_pre_ping": True,
-	"pool_size": config.DB_POOL_SIZE,
-	"max_overflow": config.DB_MAX_OVERFLOW,
-	},
-)
-
-if config.BACKEND_CORS_ORIGINS:
+from app.core.security import shutdown_hash_pool
+from app.core.static import CachedStaticFiles
+from app.db import instrumentation, invalidation
+from app.db.session import database_url
+from app.models.user_model import User
+
+
+def create_app() -> FastAPI:
+	"""Builds the application; importing this module alone reads no config and opens nothing."""
+	from app.api.v1.api import api_router as api_v1  # declaring the routes is the costly part
+
+	openapi_url = f"{config.API_V1_STR}/openapi.json"
+
+	app = FastAPI(
+		title=config.PROJECT_NAME,
+		version=config.API_VERSION,
+		openapi_url=None,  # served from `schema` below
+		docs_url=None,
+		redoc_url=None,
+	)
+
+	static_files = CachedStaticFiles(directory="static")
+	app.mount("/static", static_files, name="static")
+
+	# db access via middleware
 	app.add_middleware(
-		CORSMiddleware,
-		allow_origins=[str(origin) for origin in config.BACKEND_CORS_ORIGINS],
-		allow_credentials=True,
-		allow_methods=["*"],
-		allow_headers=["*"],
+		SQLAlchemyMiddleware,
+		db_url=database_url(),
+		engine_args={
+		"echo": False,
+		"pool_pre_ping": True,
+		"pool_size": config.DB_POOL_SIZE,
+		"max_overflow": config.DB_MAX_OVERFLOW,
+		"poolclass": instrumentation.TimedQueuePool,
+		},
 	)
 
-app.include_router(api_v1, prefix=config.API_V1_STR)
-add_pagination(app)
+	if config.COMPRESSION_ENABLED:
+		app.add_middleware(compression.CompressionMiddleware,
+			minimum_size=config.COMPRESSION_MIN_SIZE,
+			gzip_level=config.COMPRESSION_GZIP_LEVEL,
+			brotli_quality=config.COMPRESSION_BROTLI_QUALITY)
+
+	instrumentation.install()
+	budget.install()
+	app.add_middleware(instrumentation.QueryStatsMiddleware)
+	app.add_middleware(tracing.TracingMiddleware)
+	# sheds load before a session is opened, inside metrics so the 503s are counted
+	app.add_middleware(admission.AdmissionMiddleware,
+		priorities={
+		"/health": admission.Priority.CRITICAL,
+		"/metrics": admission.Priority.CRITICAL,
+		f"{config.API_V1_STR}/auth/refresh-access": admission.Priority.HIGH,
+		})
+
+	if config.BACKEND_CORS_ORIGINS:  # outside admission, so browsers can read its 503s
+		app.add_middleware(
+			CORSMiddleware,
+			allow_origins=[str(origin) for origin in config.BACKEND_CORS_ORIGINS],
+			allow_credentials=True,
+			allow_methods=["*"],
+			allow_headers=["*"],
+		)
+
+	if config.METRICS_ENABLED:
+		app.add_middleware(metrics.MetricsMiddleware)  # outermost, sees every request
+
+	app.include_router(api_v1, prefix=config.API_V1_STR)
+	add_pagination(app)
+
+	schema = openapi.SchemaCache(app, config.OPENAPI_SCHEMA_PATH)
+	app.add_api_route(openapi_url, schema.respond, include_in_schema=False)
+
+	@app.on_event("startup")
+	async def on_startup():
+		setup_logger_from_config()
+		logger.success("Starting server...")
+		if config_mode:
+			logger.success("Config loaded: {}", config_mode)
+		jobs.start()
+		eventloop.start()
+		admission.start()
+		schema.warm()
+		revocations.open_table()
+		if config.DB_LISTEN:
+			# the listener loads the table once it is listening, and on every reconnect
+			invalidation.subscribe(User.__tablename__, revocations.refresh, revocations.sync)
+			listener = invalidation.listen(database_url().replace("+asyncpg", "", 1))
+			app.state.revocations_task = asyncio.create_task(listener)
+		else:
+			app.state.revocations_task = asyncio.create_task(revocations.sync())
+		if config.METRICS_ENABLED and config.METRICS_MULTIPROC_DIR:
+			store = metrics.enable_multiprocess(config.METRICS_MULTIPROC_DIR)
+			app.state.metrics_task = asyncio.create_task(store.run(config.METRICS_FLUSH_SECONDS))
+
+	@app.on_event("shutdown")
+	async def on_shutdown():
+		logger.warning("Shutting down...")
+		await jobs.stop()
+		admission.stop()
+		eventloop.stop()
+		shutdown_hash_pool()
+		if task := getattr(app.state, "revocations_task", None):
+			task.cancel()
+		revocations.close_table()
+		invalidation.unsubscribe_all()
+		ratelimit.close_store()
+		if task := getattr(app.state, "metrics_task", None):
+			task.cancel()
+			metrics.disable_multiprocess()
+
+	@app.get("/health", include_in_schema=False)
+	def get_health():
+		return PlainTextResponse("ok")
 
+	@app.get("/metrics", include_in_schema=False)
+	def get_metrics():
+		return PlainTextResponse(metrics.exposition(), media_type=metrics.CONTENT_TYPE)
 
-@app.on_event("startup")
-async def on_startup():
-	logger.success(f"Starting server...")
-	if config_mode:
-		logger.success(f"Config loaded: {config_mode}")
+	favicon_url = static_files.versioned("favicon64.png")
 
+	# overrides redoc without tiangolo server ping
+	@app.get("/redoc", include_in_schema=False)
+	def overridden_redoc():
+		return get_redoc_html(openapi_url=openapi_url,
+			title="FastAPI",
+			redoc_favicon_url=favicon_url)
 
-@app.on_event("shutdown")
-async def on_startup():
-	logger.warning("Shutting down...")
+	return app
 
 
-# overrides redoc without tiangolo server ping
-@app.get("/redoc", include_in_schema=False)
-def overridden_redoc():
-	return get_redoc_html(openapi_url=openapi_url,
-		title="FastAPI",
-		redoc_favicon_url="/static/favicon64.png")
+def __getattr__(name: str):
+	# `app` is built on first access, e.g. when uvicorn loads app.main:app
+	if name == "app":
+		global app
+		app = create_app()
+		return app
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-setup_logger_from_config()
\ No newline at end of file
+if __name__ == "__main__":
+	app = create_app()
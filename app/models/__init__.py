@@ -1,5 +1,5 @@
 # /!\
-from .user_model import User
+from .user_model import User, UserRow
 
 # Base must be imported here after all other models for metadata.
 from .base_model import Base
@@ -1,14 +1,70 @@
+import uuid
+from collections import namedtuple
+
+from sqlalchemy import BigInteger, Text, cast, func, literal
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import expression
 from sqlalchemy.ext.compiler import compiles
-from sqlalchemy.types import DateTime
-import ulid
+from sqlalchemy.types import DateTime, LargeBinary, TypeDecorator
+from sqlalchemy.dialects.postgresql import BIT, UUID
+
+from app.utils import ulid
 
 Base = declarative_base()
 
 
 def gen_ulid():
-	return ulid.new().str
+	return ulid.new()
+
+
+class ULIDType(TypeDecorator):
+	"""
+	Stores a ULID in 16 bytes - a native `uuid` on postgresql, `BINARY(16)` elsewhere -
+	while the application keeps working with the 26 character Crockford string.
+	"""
+	impl = LargeBinary(16)
+	cache_ok = True
+
+	def load_dialect_impl(self, dialect):
+		if dialect.name == "postgresql":
+			return dialect.type_descriptor(UUID(as_uuid=True))
+		return dialect.type_descriptor(LargeBinary(16))
+
+	def process_bind_param(self, value, dialect):
+		if value is None:
+			return None
+		raw = ulid.to_bytes(str(value))
+		if dialect.name == "postgresql":
+			return uuid.UUID(bytes=raw)
+		return raw
+
+	def process_result_value(self, value, dialect):
+		if value is None:
+			return None
+		if isinstance(value, (bytes, bytearray, memoryview)):
+			return ulid.from_bytes(bytes(value))
+		if not isinstance(value, uuid.UUID):
+			value = uuid.UUID(str(value))
+		return ulid.from_bytes(value.bytes)
+
+
+def row_model(model, **members):
+	"""
+	Builds a read-only, tuple-backed row type with one field per table column of
+	`model`. `members` (properties, methods) are added to the class.
+	"""
+	name = f"{model.__name__}Row"
+	base = namedtuple(name, [column.key for column in model.__table__.columns])
+	return type(name, (base, ), {"__slots__": (), **members})
+
+
+def ulid_timestamp_ms(column):
+	"""
+	SQL expression extracting the millisecond timestamp (the first 48 bits) of a
+	`ULIDType` column stored as a postgresql uuid.
+	"""
+	hex_prefix = func.substr(func.replace(cast(column, Text), "-", ""), 1, 12)
+	return cast(cast(literal("x").concat(hex_prefix), BIT(48)), BigInteger)
 
 
 class utcnow(expression.FunctionElement):
@@ -16,6 +72,11 @@ class utcnow(expression.FunctionElement):
 	inherit_cache = True
 
 
+@compiles(utcnow)
+def default_utcnow(element, compiler, **kw):
+	return "CURRENT_TIMESTAMP"
+
+
 @compiles(utcnow, 'postgresql')
 def pg_utcnow(element, compiler, **kw):
 	return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
@@ -8,8 +8,8 @@ from sqlalchemy import (
 	Enum,
 )
 from sqlalchemy.ext.hybrid import hybrid_property
-from app.models.base_model import Base, gen_ulid, utcnow
-import ulid
+from app.models.base_model import Base, ULIDType, gen_ulid, row_model, utcnow
+from app.utils import ulid
 
 
 class UserRoleEnum(str, enum.Enum):
@@ -29,7 +29,7 @@ class User(Base):
 	__tablename__ = "app_users"
 
 	# Let's see what func.now does with timezone false.
-	id = Column(String(26), primary_key=True, nullable=False, default=gen_ulid)
+	id = Column(ULIDType, primary_key=True, nullable=False, default=gen_ulid)
 	email = Column(String(100), nullable=False, unique=True)
 	alias = Column(String(20), nullable=False, unique=True)  #XXX - Index disabled for resting
 	password = Column(String(200), nullable=False)
@@ -43,8 +43,12 @@ class User(Base):
 
 	@property
 	def registered_on(self):
-		return ulid.parse(self.id).timestamp().datetime
+		return ulid.timestamp(self.id)
 
 	def __repr__(self):
 		return (
 			f"<User email={self.email}, id={self.id}, alias={self.alias}, role={self.role}>")
+
+
+# Read-only view of a user row, accepted by the orm_mode output schemas.
+UserRow = row_model(User, registered_on=property(lambda self: ulid.timestamp(self.id)))
@@ -1,8 +1,10 @@
-from pydantic import BaseModel, EmailStr, constr
+from enum import Enum
+from typing import List
+from pydantic import BaseModel, EmailStr, constr, validator
 
 from app.models.user_model import UserRoleEnum
 from app.schemas.base_schema import ULID
-from app.schemas.user_schema import rgx_user_alias
+from app.schemas.user_schema import UserAlias, rgx_user_alias
 
 
 class AdminCreateUser(BaseModel):
@@ -21,3 +23,36 @@ class AdminSetUserRole(BaseModel):
 class AdminBanUser(BaseModel):
 	user_id: ULID
 	reason: constr(min_length=6, max_length=50) | None = None
+
+
+class ExportFormatEnum(str, Enum):
+	NDJSON = "ndjson"
+	CSV = "csv"
+
+
+class AdminImportUser(BaseModel):
+	email: EmailStr
+	alias: UserAlias
+	password: constr(min_length=6, max_length=200)
+	role: UserRoleEnum = UserRoleEnum.USER
+	confirmed: bool = False
+
+	@validator("role")
+	def role_not_admin(cls, v):
+		if v == UserRoleEnum.ADMIN:  # admins are appointed one at a time, not bulk loaded
+			raise ValueError("admin accounts can't be imported")
+		return v
+
+
+class AdminImportError(BaseModel):
+	line: int
+	error: str
+
+
+class AdminImportOut(BaseModel):
+	received: int
+	imported: int
+	failed: int
+	errors: List[AdminImportError]
+	elapsed_seconds: float
+	rows_per_second: float
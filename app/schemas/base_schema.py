@@ -1,7 +1,6 @@
 from enum import Enum
-import re
 
-rgx_ulid = r"[0-7][0-9A-HJKMNP-TV-Z]{25}"
+from app.utils.ulid import ULID_PATTERN, rgx_ulid
 
 
 class ULID(str):
@@ -14,8 +13,7 @@ class ULID(str):
 	def validate(cls, v):
 		if not isinstance(v, str):
 			raise TypeError('id must be a string')
-		match = re.match(rgx_ulid, v)
-		if match is None:
+		if ULID_PATTERN.fullmatch(v) is None:
 			raise ValueError("invalid id")
 		return v
 
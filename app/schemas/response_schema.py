@@ -4,6 +4,8 @@ from pydantic.generics import GenericModel
 from fastapi_pagination import Params, Page
 from fastapi_pagination.bases import AbstractPage, AbstractParams
 
+from app.core.tracing import traced
+
 DataType = TypeVar("DataType")
 T = TypeVar("T")
 
@@ -70,6 +72,7 @@ class DeleteResponseBase(ResponseBase[DataType], Generic[DataType]):
 	message: str = "data deleted"
 
 
+@traced()
 def create_response(
 	data: DataType | None,
 	message: str | None = None,
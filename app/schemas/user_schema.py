@@ -1,5 +1,5 @@
 import re
-from datetime import datetime
+from datetime import date, datetime
 from pydantic import BaseModel, EmailStr, constr
 
 from app.models.user_model import UserRoleEnum
@@ -80,3 +80,8 @@ class UserOutFull(BaseModel):
 
 	class Config:
 		orm_mode = True  #*
+
+
+class SignupCountOut(BaseModel):
+	day: date
+	count: int
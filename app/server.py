@@ -0,0 +1,237 @@
+"""
+Production server: a prefork master running uvicorn workers on one shared socket.
+
+The app is built in the master before forking (SERVER_PRELOAD) so workers start from
+a warm copy. That is safe because building it opens nothing; the engine, its pool and
+every background thread are created lazily inside each worker. Workers use uvloop and
+httptools when they are installed and are replaced after WORKER_MAX_REQUESTS (plus
+jitter, so they don't all restart together) to bound memory growth.
+
+	python -m app.server [--workers N] [--host 0.0.0.0] [--port 8000] [--no-preload]
+
+SIGTERM/SIGINT drain the workers for up to GRACEFUL_TIMEOUT seconds before killing
+them, SIGHUP replaces every worker.
+"""
+import argparse
+import importlib.util
+import math
+import os
+import random
+import select
+import signal
+import socket
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+import uvicorn
+from loguru import logger
+
+from app.core.config import config
+
+APP = "app.main:app"
+
+
+def default_workers() -> int:
+	"""The cpus this process may run on, which can be fewer than the host has."""
+	if hasattr(os, "sched_getaffinity"):
+		return len(os.sched_getaffinity(0))
+	return os.cpu_count() or 1
+
+
+def pool_limits(workers: int, pool_size: int, max_overflow: int,
+	budget: int | None) -> Tuple[int, int]:
+	"""Clamps each worker's pool so `workers * (pool_size + max_overflow)` fits the budget."""
+	if budget is None:
+		return pool_size, max_overflow
+	per_worker = budget // workers
+	if per_worker < 1:
+		raise ValueError(
+			f"a budget of {budget} connections can't give {workers} workers one each")
+	pool_size = min(pool_size, per_worker)
+	return pool_size, min(max_overflow, per_worker - pool_size)
+
+
+class Master:
+	"""Forks the workers, replaces the ones that exit and drains them on shutdown."""
+
+	def __init__(self, app, sock: socket.socket, workers: int, loop: str = "auto",
+		http: str = "auto"):
+		self.app = app
+		self.sock = sock
+		self.workers = workers
+		self.loop = loop
+		self.http = http
+		self.children: Dict[int, float] = {}  # pid: started at
+		self.signals: list[int] = []
+		self.pending = 0  # workers to replace
+		self.respawn_at = 0.0
+		self.failures = 0  # consecutive workers that died while booting
+
+	def run(self):
+		self.wakeup, wakeup_write = os.pipe()
+		os.set_blocking(wakeup_write, False)
+		signal.set_wakeup_fd(wakeup_write)
+		for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+			signal.signal(sig, lambda sig, frame: self.signals.append(sig))
+
+		for _ in range(self.workers):
+			self.spawn()
+		while True:
+			timeout = max(self.respawn_at - time.monotonic(), 0) if self.pending else 1.0
+			select.select([self.wakeup], [], [], timeout)
+			try:
+				os.read(self.wakeup, 512)
+			except BlockingIOError:
+				pass
+			while self.signals:
+				sig = self.signals.pop(0)
+				if sig in (signal.SIGTERM, signal.SIGINT):
+					logger.warning("Shutting down {} workers...", len(self.children))
+					return self.stop()
+				if sig == signal.SIGHUP:
+					logger.info("Replacing {} workers", len(self.children))
+					self.kill(signal.SIGTERM)
+			self.reap()
+			while self.pending and time.monotonic() >= self.respawn_at:
+				self.pending -= 1
+				self.spawn()
+
+	def spawn(self):
+		pid = os.fork()
+		if pid:
+			self.children[pid] = time.monotonic()
+			return
+		try:
+			code = self.serve()
+		except BaseException:
+			logger.exception("Worker {} crashed", os.getpid())
+			code = 1
+		os._exit(code)
+
+	def serve(self) -> int:
+		"""The worker side of the fork, returns its exit code."""
+		signal.set_wakeup_fd(-1)
+		os.close(self.wakeup)
+		signal.signal(signal.SIGCHLD, signal.SIG_DFL)  # the hash pool waits on its processes
+		signal.signal(signal.SIGHUP, signal.SIG_IGN)
+		# uvicorn re-raises the signal it stopped on once it has drained
+		signal.signal(signal.SIGTERM, signal.SIG_IGN)
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+		random.seed()  # don't share the master's sequence, e.g. for span ids
+
+		max_requests = None
+		if config.WORKER_MAX_REQUESTS:
+			max_requests = config.WORKER_MAX_REQUESTS + random.randint(
+				0, config.WORKER_MAX_REQUESTS_JITTER)
+		server = uvicorn.Server(
+			uvicorn.Config(
+				self.app,
+				loop=self.loop,
+				http=self.http,
+				access_log=False,  # QueryStatsMiddleware writes the access log
+				proxy_headers=True,
+				limit_max_requests=max_requests,
+				timeout_graceful_shutdown=math.ceil(config.GRACEFUL_TIMEOUT),
+			))
+		server.run(sockets=[self.sock])
+		return 0 if server.started else 3
+
+	def reap(self):
+		while self.children:
+			try:
+				pid, status = os.waitpid(-1, os.WNOHANG)
+			except ChildProcessError:
+				return
+			if not pid:
+				return
+			started = self.children.pop(pid, None)
+			if started is None:
+				continue
+			code = os.waitstatus_to_exitcode(status)
+			now = time.monotonic()
+			if code and now - started < 5:
+				self.failures += 1
+				delay = min(2**self.failures, 30)
+				logger.error("Worker {} failed to boot ({}), retrying in {}s", pid, code, delay)
+				self.respawn_at = max(self.respawn_at, now + delay)
+			else:
+				self.failures = 0
+				if code:
+					logger.warning("Worker {} exited with {}", pid, code)
+			self.pending += 1
+
+	def kill(self, sig: int):
+		for pid in self.children:
+			try:
+				os.kill(pid, sig)
+			except ProcessLookupError:
+				pass
+
+	def stop(self):
+		self.kill(signal.SIGTERM)
+		deadline = time.monotonic() + config.GRACEFUL_TIMEOUT + 5  # uvicorn's drain + lifespan
+		while self.children and time.monotonic() < deadline:
+			try:
+				pid, _ = os.waitpid(-1, os.WNOHANG)
+			except ChildProcessError:
+				break
+			if pid:
+				self.children.pop(pid, None)
+			else:
+				time.sleep(0.1)
+		if self.children:
+			logger.warning("Killing {} workers that didn't drain in time", len(self.children))
+			self.kill(signal.SIGKILL)
+			for pid in list(self.children):
+				os.waitpid(pid, 0)
+		self.children.clear()
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument("--workers", type=int, default=None, help="defaults to WEB_CONCURRENCY")
+	parser.add_argument("--host", default=None, help="defaults to SERVER_HOST")
+	parser.add_argument("--port", type=int, default=None, help="defaults to SERVER_PORT")
+	parser.add_argument("--no-preload", action="store_true",
+		help="import the app in each worker instead of once in the master")
+	args = parser.parse_args()
+
+	workers = args.workers or config.WEB_CONCURRENCY or default_workers()
+	budget = config.DB_CONNECTION_BUDGET
+	if budget is not None and config.DB_LISTEN:
+		budget -= workers  # every worker also holds an invalidation listener
+	pool_size, max_overflow = pool_limits(workers, config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW,
+		budget)
+	if (pool_size, max_overflow) != (config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW):
+		logger.warning("DB pool clamped to {}+{} per worker to fit {} connections", pool_size,
+			max_overflow, config.DB_CONNECTION_BUDGET)
+		config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW = pool_size, max_overflow
+
+	if config.METRICS_MULTIPROC_DIR:
+		for stale in Path(config.METRICS_MULTIPROC_DIR).glob("metrics_*.json"):
+			stale.unlink(missing_ok=True)  # left by a previous run's workers
+	elif workers > 1 and config.METRICS_ENABLED:
+		logger.warning("METRICS_MULTIPROC_DIR is unset, /metrics shows one worker per scrape")
+
+	preload = config.SERVER_PRELOAD and not args.no_preload
+	if preload:
+		from app.main import create_app
+		app = create_app()
+	else:
+		app = APP
+
+	sock = uvicorn.Config(APP, host=args.host or config.SERVER_HOST,
+		port=args.port or config.SERVER_PORT).bind_socket()
+	# what uvicorn's "auto" would pick, passed explicitly so the log names what runs
+	loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+	http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+	logger.success("Serving on {} with {} workers ({}, {}, {}), pool {}+{} each",
+		"{}:{}".format(*sock.getsockname()[:2]), workers, loop, http,
+		"preloaded" if preload else "not preloaded", pool_size, max_overflow)
+	Master(app, sock, workers, loop, http).run()
+	sock.close()
+
+
+if __name__ == "__main__":
+	main()
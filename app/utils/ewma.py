@@ -0,0 +1,30 @@
+import math
+import time
+
+
+class Ewma:
+	"""Exponentially weighted moving average that also fades towards 0 between samples.
+
+	With `tau` seconds of decay a signal that stops being sampled, like the pool wait of
+	an idle worker, doesn't keep its last value forever.
+	"""
+	__slots__ = ("alpha", "tau", "_value", "_updated")
+
+	def __init__(self, alpha: float = 0.2, tau: float = 1.0):
+		self.alpha = alpha
+		self.tau = tau
+		self._value = 0.0
+		self._updated = time.monotonic()
+
+	def _decayed(self, now: float) -> float:
+		return self._value * math.exp((self._updated - now) / self.tau)
+
+	def update(self, sample: float):
+		now = time.monotonic()
+		value = self._decayed(now)
+		self._value = value + (sample - value) * self.alpha
+		self._updated = now
+
+	@property
+	def value(self) -> float:
+		return self._decayed(time.monotonic())
@@ -0,0 +1,138 @@
+"""
+Minimal ULID implementation used for primary keys.
+
+A ULID is a 128 bit value: a 48 bit millisecond timestamp followed by 80 random bits,
+written as 26 Crockford base32 characters. Decoding leans on the C implementation of
+`int(x, 32)` by translating Crockford into the base32hex alphabet, encoding walks the
+value 10 bits (two characters) at a time through a lookup table.
+"""
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, List
+
+ENCODING = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+B32HEX = "0123456789ABCDEFGHIJKLMNOPQRSTUV"
+
+rgx_ulid = r"[0-7][0-9A-HJKMNP-TV-Z]{25}"
+ULID_PATTERN = re.compile(rgx_ulid)
+
+RANDOM_BITS = 80
+RANDOM_MAX = (1 << RANDOM_BITS) - 1
+TIMESTAMP_MAX = (1 << 48) - 1
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_to_b32hex = str.maketrans(ENCODING, B32HEX)
+_pairs = [a + b for a in ENCODING for b in ENCODING]
+_shifts = tuple(range(120, -1, -10))  # 13 * 10 bits = 130 bits, the top 2 are always zero
+
+
+def is_valid(value: str) -> bool:
+	"""True when `value` is a 26 character ULID string, in either case."""
+	return ULID_PATTERN.fullmatch(value.upper()) is not None
+
+
+def from_bytes(raw: bytes) -> str:
+	"""Encodes 16 raw bytes as a ULID string."""
+	if len(raw) != 16:
+		raise ValueError("a ulid must be 16 bytes")
+	return from_int(int.from_bytes(raw, "big"))
+
+
+def from_int(value: int) -> str:
+	"""Encodes a 128 bit integer as a ULID string."""
+	return "".join([_pairs[(value >> shift) & 0x3FF] for shift in _shifts])
+
+
+def to_int(value: str) -> int:
+	"""Decodes a ULID string, in either case, into its 128 bit integer."""
+	value = value.upper()
+	if ULID_PATTERN.fullmatch(value) is None:
+		raise ValueError(f"invalid ulid: {value}")
+	return int(value.translate(_to_b32hex), 32)
+
+
+def to_bytes(value: str) -> bytes:
+	"""Decodes a ULID string into its 16 raw bytes."""
+	return to_int(value).to_bytes(16, "big")
+
+
+def timestamp_ms(value: str) -> int:
+	"""The unix timestamp in milliseconds encoded in the first 10 characters."""
+	return int(value[:10].upper().translate(_to_b32hex), 32)
+
+
+@lru_cache(maxsize=2**16)
+def timestamp(value: str) -> datetime:
+	"""
+	The creation time of a ULID, an aware UTC datetime as ulid-py's `timestamp().datetime`
+	was, so it still serializes with `+00:00`. Cached, ids are immutable.
+	"""
+	return EPOCH + timedelta(milliseconds=timestamp_ms(value))
+
+
+def timestamps(values: Iterable[str]) -> List[datetime]:
+	"""Decodes the creation time of a whole page of ULIDs at once."""
+	return [timestamp(value) for value in values]
+
+
+def datetime_ms(dt: datetime) -> int:
+	"""Milliseconds since the epoch, clamped to the 48 bit ULID range. Naive means UTC."""
+	if dt.tzinfo is None:
+		dt = dt.replace(tzinfo=timezone.utc)
+	return min(max((dt - EPOCH) // timedelta(milliseconds=1), 0), TIMESTAMP_MAX)
+
+
+def min_for(dt: datetime) -> str:
+	"""The smallest ULID that can be generated at `dt`."""
+	return from_int(datetime_ms(dt) << RANDOM_BITS)
+
+
+def max_for(dt: datetime) -> str:
+	"""The largest ULID that can be generated at `dt`."""
+	return from_int((datetime_ms(dt) << RANDOM_BITS) | RANDOM_MAX)
+
+
+class MonotonicULID:
+	"""
+	Thread-safe ULID generator. Within the same millisecond the random part is
+	incremented instead of redrawn, so ids created in a tight loop (bulk inserts)
+	stay strictly increasing and sort in creation order.
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		self._last_ms = 0
+		self._last_random = 0
+
+	def new_int(self) -> int:
+		now_ms = time.time_ns() // 1_000_000
+		with self._lock:
+			if now_ms > self._last_ms:
+				self._last_ms = now_ms
+				self._last_random = int.from_bytes(os.urandom(10), "big")
+			else:  # same millisecond, or the clock went backwards
+				self._last_random += 1
+				if self._last_random > RANDOM_MAX:
+					self._last_ms += 1
+					self._last_random = int.from_bytes(os.urandom(10), "big")
+			return (self._last_ms << RANDOM_BITS) | self._last_random
+
+	def new(self) -> str:
+		return from_int(self.new_int())
+
+
+generator = MonotonicULID()
+# A forked worker must not continue the parent's sequence within the same millisecond.
+os.register_at_fork(after_in_child=generator.reset)
+
+
+def new() -> str:
+	"""Generates a new monotonic ULID string."""
+	return generator.new()
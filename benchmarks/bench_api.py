@@ -0,0 +1,346 @@
+"""
+End-to-end API benchmark: drives the hot paths of the app in-process over ASGI.
+
+Seeds the Postgres database named by the DB_* settings (its name must contain "bench"
+unless --force is given) or a throwaway cluster started with --ephemeral, which needs
+initdb and pg_ctl on PATH. Each scenario runs with a fixed concurrency and reports its
+throughput and latency percentiles; results are saved as JSON and can be compared to a
+stored baseline, exiting non-zero on a regression.
+
+	python -m benchmarks.bench_api [-u 10000] [-n 2000] [-c 16] [--ephemeral]
+	python -m benchmarks.bench_api --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+PASSWORD = "benchmark"
+PAGE_SIZE = 50
+SEED_BATCH = 5000
+SESSIONS = 32
+RESULTS_DIR = Path(__file__).parent / "results"
+PERCENTILES = ("p50_ms", "p95_ms", "p99_ms")
+SCENARIOS = ("login", "user_by_id", "users", "users_search", "users_new_deep", "refresh")
+
+Request = Tuple[str, str, dict]
+
+
+@contextmanager
+def ephemeral_postgres(port: int):
+	"""A throwaway cluster in a temporary directory, with fsync off."""
+	with tempfile.TemporaryDirectory(prefix="usagi-bench-") as data:
+		quiet = {"check": True, "stdout": subprocess.DEVNULL}
+		subprocess.run(["initdb", "-D", data, "-U", "bench", "--auth=trust", "-E", "UTF8"],
+			**quiet)
+		subprocess.run(["pg_ctl", "-D", data, "-w", "-l", f"{data}/server.log", "-o",
+			f"-F -p {port} -k {data}", "start"], **quiet)
+		os.environ.update(DB_USER="bench", DB_PASS="bench", DB_HOST="127.0.0.1",
+			DB_PORT=str(port), DB_NAME="postgres")
+		os.environ.setdefault("SECRET_KEY", "bench-secret")
+		os.environ.setdefault("ENCRYPT_KEY", "bench-encrypt")
+		try:
+			yield
+		finally:
+			subprocess.run(["pg_ctl", "-D", data, "-m", "immediate", "-w", "stop"],
+				stdout=subprocess.DEVNULL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+	"""
+	Starts and stops `app` through its ASGI lifespan, as a server does, so the middleware
+	stack (and SQLAlchemyMiddleware's session factory) exists before the startup handlers.
+	"""
+	receive: asyncio.Queue = asyncio.Queue()
+	sent: asyncio.Queue = asyncio.Queue()
+	task = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}},
+		receive.get, sent.put))
+
+	async def step(event: str):
+		await receive.put({"type": f"lifespan.{event}"})
+		reply = asyncio.create_task(sent.get())
+		await asyncio.wait((reply, task), return_when=asyncio.FIRST_COMPLETED)
+		if not reply.done():
+			reply.cancel()
+			task.result()  # raises what the app did
+			raise RuntimeError(f"the app exited during {event}")
+		message = reply.result()
+		if message["type"] != f"lifespan.{event}.complete":
+			await task  # starlette re-raises the handler's error after reporting it
+			raise RuntimeError(f"{event} failed: {message.get('message', '')}")
+
+	await step("startup")
+	try:
+		yield
+	finally:
+		await step("shutdown")
+		await task
+
+
+async def seed(url: str, users: int):
+	"""Recreates the schema with `users` users sharing one password, the first an admin."""
+	from sqlalchemy import text
+	from sqlalchemy.ext.asyncio import create_async_engine
+
+	from app.core.security import hash_pass
+	from app.models import Base, User
+	from app.models.base_model import gen_ulid
+	from app.models.user_model import UserRoleEnum
+
+	password = hash_pass(PASSWORD)
+	engine = create_async_engine(url)
+	async with engine.begin() as conn:
+		await conn.run_sync(Base.metadata.drop_all)
+		await conn.run_sync(Base.metadata.create_all)
+		await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+		await conn.execute(text("CREATE INDEX ix_app_users_trgm_alias ON app_users "
+			"USING gin (alias gin_trgm_ops)"))
+		for start in range(0, users, SEED_BATCH):
+			await conn.execute(User.__table__.insert(), [{
+				"id": gen_ulid(),
+				"email": f"user{i}@bench.net",
+				"alias": f"user{i}",
+				"password": password,
+				"confirmed": True,
+				"role": UserRoleEnum.ADMIN if i == 0 else UserRoleEnum.USER,
+			} for i in range(start, min(start + SEED_BATCH, users))])
+		await conn.execute(text("ANALYZE app_users"))
+	await engine.dispose()
+
+
+async def sample_ids(url: str, count: int = 1000) -> Tuple[int, List[str]]:
+	"""The number of users and a random sample of their ids."""
+	from sqlalchemy import func, select
+	from sqlalchemy.ext.asyncio import create_async_engine
+
+	from app.models import User
+
+	engine = create_async_engine(url)
+	async with engine.connect() as conn:
+		total = await conn.scalar(select(func.count()).select_from(User))
+		ids = (await conn.scalars(select(User.id).order_by(func.random()).limit(count))).all()
+	await engine.dispose()
+	return total, ids
+
+
+async def login(client: httpx.AsyncClient, api: str, index: int) -> Dict[str, str]:
+	response = await client.post(f"{api}/auth/login",
+		json={
+		"email": f"user{index}@bench.net",
+		"password": PASSWORD
+		})
+	response.raise_for_status()
+	return response.json()["data"]
+
+
+def scenarios(api: str, users: int, ids: List[str],
+	sessions: List[Dict[str, str]]) -> Dict[str, Callable[[int], Request]]:
+	"""Request factories by scenario name, called with the request index."""
+	last_page = max(users // PAGE_SIZE, 1)
+
+	def bearer(i: int) -> dict:
+		return {"Authorization": f"Bearer {sessions[i % len(sessions)]['access_token']}"}
+
+	def refresh_cookie(i: int) -> dict:
+		token = sessions[i % len(sessions)]["refresh_token"]
+		return {"Cookie": f'refresh_token="Bearer {token}"'}
+
+	def login(i: int) -> Request:
+		credentials = {"email": f"user{i % users}@bench.net", "password": PASSWORD}
+		return "POST", f"{api}/auth/login", {"json": credentials}
+
+	def user_by_id(i: int) -> Request:
+		return "GET", f"{api}/user/{ids[i % len(ids)]}", {"headers": bearer(i)}
+
+	def list_users(i: int) -> Request:
+		return "GET", f"{api}/users", {"params": {"page": i % 10 + 1, "size": PAGE_SIZE}}
+
+	def search_users(i: int) -> Request:
+		return "GET", f"{api}/users", {"params": {"search_string": f"user{i % 1000}"}}
+
+	def new_users_deep(i: int) -> Request:
+		page = max(last_page - i % 10, 1)
+		return "GET", f"{api}/users/new", {"params": {"page": page, "size": PAGE_SIZE}}
+
+	def refresh(i: int) -> Request:
+		return "GET", f"{api}/auth/refresh-access", {"headers": refresh_cookie(i)}
+
+	return {
+		"login": login,
+		"user_by_id": user_by_id,
+		"users": list_users,
+		"users_search": search_users,
+		"users_new_deep": new_users_deep,
+		"refresh": refresh,
+	}
+
+
+async def drive(client: httpx.AsyncClient, make_request: Callable[[int], Request], total: int,
+	concurrency: int) -> Tuple[List[float], int, float]:
+	"""Sends `total` requests from `concurrency` workers: latencies, errors and wall time."""
+	indexes = itertools.count()
+	latencies: List[float] = []
+	errors = 0
+
+	async def worker():
+		nonlocal errors
+		while (i := next(indexes)) < total:
+			method, url, kwargs = make_request(i)
+			start = time.perf_counter()
+			response = await client.request(method, url, **kwargs)
+			elapsed = time.perf_counter() - start
+			if response.status_code >= 400:
+				errors += 1
+			else:
+				latencies.append(elapsed)
+
+	start = time.perf_counter()
+	await asyncio.gather(*(worker() for _ in range(concurrency)))
+	return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+	samples = latencies * 2 if len(latencies) == 1 else latencies or [0.0, 0.0]
+	quantiles = statistics.quantiles(samples, n=100, method="inclusive")
+	return {
+		"requests": len(latencies) + errors,
+		"errors": errors,
+		"throughput_rps": len(latencies) / elapsed,
+		"mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+		"p50_ms": quantiles[49] * 1000,
+		"p95_ms": quantiles[94] * 1000,
+		"p99_ms": quantiles[98] * 1000,
+	}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> bool:
+	"""Prints the change against a baseline, False if a scenario regressed past `threshold`%."""
+	ok = True
+	print(f"\n{'scenario':<16}{'metric':>16}{'baseline':>12}{'current':>12}{'change':>10}")
+	for name, result in results["scenarios"].items():
+		previous = baseline["scenarios"].get(name)
+		if previous is None:
+			continue
+		for metric, higher_is_better in (("throughput_rps", True), *((key, False)
+			for key in PERCENTILES)):
+			change = 0.0
+			if previous[metric]:
+				change = (result[metric] - previous[metric]) / previous[metric] * 100
+			regressed = -change > threshold if higher_is_better else change > threshold
+			ok &= not regressed
+			print(f"{name:<16}{metric:>16}{previous[metric]:>12.2f}{result[metric]:>12.2f}"
+				f"{change:>+9.1f}%{'  << regression' if regressed else ''}")
+	return ok
+
+
+def git_revision() -> str | None:
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+			capture_output=True,
+			text=True,
+			check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+async def benchmark(args) -> Dict:
+	# every request comes from the one ASGI client address, the limits would reject most
+	os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+	from loguru import logger
+
+	from app.core.config import config
+	from app.db.session import database_url
+	from app.main import app
+
+	if not args.log:
+		logger.disable("app")
+	if args.seed:
+		if not (args.ephemeral or args.force or "bench" in config.DB_NAME):
+			sys.exit(f"refusing to seed database {config.DB_NAME}, pass --force")
+		print(f"seeding {args.users} users...")
+		await seed(database_url(), args.users)
+	users, ids = await sample_ids(database_url())
+	if not users:
+		sys.exit("no users to benchmark, drop --no-seed")
+
+	results = {
+		"meta": {
+		"timestamp": datetime.now().isoformat(timespec="seconds"),
+		"revision": git_revision(),
+		"python": platform.python_version(),
+		"users": users,
+		"requests": args.requests,
+		"concurrency": args.concurrency,
+		},
+		"scenarios": {},
+	}
+	api = config.API_V1_STR
+	transport = httpx.ASGITransport(app=app)
+	async with lifespan(app):
+		async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+			sessions = [await login(client, api, i) for i in range(min(SESSIONS, users))]
+			factories = scenarios(api, users, ids, sessions)
+			for name in args.scenarios or SCENARIOS:
+				client.cookies.clear()
+				await drive(client, factories[name], args.warmup, args.concurrency)
+				latencies, errors, elapsed = await drive(client, factories[name], args.requests,
+					args.concurrency)
+				result = results["scenarios"][name] = summarize(latencies, errors, elapsed)
+				percentiles = "".join(f"{result[key]:>10.2f}" for key in PERCENTILES)
+				print(f"{name:<16}{result['throughput_rps']:>10.1f} req/s{percentiles} ms"
+					f"  (p50/p95/p99, {errors} errors)")
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument("-u", "--users", type=int, default=10_000, help="users to seed")
+	parser.add_argument("-n", "--requests", type=int, default=2000,
+		help="requests per scenario")
+	parser.add_argument("-c", "--concurrency", type=int, default=16)
+	parser.add_argument("-w", "--warmup", type=int, default=100, help="unmeasured requests")
+	parser.add_argument("-s", "--scenarios", nargs="+", choices=SCENARIOS)
+	parser.add_argument("--no-seed", dest="seed", action="store_false",
+		help="reuse the users of a previous run")
+	parser.add_argument("--ephemeral", action="store_true",
+		help="run against a temporary cluster instead of the configured database")
+	parser.add_argument("--port", type=int, default=54329,
+		help="port of the --ephemeral cluster")
+	parser.add_argument("--force", action="store_true",
+		help="allow seeding a database whose name lacks 'bench'")
+	parser.add_argument("-o", "--output", type=Path, help="results file")
+	parser.add_argument("--compare", type=Path, help="baseline results to compare against")
+	parser.add_argument("--threshold", type=float, default=10.0,
+		help="regression threshold in %%")
+	parser.add_argument("--log", action="store_true", help="keep the app's logging enabled")
+	args = parser.parse_args()
+
+	with ephemeral_postgres(args.port) if args.ephemeral else nullcontext():
+		results = asyncio.run(benchmark(args))
+
+	output = args.output or RESULTS_DIR / f"api-{datetime.now():%Y%m%d-%H%M%S}.json"
+	output.parent.mkdir(parents=True, exist_ok=True)
+	output.write_text(json.dumps(results, indent=2))
+	print(f"results written to {output}")
+
+	if args.compare and not compare(results, json.loads(args.compare.read_text()),
+		args.threshold):
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
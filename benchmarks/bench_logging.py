@@ -0,0 +1,108 @@
+"""
+Logging benchmark: the default text mode against the batched JSON mode.
+
+Output goes to /dev/null. For each mode this measures loguru calls and intercepted
+stdlib records per second, both as seen by the caller and including the time to
+drain the writer, and the latency a request that logs twice gains over no logging.
+
+	python -m benchmarks.bench_logging [-n 50000] [-r 2000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import Dict
+
+import httpx
+from fastapi import FastAPI
+from loguru import logger
+
+from app.core.config import LoggingConfig, LoggingMode
+from app.core.logging import setup_logger_from_config
+
+
+def configure(mode: LoggingMode | None):
+	logger.remove()
+	if mode is not None:
+		setup_logger_from_config(LoggingConfig(mode=mode, level="INFO"))
+	else:
+		logging.basicConfig(handlers=[logging.NullHandler()], force=True)
+
+
+def records_per_second(mode: LoggingMode, records: int) -> Dict[str, float]:
+	results = {}
+	stdlib = logging.getLogger("uvicorn.access")
+	for name, log in (
+		("loguru", lambda i: logger.info("user {} logged in from {}", i, "127.0.0.1")),
+		("stdlib", lambda i: stdlib.info("%s - \"GET /user/%s HTTP/1.1\" 200", "127.0.0.1", i)),
+	):
+		configure(mode)
+		start = time.perf_counter()
+		for i in range(records):
+			log(i)
+		called = time.perf_counter()
+		logger.remove()  # stops the sinks once everything queued is written
+		drained = time.perf_counter()
+		results[f"{name} calls/s"] = records / (called - start)
+		results[f"{name} written/s"] = records / (drained - start)
+	return results
+
+
+def request_latency(mode: LoggingMode | None, requests: int) -> Dict[str, float]:
+	app = FastAPI()
+
+	@app.get("/user/{user_id}")
+	async def get_user(user_id: int):
+		logger.info("fetching user {}", user_id)
+		logger.success("user {} retrieved", user_id)
+		return {"id": user_id}
+
+	async def run():
+		latencies = []
+		transport = httpx.ASGITransport(app=app)
+		async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+			for i in range(requests):
+				start = time.perf_counter()
+				await client.get(f"/user/{i}")
+				latencies.append(time.perf_counter() - start)
+		return latencies
+
+	configure(mode)
+	latencies = asyncio.run(run())
+	logger.remove()
+	quantiles = statistics.quantiles(latencies, n=100)
+	return {"p50 us": quantiles[49] * 1e6, "p99 us": quantiles[98] * 1e6}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument("-n", "--records", type=int, default=50_000)
+	parser.add_argument("-r", "--requests", type=int, default=2000)
+	args = parser.parse_args()
+
+	stdout = sys.stdout
+	results = {}
+	with open(os.devnull, "w") as devnull:
+		sys.stdout = devnull
+		try:
+			request_latency(None, args.requests // 10)  # warm up the app and client paths
+			baseline = request_latency(None, args.requests)
+			for mode in LoggingMode:
+				results[mode.value] = records_per_second(mode, args.records)
+				latency = request_latency(mode, args.requests)
+				for key, value in latency.items():
+					results[mode.value][f"added {key}"] = value - baseline[key]
+		finally:
+			sys.stdout = stdout
+
+	print(f"{args.records} records, {args.requests} requests logging twice")
+	print(f"{'':<20}" + "".join(f"{mode:>14}" for mode in results))
+	for key in results[LoggingMode.TEXT.value]:
+		print(f"{key:<20}" + "".join(f"{result[key]:>14,.1f}" for result in results.values()))
+
+
+if __name__ == "__main__":
+	main()
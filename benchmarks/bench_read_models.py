@@ -0,0 +1,91 @@
+"""
+Read path benchmark: ORM entities against tuple-backed `UserRow` read models.
+
+Runs against an in-memory sqlite database, the ORM overhead being measured is
+independent of the database driver.
+
+	python -m benchmarks.bench_read_models [-r 10000]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.models import Base, User, UserRow
+from app.models.base_model import gen_ulid
+from app.models.user_model import UserRoleEnum
+from app.schemas.user_schema import UserOut
+
+
+def seed(engine, rows: int):
+	with engine.begin() as conn:
+		conn.execute(User.__table__.insert(), [{
+			"id": gen_ulid(),
+			"email": f"user{i}@bench.net",
+			"alias": f"user{i}",
+			"password": "x" * 130,
+			"confirmed": True,
+			"role": UserRoleEnum.USER,
+		} for i in range(rows)])
+
+
+def fetch_orm(engine):
+	session = Session(engine)
+	return session, session.execute(select(User)).scalars().all()
+
+
+def fetch_rows(engine):
+	with engine.connect() as conn:
+		return None, list(map(UserRow._make, conn.execute(select(User.__table__))))
+
+
+def measure(fetch, engine, rows: int) -> dict:
+	gc.collect()
+	start = time.perf_counter()
+	session, items = fetch(engine)
+	fetched = time.perf_counter()
+	[UserOut.from_orm(item) for item in items]
+	serialized = time.perf_counter()
+	if session:
+		session.close()
+	del items
+
+	gc.collect()
+	tracemalloc.start()
+	session, items = fetch(engine)  # the session's identity map counts for the ORM
+	memory, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	if session:
+		session.close()
+
+	return {
+		"fetch rows/s": rows / (fetched - start),
+		"fetch + serialize rows/s": rows / (serialized - start),
+		"bytes/row": memory / rows,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument("-r", "--rows", type=int, default=10_000)
+	args = parser.parse_args()
+
+	engine = create_engine("sqlite://", poolclass=StaticPool)
+	Base.metadata.create_all(engine)
+	seed(engine, args.rows)
+
+	results = {"ORM User": measure(fetch_orm, engine, args.rows)}
+	results["UserRow"] = measure(fetch_rows, engine, args.rows)
+
+	print(f"{args.rows} rows")
+	print(f"{'':<12}" + "".join(f"{key:>28}" for key in results["UserRow"]))
+	for name, result in results.items():
+		print(f"{name:<12}" + "".join(f"{value:>28,.0f}" for value in result.values()))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,150 @@
+"""
+Security primitive micro-benchmark: the token, hashing and validation calls made on
+every request or login.
+
+Each primitive is timed over several samples with the garbage collector off, reporting
+the median and interquartile range per call. Timings are also expressed relative to a
+fixed reference workload measured in the same run, which keeps the committed baseline
+meaningful across machines.
+
+	python -m benchmarks.bench_security [--repeat 15] [--save]
+
+As a regression gate, failing when a primitive is more than BENCH_TOLERANCE percent
+(default 25) slower than the baseline:
+
+	pytest benchmarks/bench_security.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import statistics
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict
+
+import pytest
+
+BASELINE = Path(__file__).parent / "baselines" / "security.json"
+PRIMITIVES = ("create_token", "validate_token", "hash_pass", "verify_hash",
+	"compare_datetimes", "ULID.validate")
+REPEAT = 15
+MIN_SAMPLE_SECONDS = 0.05
+
+
+def reference():
+	"""Fixed mix of interpreter and hashing work the primitives are scaled by."""
+	sum(i * i for i in range(2000))
+	hashlib.pbkdf2_hmac("sha512", b"usagi", b"reference", 100)
+
+
+def primitives() -> Dict[str, Callable[[], object]]:
+	from app.core.security import create_token, hash_pass, validate_token, verify_hash
+	from app.schemas.auth_schema import TokenType
+	from app.schemas.base_schema import ULID
+	from app.utils import ulid
+	from app.utils.time_util import compare_datetimes, utc_now
+
+	user_id = ulid.new()
+	token = create_token(user_id, token_type=TokenType.ACCESS)
+	hashed = hash_pass("lunar123")
+	issued, revoked = utc_now(), utc_now() - timedelta(hours=1)
+
+	return {
+		"create_token": lambda: create_token(user_id, token_type=TokenType.ACCESS),
+		"validate_token": lambda: validate_token(token),
+		"hash_pass": lambda: hash_pass("lunar123"),
+		"verify_hash": lambda: verify_hash("lunar123", hashed),
+		"compare_datetimes": lambda: compare_datetimes(issued, "<", revoked),
+		"ULID.validate": lambda: ULID.validate(user_id),
+	}
+
+
+def _loops(timer: timeit.Timer) -> int:
+	loops = 1
+	while timer.timeit(loops) < MIN_SAMPLE_SECONDS:
+		loops *= 2
+	return loops
+
+
+def measure(fn: Callable[[], object], repeat: int = REPEAT) -> Dict[str, float]:
+	"""
+	Median and interquartile range of the time per call in ns over `repeat` samples, and
+	the median ratio to the reference, sampled alternately so both see the same load.
+	"""
+	timer, reference_timer = timeit.Timer(fn), timeit.Timer(reference)
+	loops, reference_loops = _loops(timer), _loops(reference_timer)
+	samples, ratios = [], []
+	for _ in range(repeat):
+		reference_ns = reference_timer.timeit(reference_loops) / reference_loops
+		samples.append(timer.timeit(loops) / loops * 1e9)
+		ratios.append(samples[-1] / (reference_ns * 1e9))
+	q1, median, q3 = statistics.quantiles(samples, n=4, method="inclusive")
+	return {
+		"median_ns": median,
+		"iqr_ns": q3 - q1,
+		"loops": loops,
+		"relative": statistics.median(ratios),
+	}
+
+
+def run(repeat: int = REPEAT) -> Dict:
+	return {name: measure(fn, repeat) for name, fn in primitives().items()}
+
+
+def regression(current: Dict, baseline: Dict) -> float:
+	"""Percent change of the reference-relative time, positive when slower."""
+	return (current["relative"] / baseline["relative"] - 1) * 100
+
+
+def load_baseline() -> Dict:
+	return json.loads(BASELINE.read_text())["results"]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument("-r", "--repeat", type=int, default=REPEAT, help="samples per primitive")
+	parser.add_argument("--save", action="store_true", help=f"overwrite {BASELINE.name}")
+	args = parser.parse_args()
+
+	results = run(args.repeat)
+	baseline = load_baseline() if BASELINE.exists() else {}
+	print(f"{'':<20}{'median':>14}{'iqr':>14}{'relative':>12}{'vs baseline':>14}")
+	for name, result in results.items():
+		change = f"{regression(result, baseline[name]):+.1f}%" if name in baseline else ""
+		print(f"{name:<20}{result['median_ns']:>11,.0f} ns{result['iqr_ns']:>11,.0f} ns"
+			f"{result['relative']:>12.4f}{change:>14}")
+
+	if args.save:
+		BASELINE.parent.mkdir(parents=True, exist_ok=True)
+		BASELINE.write_text(
+			json.dumps(
+				{
+				"meta": {
+				"timestamp": datetime.now().isoformat(timespec="seconds"),
+				"python": platform.python_version(),
+				"machine": platform.machine(),
+				},
+				"results": results,
+				},
+				indent=2))
+		print(f"baseline written to {BASELINE}")
+
+
+# -~-~ regression gate, collected only when this file is passed to pytest ~-~-
+@pytest.fixture(scope="module")
+def measured() -> Dict:
+	return run()
+
+
+@pytest.mark.parametrize("name", PRIMITIVES)
+def test_no_regression(name: str, measured: Dict):
+	tolerance = float(os.environ.get("BENCH_TOLERANCE", 25))
+	change = regression(measured[name], load_baseline()[name])
+	assert change <= tolerance, f"{name} is {change:.1f}% slower than the baseline"
+
+
+if __name__ == "__main__":
+	main()
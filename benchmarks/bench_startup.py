@@ -0,0 +1,98 @@
+"""
+Startup benchmark: what a fresh worker pays before it serves its first response.
+
+Each run is a new interpreter that times importing app.main, reading the config,
+building the app, its startup handlers and the first and second request to a path
+that needs no database. Medians over the runs are reported; --imports also lists the
+modules that take the longest to import, excluding their own imports.
+
+	python -m benchmarks.bench_startup [-r 10] [--path /metrics] [--imports 15]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+PHASES = ("import", "config", "create_app", "startup", "first_request", "second_request")
+
+CHILD = """
+import asyncio, json, time
+start = time.perf_counter()
+timings = {}
+
+def lap(phase):
+	global start
+	now = time.perf_counter()
+	timings[phase] = now - start
+	start = now
+
+import app.main
+lap("import")
+from app.core.config import get_config
+get_config()
+lap("config")
+application = app.main.create_app()
+lap("create_app")
+
+async def serve():
+	import httpx
+	from loguru import logger
+	await application.router.startup()
+	logger.remove()
+	lap("startup")
+	transport = httpx.ASGITransport(app=application)
+	async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+		for phase in ("first_request", "second_request"):
+			(await client.get(PATH)).raise_for_status()
+			lap(phase)
+	await application.router.shutdown()
+
+asyncio.run(serve())
+print(json.dumps(timings))
+"""
+
+
+def run_child(path: str, importtime: bool = False) -> subprocess.CompletedProcess:
+	command = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c",
+		CHILD.replace("PATH", repr(path))]
+	return subprocess.run(command, capture_output=True, text=True, check=True)
+
+
+def slowest_imports(count: int, path: str) -> List[tuple]:
+	"""`-X importtime` entries of a startup by self time, in ms."""
+	modules = []
+	for line in run_child(path, importtime=True).stderr.splitlines():
+		fields = line.removeprefix("import time:").split("|")
+		if len(fields) == 3 and fields[0].strip().isdigit():
+			modules.append((int(fields[0]) / 1000, int(fields[1]) / 1000, fields[2].strip()))
+	return sorted(modules, reverse=True)[:count]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument("-r", "--runs", type=int, default=10)
+	parser.add_argument("--path", default="/metrics", help="route requested after startup")
+	parser.add_argument("--imports", type=int, default=0, metavar="N",
+		help="list the N slowest module imports")
+	args = parser.parse_args()
+
+	runs: List[Dict[str, float]] = []
+	for _ in range(args.runs):
+		runs.append(json.loads(run_child(args.path).stdout.strip().splitlines()[-1]))
+
+	print(f"{'phase':<16}{'median':>12}{'min':>12}{'max':>12}")
+	for phase in (*PHASES, "total"):
+		values = [sum(run.values()) if phase == "total" else run[phase] for run in runs]
+		print(f"{phase:<16}" + "".join(f"{value * 1000:>9.1f} ms"
+			for value in (statistics.median(values), min(values), max(values))))
+
+	if args.imports:
+		print(f"\n{'module':<48}{'self':>12}{'cumulative':>14}")
+		for self_time, cumulative, name in slowest_imports(args.imports, args.path):
+			print(f"{name:<48}{self_time:>9.1f} ms{cumulative:>11.1f} ms")
+
+
+if __name__ == "__main__":
+	main()
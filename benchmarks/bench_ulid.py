@@ -0,0 +1,52 @@
+"""
+ULID micro-benchmark: app.utils.ulid against ulid-py.
+
+	python -m benchmarks.bench_ulid [-n 100000]
+"""
+import argparse
+import timeit
+
+import ulid as ulid_py
+
+from app.utils import ulid
+
+
+def run(number: int) -> list[tuple[str, float, float]]:
+	sample = ulid.new()
+	sample_bytes = ulid.to_bytes(sample)
+	page = [ulid.new() for _ in range(50)]
+
+	cases = [
+		("generate", lambda: ulid.new(), lambda: ulid_py.new().str),
+		("str -> bytes", lambda: ulid.to_bytes(sample), lambda: ulid_py.parse(sample).bytes),
+		("bytes -> str", lambda: ulid.from_bytes(sample_bytes),
+		lambda: ulid_py.from_bytes(sample_bytes).str),
+		("timestamp (cold)", lambda: ulid.timestamp.__wrapped__(sample),
+		lambda: ulid_py.parse(sample).timestamp().datetime),
+		("timestamp (cached)", lambda: ulid.timestamp(sample),
+		lambda: ulid_py.parse(sample).timestamp().datetime),
+		("page of 50 timestamps", lambda: ulid.timestamps(page),
+		lambda: [ulid_py.parse(i).timestamp().datetime for i in page]),
+		("validate", lambda: ulid.is_valid(sample), lambda: ulid_py.parse(sample)),
+	]
+
+	results = []
+	for name, ours, theirs in cases:
+		ours_ns = min(timeit.repeat(ours, number=number, repeat=5)) / number * 1e9
+		theirs_ns = min(timeit.repeat(theirs, number=number, repeat=5)) / number * 1e9
+		results.append((name, ours_ns, theirs_ns))
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+	parser.add_argument("-n", "--number", type=int, default=100_000)
+	args = parser.parse_args()
+
+	print(f"{'case':<24}{'app.utils.ulid':>16}{'ulid-py':>12}{'speedup':>10}")
+	for name, ours, theirs in run(args.number):
+		print(f"{name:<24}{ours:>13.0f} ns{theirs:>9.0f} ns{theirs / ours:>9.1f}x")
+
+
+if __name__ == "__main__":
+	main()
@@ -27,7 +27,6 @@ INSTALL_REQUIRES = [
 	"fastapi-cache2",
 	"python-jose",
 	"passlib",
-	"ulid-py",
 	#"sqlalchemy-utils",  #*
 	#"async-timeout",  #*
 	#"anyio",  #*
@@ -35,6 +34,7 @@ INSTALL_REQUIRES = [
 	#"httpx",  #*
 ]
 EXTRAS_REQUIRE = {
+	"brotli": ["brotli"],  # brotli compression besides gzip
 	"dev": [
 	"yapf",
 	"pydocstyle",
@@ -43,6 +43,8 @@ EXTRAS_REQUIRE = {
 	"pytest-dotenv",
 	"tox",
 	"toml",
+	"ulid-py",  # benchmarks
+	"httpx",  # benchmarks
 	]
 }
 
@@ -1 +1,21 @@
-# Fixtures go here
\ No newline at end of file
+# Fixtures go here
+import os
+
+import pytest
+
+# the settings require these; no test connects to the database
+for name, value in {
+	"DB_USER": "usagi",
+	"DB_PASS": "usagi",
+	"DB_HOST": "localhost",
+	"DB_PORT": "5432",
+	"DB_NAME": "usagi_test",
+	"SECRET_KEY": "test-secret",
+	"ENCRYPT_KEY": "test-encrypt",
+}.items():
+	os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def anyio_backend():
+	return "asyncio"
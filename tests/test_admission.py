@@ -0,0 +1,149 @@
+import asyncio
+import math
+from types import SimpleNamespace
+
+import pytest
+from starlette.middleware.cors import CORSMiddleware
+
+from app.core import admission
+from app.core.admission import AdmissionMiddleware, Limiter, Priority
+from app.core.config import config
+from app.main import create_app
+from app.utils import ewma
+
+
+class Clock:
+
+	def __init__(self):
+		self.now = 1000.0
+
+	def monotonic(self):
+		return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+	clock = Clock()
+	monkeypatch.setattr(admission, "time", clock)
+	return clock
+
+
+@pytest.fixture
+def signals(monkeypatch):
+	"""The loop lag and pool wait admission control reads, in seconds."""
+	lag, pool_wait = SimpleNamespace(value=0.0), SimpleNamespace(value=0.0)
+	monkeypatch.setattr(admission.eventloop, "lag", lag)
+	monkeypatch.setattr(admission.instrumentation, "pool_wait", pool_wait)
+	monkeypatch.setattr(config, "ADMISSION_MAX_LOOP_LAG_MS", 50.0)
+	monkeypatch.setattr(config, "ADMISSION_MAX_POOL_WAIT_MS", 100.0)
+	monkeypatch.setattr(config, "ADMISSION_BACKOFF", 0.5)
+	return SimpleNamespace(lag=lag, pool_wait=pool_wait)
+
+
+def test_priorities_share_the_limit_differently(signals):
+	limiter = Limiter(2, 4)
+	assert all(limiter.acquire(Priority.NORMAL) for _ in range(4))
+	assert not limiter.acquire(Priority.NORMAL)
+	assert limiter.acquire(Priority.HIGH) and limiter.acquire(Priority.HIGH)  # 1.5 times
+	assert not limiter.acquire(Priority.HIGH)
+	assert all(limiter.acquire(Priority.CRITICAL) for _ in range(10))
+	assert limiter.in_flight == 16
+
+
+def test_congestion_cuts_the_limit_to_what_is_in_flight(signals, clock):
+	limiter = Limiter(2, 100)
+	for _ in range(11):
+		limiter.acquire(Priority.NORMAL)
+	signals.lag.value = 0.06
+	limiter.release()
+	assert limiter.limit == 5.5  # (10 still in flight + 1) * 0.5
+	limiter.release()
+	assert limiter.limit == 5.5  # one decrease per DECREASE_INTERVAL
+	clock.now += admission.DECREASE_INTERVAL
+	signals.lag.value, signals.pool_wait.value = 0.0, 0.2
+	limiter.release()
+	assert limiter.limit == 2.75  # the lower of the limit and 9, halved
+	for _ in range(8):
+		clock.now += admission.DECREASE_INTERVAL
+		limiter.release()
+	assert limiter.limit == 2  # the minimum
+
+
+def test_a_busy_healthy_limit_grows_additively(signals):
+	limiter = Limiter(2, 10)
+	limiter.limit = 4.0
+	for _ in range(4):
+		limiter.acquire(Priority.NORMAL)
+	limiter.release()  # 4 in flight of 4
+	assert limiter.limit == 4.25
+	limiter.release()
+	limiter.release()  # 2 in flight of 4.5 isn't busy
+	assert limiter.limit == pytest.approx(4.25 + 1 / 4.25)
+	assert admission.admission_limit.labels().value == limiter.limit
+
+
+def test_the_limit_stays_under_the_maximum(signals):
+	limiter = Limiter(2, 4)
+	for _ in range(4):
+		limiter.acquire(Priority.NORMAL)
+	for _ in range(4):
+		limiter.release()
+	assert limiter.limit == 4
+
+
+def test_ewma_fades_without_samples(monkeypatch):
+	clock = Clock()
+	monkeypatch.setattr(ewma, "time", clock)
+	average = ewma.Ewma(alpha=0.5, tau=1.0)
+	average.update(1.0)
+	average.update(1.0)
+	assert average.value == 0.75
+	clock.now += 1.0
+	assert average.value == pytest.approx(0.75 / math.e)
+
+
+async def app(scope, receive, send):
+	await asyncio.sleep(0.05)
+	await send({"type": "http.response.start", "status": 200, "headers": []})
+	await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def call(middleware, path):
+	messages = []
+
+	async def send(message):
+		messages.append(message)
+
+	async def receive():
+		return {"type": "http.request", "body": b""}
+
+	await middleware({"type": "http", "method": "GET", "path": path, "headers": []}, receive,
+		send)
+	return messages[0]["status"], dict(messages[0]["headers"])
+
+
+@pytest.mark.anyio
+async def test_the_middleware_sheds_above_the_limit(signals, monkeypatch):
+	monkeypatch.setattr(config, "ADMISSION_ENABLED", True)
+	monkeypatch.setattr(config, "ADMISSION_MIN_LIMIT", 1)
+	monkeypatch.setattr(config, "ADMISSION_MAX_LIMIT", 2)
+	monkeypatch.setattr(config, "ADMISSION_RETRY_AFTER", 3)
+	middleware = AdmissionMiddleware(app, {"/health": Priority.CRITICAL})
+	assert (await call(middleware, "/users"))[0] == 200  # passes before start
+
+	admission.start()
+	try:
+		shed = admission.rejected.labels("normal").value
+		results = await asyncio.gather(*[call(middleware, "/users") for _ in range(4)],
+			call(middleware, "/health"))
+		assert [status for status, _ in results] == [200, 200, 503, 503, 200]
+		assert results[2][1][b"retry-after"] == b"3"
+		assert admission.rejected.labels("normal").value == shed + 2
+		assert admission._limiter.in_flight == 0
+	finally:
+		admission.stop()
+
+
+def test_cors_wraps_admission_so_browsers_can_read_503s():
+	order = [middleware.cls for middleware in create_app().user_middleware]  # outermost first
+	assert order.index(CORSMiddleware) < order.index(AdmissionMiddleware)
@@ -0,0 +1,85 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from benchmarks.bench_api import compare, drive, lifespan, summarize
+
+
+def result(rps, p50=10.0, p95=20.0, p99=30.0):
+	return {"throughput_rps": rps, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+
+
+def test_summarize():
+	summary = summarize([0.01, 0.02, 0.03, 0.04], errors=1, elapsed=2.0)
+	assert (summary["requests"], summary["errors"], summary["throughput_rps"]) == (5, 1, 2.0)
+	assert summary["mean_ms"] == pytest.approx(25.0)
+	assert summary["p50_ms"] == pytest.approx(25.0)
+	assert summary["p99_ms"] <= 40.0
+
+
+def test_summarize_tolerates_few_samples():
+	assert summarize([0.01], errors=0, elapsed=1.0)["p95_ms"] == pytest.approx(10.0)
+	assert summarize([], errors=3, elapsed=1.0)["p50_ms"] == 0.0
+
+
+def test_compare_flags_regressions_past_the_threshold(capsys):
+	baseline = {"scenarios": {"users": result(100.0), "gone": result(1.0)}}
+	assert compare({"scenarios": {"users": result(95.0, p99=32.0)}}, baseline, threshold=10)
+	assert not compare({"scenarios": {"users": result(80.0)}}, baseline, threshold=10)
+	assert not compare({"scenarios": {"users": result(100.0, p95=25.0)}}, baseline, 10)
+	assert compare({"scenarios": {"new": result(1.0)}}, baseline, threshold=10)
+	assert "<< regression" in capsys.readouterr().out
+
+
+def test_a_zero_baseline_is_no_change():
+	baseline = {"scenarios": {"users": result(0.0, 0.0, 0.0, 0.0)}}
+	assert compare({"scenarios": {"users": result(5.0)}}, baseline, threshold=10)
+
+
+@pytest.mark.anyio
+async def test_lifespan_builds_the_middleware_stack_before_startup():
+	app = FastAPI()
+	events = []
+
+	@app.on_event("startup")
+	async def startup():
+		events.append(("startup", app.middleware_stack is not None))
+
+	@app.on_event("shutdown")
+	async def shutdown():
+		events.append(("shutdown", True))
+
+	async with lifespan(app):
+		events.append(("serving", True))
+	assert events == [("startup", True), ("serving", True), ("shutdown", True)]
+
+
+@pytest.mark.anyio
+async def test_a_failed_startup_raises():
+	app = FastAPI()
+
+	@app.on_event("startup")
+	async def startup():
+		raise ConnectionRefusedError("no database")
+
+	with pytest.raises((RuntimeError, ConnectionRefusedError)):
+		async with lifespan(app):
+			pass
+
+
+@pytest.mark.anyio
+async def test_drive_counts_errors_and_latencies():
+	app = FastAPI()
+
+	@app.get("/items/{i}")
+	async def item(i: int):
+		return {"i": i}
+
+	def make_request(i):  # every fourth request fails validation
+		return "GET", "/items/x" if i % 4 == 0 else f"/items/{i}", {}
+
+	transport = httpx.ASGITransport(app=app)
+	async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+		latencies, errors, elapsed = await drive(client, make_request, total=20, concurrency=4)
+	assert (len(latencies), errors) == (15, 5)
+	assert elapsed > 0
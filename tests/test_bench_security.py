@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks import bench_security
+
+
+def test_regression_is_positive_when_slower():
+	assert bench_security.regression({"relative": 1.5}, {"relative": 1.0}) == pytest.approx(50)
+	assert bench_security.regression({"relative": 0.5}, {"relative": 1.0}) == pytest.approx(-50)
+
+
+def test_measure_reports_per_call_statistics(monkeypatch):
+	monkeypatch.setattr(bench_security, "MIN_SAMPLE_SECONDS", 0.001)
+	result = bench_security.measure(lambda: sum(range(100)), repeat=5)
+	assert set(result) == {"median_ns", "iqr_ns", "loops", "relative"}
+	assert result["median_ns"] > 0 and result["iqr_ns"] >= 0 and result["relative"] > 0
+	assert result["loops"] >= 1 and result["loops"] & (result["loops"] - 1) == 0  # doubled
+
+
+def test_the_baseline_covers_every_primitive():
+	assert tuple(bench_security.primitives()) == bench_security.PRIMITIVES
+	baseline = bench_security.load_baseline()
+	assert set(baseline) == set(bench_security.PRIMITIVES)
+	assert all(result["relative"] > 0 for result in baseline.values())
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import DBAPIError
+
+from app.core import budget
+from app.core.budget import BudgetedRoute
+
+
+class DriverError(Exception):
+
+	def __init__(self, sqlstate):
+		self.sqlstate = sqlstate
+
+
+@pytest.fixture
+def discarded(monkeypatch):
+	calls = []
+
+	async def discard():
+		calls.append(1)
+
+	monkeypatch.setattr(budget, "_discard_connection", discard)
+	return calls
+
+
+@pytest.fixture
+def client():
+	router = APIRouter(route_class=BudgetedRoute)
+
+	@router.get("/slow")
+	@budget.budget(0.05)
+	async def slow():
+		await asyncio.sleep(1)
+
+	@router.get("/fast")
+	@budget.budget(1.0)
+	async def fast():
+		return {"left": budget._deadline.get() - time.monotonic()}
+
+	@router.get("/unbudgeted")
+	async def unbudgeted():
+		return {"deadline": budget._deadline.get()}
+
+	@router.get("/statement/{sqlstate}")
+	@budget.budget(1.0)
+	async def statement(sqlstate: str):
+		raise DBAPIError("SELECT pg_sleep(10)", None, DriverError(sqlstate))
+
+	app = FastAPI()
+	app.include_router(router)
+	return TestClient(app, raise_server_exceptions=False)
+
+
+def test_a_spent_budget_is_a_504(client, discarded):
+	timeouts = budget.exceeded.labels("/slow", "timeout").value
+	started = time.monotonic()
+	response = client.get("/slow")
+	assert response.status_code == 504
+	assert response.json()["detail"] == "the request exceeded its 50ms budget"
+	assert time.monotonic() - started < 0.5
+	assert discarded == [1]  # its connection may be mid-statement
+	assert budget.exceeded.labels("/slow", "timeout").value == timeouts + 1
+
+
+def test_routes_within_budget_see_their_deadline(client, discarded):
+	response = client.get("/fast")
+	assert response.status_code == 200 and 0 < response.json()["left"] <= 1.0
+	assert client.get("/unbudgeted").json() == {"deadline": None}
+	assert discarded == []
+
+
+def test_a_cancelled_statement_is_a_503(client, discarded):
+	response = client.get(f"/statement/{budget.QUERY_CANCELED}")
+	assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+	assert discarded == []
+	assert client.get("/statement/23505").status_code == 500  # other errors pass through
+
+
+class Connection:
+
+	def __init__(self, dialect):
+		self.dialect = SimpleNamespace(name=dialect)
+		self.statements = []
+
+	def exec_driver_sql(self, statement):
+		self.statements.append(statement)
+
+
+def test_transactions_get_the_budget_left_as_statement_timeout():
+	postgres, sqlite = Connection("postgresql"), Connection("sqlite")
+	budget._set_statement_timeout(None, None, postgres)
+	assert postgres.statements == []  # outside a budgeted route
+
+	token = budget._deadline.set(time.monotonic() + 1.0)
+	try:
+		budget._set_statement_timeout(None, None, postgres)
+		budget._set_statement_timeout(None, None, sqlite)
+	finally:
+		budget._deadline.reset(token)
+	[statement] = postgres.statements
+	assert statement.startswith("SET LOCAL statement_timeout = ")
+	assert 900 <= int(statement.rsplit(" ", 1)[1]) <= 950  # minus STATEMENT_MARGIN
+	assert sqlite.statements == []
@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import APIRouter, FastAPI
+
+from app.core.coalesce import CoalescingRoute, SingleFlight, coalesced
+
+
+class Computation:
+	"""Counts its runs; each run waits for `release`."""
+
+	def __init__(self, result="done"):
+		self.result = result
+		self.runs = 0
+		self.started = asyncio.Event()
+		self.release = asyncio.Event()
+
+	async def __call__(self):
+		self.runs += 1
+		self.started.set()
+		await self.release.wait()
+		if isinstance(self.result, Exception):
+			raise self.result
+		return self.result
+
+
+@pytest.mark.anyio
+async def test_followers_share_the_leaders_result():
+	flights, compute, shared = SingleFlight(), Computation(), []
+	calls = [asyncio.create_task(flights.do("k", compute, lambda: shared.append(1)))
+		for _ in range(3)]
+	await compute.started.wait()
+	compute.release.set()
+	assert await asyncio.gather(*calls) == ["done"] * 3
+	assert compute.runs == 1 and len(shared) == 2
+	assert flights.flights == {}
+
+
+@pytest.mark.anyio
+async def test_keys_fly_separately():
+	flights, compute = SingleFlight(), Computation()
+	compute.release.set()
+	assert await asyncio.gather(flights.do("a", compute), flights.do("b", compute)) == ["done"] * 2
+	assert compute.runs == 2
+
+
+@pytest.mark.anyio
+async def test_errors_reach_every_caller():
+	flights, compute = SingleFlight(), Computation(ValueError("boom"))
+	calls = [asyncio.create_task(flights.do("k", compute)) for _ in range(2)]
+	await compute.started.wait()
+	compute.release.set()
+	results = await asyncio.gather(*calls, return_exceptions=True)
+	assert [type(result) for result in results] == [ValueError, ValueError]
+	assert compute.runs == 1 and flights.flights == {}
+
+
+@pytest.mark.anyio
+async def test_a_cancelled_leader_hands_over_to_a_follower():
+	flights, compute = SingleFlight(), Computation()
+	leader = asyncio.create_task(flights.do("k", compute))
+	await compute.started.wait()
+	follower = asyncio.create_task(flights.do("k", compute))
+	await asyncio.sleep(0)
+	compute.started.clear()
+	leader.cancel()
+	await compute.started.wait()  # the follower leads a new flight
+	compute.release.set()
+	assert await follower == "done"
+	assert leader.cancelled() and compute.runs == 2
+
+
+@pytest.mark.anyio
+async def test_a_cancelled_follower_leaves_the_flight_alone():
+	flights, compute = SingleFlight(), Computation()
+	leader = asyncio.create_task(flights.do("k", compute))
+	await compute.started.wait()
+	follower = asyncio.create_task(flights.do("k", compute))
+	await asyncio.sleep(0)
+	follower.cancel()
+	await asyncio.sleep(0)
+	compute.release.set()
+	assert await leader == "done"
+	assert follower.cancelled() and compute.runs == 1
+
+
+@pytest.mark.anyio
+async def test_coalescing_route_runs_identical_gets_once():
+	runs = []
+	router = APIRouter(route_class=CoalescingRoute)
+
+	@router.get("/count")
+	@coalesced()
+	async def count(q: int = 0):
+		runs.append(q)
+		await asyncio.sleep(0.05)
+		return {"count": len(runs)}
+
+	@router.get("/mine")
+	@coalesced(per_user=True)
+	async def mine():
+		runs.append("mine")
+		await asyncio.sleep(0.05)
+		return {}
+
+	app = FastAPI()
+	app.include_router(router)
+	transport = httpx.ASGITransport(app=app)
+	async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+		responses = await asyncio.gather(*[client.get("/count") for _ in range(5)],
+			client.get("/count?q=1"))
+		assert [r.json() for r in responses[:5]] == [responses[0].json()] * 5
+		assert sorted(runs) == [0, 1]
+		assert responses[0].headers["content-type"] == "application/json"
+
+		runs.clear()
+		await asyncio.gather(*[
+			client.get("/mine", headers={"Authorization": f"Bearer {user}"})
+			for user in ("a", "a", "b")
+		])
+		assert runs == ["mine", "mine"]
@@ -0,0 +1,241 @@
+import asyncio
+import gzip
+import json
+import os
+
+import pytest
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+from app.core import compression
+from app.core.compression import CompressionMiddleware, negotiate
+from app.core.config import config
+from app.core.static import IMMUTABLE, CachedStaticFiles, precompress
+
+BIG = {"users": [{"alias": f"user{i}", "role": "USER"} for i in range(200)]}
+
+
+@pytest.mark.parametrize("accept, expected", [
+	("gzip", "gzip"),
+	("deflate, gzip;q=0.5", "gzip"),
+	("gzip;q=0", None),
+	("identity", None),
+	("", None),
+	("*", "gzip"),
+	("*;q=0.5, gzip;q=0", None),
+	("GZIP; Q=0.8", "gzip"),
+	("gzip;q=oops", None),
+])
+def test_negotiate_gzip(accept, expected):
+	assert negotiate(accept, ("gzip", )) == expected
+
+
+def test_negotiate_prefers_the_highest_weight_then_the_server_order():
+	assert negotiate("gzip, br", ("br", "gzip")) == "br"
+	assert negotiate("gzip, br;q=0.9", ("br", "gzip")) == "gzip"
+	assert negotiate("br;q=0, *", ("br", "gzip")) == "gzip"
+	assert negotiate("gzip", ()) is None
+
+
+def test_compressible_types():
+	assert compression.compressible("text/html; charset=utf-8")
+	assert compression.compressible("application/problem+json")
+	assert not compression.compressible("image/png")
+	assert not compression.compressible("")
+
+
+def test_streamed_compression_decodes_to_the_input():
+	compressor = compression.Compressor("gzip")
+	parts = [compressor.compress(b"abc" * 100, flush=True), compressor.finish(b"def")]
+	assert parts[0]  # flushed, a client can decode it before the end
+	assert gzip.decompress(b"".join(parts)) == b"abc" * 100 + b"def"
+	assert gzip.decompress(compression.compress(b"xyz", "gzip")) == b"xyz"
+
+
+def receiver():
+	"""The request's empty body, then nothing until the response is done."""
+	received = []
+
+	async def receive():
+		if received:
+			await asyncio.Event().wait()
+		received.append(1)
+		return {"type": "http.request", "body": b""}
+
+	return receive
+
+
+async def call(app, headers=(("accept-encoding", "gzip"), )):
+	messages = []
+
+	receive = receiver()
+
+	async def send(message):
+		messages.append(message)
+
+	scope = {
+		"type": "http",
+		"method": "GET",
+		"path": "/",
+		"query_string": b"",
+		"headers": [(name.encode(), value.encode()) for name, value in headers],
+	}
+	await app(scope, receive, send)
+	start = messages[0]
+	bodies = [message for message in messages[1:] if message["type"] == "http.response.body"]
+	return start["status"], {
+		name.decode().lower(): value.decode()
+		for name, value in start["headers"]
+	}, bodies
+
+
+def body_of(headers, bodies):
+	body = b"".join(message.get("body", b"") for message in bodies)
+	return gzip.decompress(body) if headers.get("content-encoding") == "gzip" else body
+
+
+def middleware(response, minimum_size=1024):
+	return CompressionMiddleware(response, minimum_size=minimum_size)
+
+
+@pytest.mark.anyio
+async def test_large_responses_are_compressed_with_a_weak_etag():
+	status, headers, bodies = await call(
+		middleware(JSONResponse(BIG, headers={"ETag": '"abc"'})))
+	assert headers["content-encoding"] == "gzip" and headers["vary"] == "Accept-Encoding"
+	assert headers["etag"] == 'W/"abc"'
+	assert int(headers["content-length"]) == len(bodies[0]["body"])
+	assert json.loads(body_of(headers, bodies)) == BIG
+
+
+@pytest.mark.anyio
+async def test_responses_that_dont_qualify_pass_untouched():
+	small = JSONResponse({"a": 1}, headers={"ETag": '"abc"'})
+	for app, headers in [
+		(small, (("accept-encoding", "gzip"), )),
+		(JSONResponse(BIG), (("accept-encoding", "identity"), )),
+		(Response(b"x" * 4096, media_type="image/png"), (("accept-encoding", "gzip"), )),
+		(Response(b"x" * 4096, media_type="text/plain", headers={"Content-Encoding": "br"}),
+		(("accept-encoding", "gzip"), )),
+		(Response(status_code=304, headers={"ETag": '"abc"'}), (("accept-encoding", "gzip"), )),
+	]:
+		_, response_headers, _ = await call(middleware(app), headers)
+		assert "content-encoding" not in response_headers or (
+			response_headers["content-encoding"] == "br")
+		assert response_headers.get("etag", '"abc"') == '"abc"'
+
+
+async def chunks(*parts):
+	for part in parts:
+		yield part
+
+
+@pytest.mark.anyio
+async def test_streams_are_compressed_and_flushed_per_message():
+	parts = [b'{"line": %d}\n' % i * 100 for i in range(3)]  # each above the minimum
+	app = StreamingResponse(chunks(*parts), media_type="application/x-ndjson")
+	_, headers, bodies = await call(middleware(app))
+	assert headers["content-encoding"] == "gzip" and "content-length" not in headers
+	assert [bool(message.get("more_body")) for message in bodies] == [True, True, True, False]
+	assert body_of(headers, bodies) == b"".join(parts)
+
+
+@pytest.mark.anyio
+async def test_small_streams_are_buffered_and_sent_as_is():
+	app = StreamingResponse(chunks(b"a" * 100, b"b" * 100), media_type="text/plain")
+	_, headers, bodies = await call(middleware(app))
+	assert "content-encoding" not in headers
+	assert [message["body"] for message in bodies] == [b"a" * 100 + b"b" * 100]
+
+
+@pytest.mark.anyio
+async def test_a_stream_is_held_only_until_the_minimum_size():
+	app = StreamingResponse(chunks(b"a" * 600, b"b" * 600, b"c" * 600), media_type="text/plain")
+	_, headers, bodies = await call(middleware(app))
+	assert headers["content-encoding"] == "gzip"
+	assert len(bodies) == 3  # the first two parts go out together
+	assert body_of(headers, bodies) == b"a" * 600 + b"b" * 600 + b"c" * 600
+
+
+@pytest.mark.anyio
+async def test_responses_behind_base_http_middleware_are_compressed():
+
+	async def passthrough(request, call_next):
+		return await call_next(request)
+
+	app = BaseHTTPMiddleware(JSONResponse(BIG), dispatch=passthrough)
+	_, headers, bodies = await call(middleware(app))
+	assert headers["content-encoding"] == "gzip"
+	assert json.loads(body_of(headers, bodies)) == BIG
+
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+	monkeypatch.setattr(config, "STATIC_CACHE_MAX_FILE_SIZE", 1 << 20)
+	monkeypatch.setattr(config, "STATIC_MAX_AGE", 60)
+	(tmp_path / "app.js").write_text("console.log('usagi');\n" * 200)
+	(tmp_path / "tiny.css").write_text("a{}")
+	assert precompress(tmp_path, minimum_size=1024) == len(compression.ENCODINGS)
+	assert not (tmp_path / "tiny.css.gz").exists()
+	return CachedStaticFiles(directory=tmp_path)
+
+
+async def get_static(files, path, query="", **headers):
+	messages = []
+
+	receive = receiver()
+
+	async def send(message):
+		messages.append(message)
+
+	scope = {
+		"type": "http",
+		"method": "GET",
+		"path": f"/{path}",
+		"root_path": "",
+		"query_string": query.encode(),
+		"headers": [(name.replace("_", "-").encode(), value.encode())
+			for name, value in headers.items()],
+	}
+	await files(scope, receive, send)
+	headers = {name.decode(): value.decode() for name, value in messages[0]["headers"]}
+	return messages[0]["status"], headers, messages[1].get("body", b"")
+
+
+@pytest.mark.anyio
+async def test_static_files_serve_their_precompressed_variant(static):
+	identity = (static.directory / "app.js").read_bytes()
+	status, headers, body = await get_static(static, "app.js")
+	assert status == 200 and body == identity and "content-encoding" not in headers
+	etag = headers["etag"]
+	assert not etag.startswith("W/") and headers["vary"] == "Accept-Encoding"
+
+	status, headers, body = await get_static(static, "app.js", accept_encoding="gzip")
+	assert headers["content-encoding"] == "gzip" and headers["etag"] == f"W/{etag}"
+	assert gzip.decompress(body) == identity
+
+
+@pytest.mark.anyio
+async def test_static_files_revalidate_with_either_etag(static):
+	_, headers, _ = await get_static(static, "app.js")
+	for etag in (headers["etag"], f"W/{headers['etag']}"):
+		status, headers_304, body = await get_static(static, "app.js", if_none_match=etag,
+			accept_encoding="gzip")
+		assert status == 304 and body == b"" and headers_304["etag"] == f"W/{headers['etag']}"
+
+
+@pytest.mark.anyio
+async def test_versioned_urls_are_immutable(static):
+	url = static.versioned("app.js")
+	path, _, query = url.removeprefix("/static/").partition("?")
+	_, headers, _ = await get_static(static, path, query)
+	assert headers["cache-control"] == IMMUTABLE
+	_, headers, _ = await get_static(static, path, "v=stale")
+	assert headers["cache-control"] == "public, max-age=60"
+	assert static.versioned("missing.js") == "/static/missing.js"
+
+
+def test_a_stale_variant_is_ignored(static):
+	source = static.directory / "app.js"
+	os.utime(source.with_name("app.js.gz"), (0, 0))
+	assert "gzip" not in static._lookup("app.js").variants
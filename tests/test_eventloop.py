@@ -0,0 +1,66 @@
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+from loguru import logger
+
+from app.core import eventloop
+from app.core.config import config
+from app.utils.ewma import Ewma
+
+
+@pytest.fixture
+def warnings():
+	messages = []
+	handler = logger.add(lambda message: messages.append(message.record["message"]),
+		level="WARNING")
+	yield messages
+	logger.remove(handler)
+
+
+def handle(scope):
+	return inner()
+
+
+def inner():
+	return eventloop.serving(sys._getframe())
+
+
+def test_serving_names_the_innermost_request():
+	request = {"type": "http", "method": "GET", "path": "/users/01ID"}
+	assert handle(request) == "GET /users/01ID"
+	request["route"] = SimpleNamespace(path="/users/{user_id}")
+	assert handle(request) == "GET /users/{user_id}"
+	assert handle({"type": "lifespan"}) == "-"
+	assert inner() == "-"
+
+
+def blocking_endpoint(scope):
+	time.sleep(0.3)  # a synchronous call on the loop
+
+
+@pytest.mark.anyio
+async def test_a_blocked_loop_is_measured_and_reported(warnings, monkeypatch):
+	monkeypatch.setattr(eventloop, "lag", Ewma())
+	monkeypatch.setattr(config, "LOOP_LAG_INTERVAL", 0.01)
+	monkeypatch.setattr(config, "LOOP_BLOCK_THRESHOLD_MS", 100.0)
+	monkeypatch.setattr(config, "LOOP_DEBUG", False)
+	stalls = eventloop.stalls.labels("GET /slow").value
+	lag_sum = eventloop.lag_seconds.labels().sum
+	eventloop.start()
+	try:
+		await asyncio.sleep(0.05)
+		assert eventloop.lag.value < 0.05
+		blocking_endpoint({"type": "http", "method": "GET", "path": "/slow"})
+		await asyncio.sleep(0.02)
+		assert eventloop.lag.value > 0.01
+		assert eventloop.lag_seconds.labels().sum - lag_sum > 0.25
+	finally:
+		eventloop.stop()
+
+	[report] = [message for message in warnings if message.startswith("event loop blocked")]
+	assert "serving GET /slow" in report and "blocking_endpoint" in report
+	assert eventloop.stalls.labels("GET /slow").value == stalls + 1
+	assert eventloop._task is None and eventloop._watchdog is None
@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from app.api.v1.endpoints.admin import _csv_chunks, _ndjson_chunks
+from app.models import User
+from app.models.user_model import UserRoleEnum, UserRow
+from app.schemas.user_schema import UserOutFull
+from app.utils import ulid
+
+
+def user_row(alias):
+	values = {
+		"id": ulid.new(),
+		"email": f"{alias}@example.com",
+		"alias": alias,
+		"password": "hash",
+		"last_login": datetime(2024, 1, 1),
+		"revoked_at": None,
+		"confirmed": True,
+		"role": UserRoleEnum.USER,
+	}
+	return UserRow._make(values[column.key] for column in User.__table__.columns)
+
+
+async def partitions(*sizes):
+	count = 0
+	for size in sizes:
+		yield [user_row(f"user{count + i}") for i in range(size)]
+		count += size
+
+
+async def collect(chunks):
+	return [chunk async for chunk in chunks]
+
+
+@pytest.mark.anyio
+async def test_ndjson_is_a_chunk_per_partition():
+	chunks = await collect(_ndjson_chunks(partitions(2, 3)))
+	assert len(chunks) == 2
+	lines = "".join(chunks).splitlines()
+	assert [json.loads(line)["alias"] for line in lines] == [f"user{i}" for i in range(5)]
+	assert "password" not in json.loads(lines[0])
+
+
+@pytest.mark.anyio
+async def test_csv_has_one_header_and_a_row_per_user():
+	chunks = await collect(_csv_chunks(partitions(2, 1)))
+	assert len(chunks) == 2
+	rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+	assert list(rows[0]) == list(UserOutFull.__fields__)
+	assert [row["alias"] for row in rows] == ["user0", "user1", "user2"]
+	assert rows[0]["revoked_at"] == ""
+
+
+@pytest.mark.anyio
+async def test_an_empty_csv_export_still_has_its_header():
+	chunks = await collect(_csv_chunks(partitions()))
+	assert "".join(chunks).strip() == ",".join(UserOutFull.__fields__)
+	assert await collect(_ndjson_chunks(partitions())) == []
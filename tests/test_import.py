@@ -0,0 +1,126 @@
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+
+from app import crud
+from app.api.v1.endpoints import admin
+from app.core.config import config
+from app.schemas.admin_schema import AdminImportUser, ExportFormatEnum
+
+ADMIN = SimpleNamespace(alias="admin", id="01ARZ3NDEKTSV4RRFFQ69G5FAV")
+
+
+def ndjson(*users):
+	return "\n".join(json.dumps(user) for user in users)
+
+
+def user(alias, **fields):
+	return {"email": f"{alias}@example.com", "alias": alias, "password": "secret1", **fields}
+
+
+@pytest.fixture
+def imported(monkeypatch):
+	"""Records what reaches the database; the alias "taken" conflicts there."""
+	calls = []
+
+	async def hash_pass_many(passwords):
+		return [f"hash:{password}" for password in passwords]
+
+	async def import_users(*, users):
+		calls.append(users)
+		return [(line, "email or alias already taken") for line, data, _ in users
+			if data.alias == "taken"]
+
+	monkeypatch.setattr(admin, "hash_pass_many", hash_pass_many)
+	monkeypatch.setattr(crud.user, "import_users", import_users)
+	return calls
+
+
+async def upload(content, filename="users.ndjson", format=None):
+	file = UploadFile(io.BytesIO(content.encode()), filename=filename)
+	response = await admin.import_users(file=file, format=format, current_user=ADMIN)
+	return response["data"]
+
+
+def test_ndjson_rows():
+	rows = list(admin._import_rows('{"a": 1}\n\n[1]\nnot json\n', ExportFormatEnum.NDJSON))
+	assert rows == [(1, {"a": 1}, None), (3, None, "invalid json object"),
+		(4, None, "invalid json object")]
+
+
+def test_csv_rows_drop_empty_values_and_report_extra_fields():
+	content = "email,alias\na@example.com,\nb@example.com,bee,extra\n"
+	rows = list(admin._import_rows(content, ExportFormatEnum.CSV))
+	assert rows == [(2, {"email": "a@example.com"}, None), (3, None, "unexpected extra fields")]
+
+
+def test_malformed_csv_is_a_bad_request():
+	with pytest.raises(HTTPException) as raised:
+		list(admin._import_rows("email\n" + "a" * (1 << 18), ExportFormatEnum.CSV))  # > field limit
+	assert raised.value.status_code == 400
+
+
+def test_admins_cannot_be_imported():
+	assert AdminImportUser(**user("bunny", role="moderator")).role == "MODERATOR"
+	with pytest.raises(ValidationError):
+		AdminImportUser(**user("bunny", role="admin"))
+
+
+@pytest.mark.anyio
+async def test_duplicates_and_invalid_lines_are_reported_per_line(imported):
+	content = ndjson(
+		user("first"),
+		user("second", email="FIRST@example.com"),
+		user("first", email="other@example.com"),
+		user("3bad"),
+		user("taken"),
+	)
+	report = await upload(content + "\n{oops")
+	assert report["received"] == 6 and report["imported"] == 1
+	assert [error["line"] for error in report["errors"]] == [2, 3, 4, 5, 6]
+	assert report["errors"][0]["error"] == "duplicate email address in this file"
+	assert report["errors"][1]["error"] == "duplicate alias in this file"
+	assert report["errors"][2]["error"].startswith("alias:")
+	assert report["errors"][3]["error"] == "email or alias already taken"
+	[users] = imported
+	assert [(line, data.alias, password) for line, data, password in users] == [
+		(1, "first", "hash:secret1"), (5, "taken", "hash:secret1")]
+
+
+@pytest.mark.anyio
+async def test_the_format_follows_the_file_name(imported):
+	report = await upload("email,alias,password\nc@example.com,carrot,secret1\n", "users.CSV")
+	assert (report["received"], report["imported"]) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_nothing_valid_skips_the_database(imported):
+	report = await upload("{oops}")
+	assert report["failed"] == 1 and imported == []
+
+
+@pytest.mark.anyio
+async def test_limits(imported, monkeypatch):
+	monkeypatch.setattr(config, "IMPORT_MAX_BYTES", 10)
+	with pytest.raises(HTTPException) as raised:
+		await upload(ndjson(user("carrot")))
+	assert raised.value.status_code == 413
+
+	monkeypatch.setattr(config, "IMPORT_MAX_BYTES", 1 << 20)
+	monkeypatch.setattr(config, "IMPORT_MAX_ROWS", 1)
+	with pytest.raises(HTTPException) as raised:
+		await upload(ndjson(user("carrot"), user("turnip")))
+	assert raised.value.status_code == 413
+	assert imported == []
+
+
+@pytest.mark.anyio
+async def test_uploads_must_be_utf8(imported):
+	file = UploadFile(io.BytesIO(b"\xff\xfe"), filename="users.ndjson")
+	with pytest.raises(HTTPException) as raised:
+		await admin.import_users(file=file, format=None, current_user=ADMIN)
+	assert raised.value.status_code == 400
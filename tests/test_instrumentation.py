@@ -0,0 +1,96 @@
+import pytest
+from loguru import logger
+from sqlalchemy import create_engine, text
+
+from app.core.config import config
+from app.db import instrumentation
+from app.db.instrumentation import QueryStats, QueryStatsMiddleware, normalize
+
+
+@pytest.fixture
+def logs():
+	messages = []
+	handler = logger.add(lambda message: messages.append(message.record["message"]), level="INFO")
+	yield messages
+	logger.remove(handler)
+
+
+@pytest.fixture
+def engine():
+	instrumentation.install()
+	instrumentation.install()  # idempotent
+	engine = create_engine("sqlite://")
+	yield engine
+	engine.dispose()
+
+
+def test_normalize_groups_similar_statements():
+	assert normalize("SELECT *\n  FROM t WHERE a = 'x''y' AND b = 1.5") == (
+		"SELECT * FROM t WHERE a = ? AND b = ?")
+	assert normalize("SELECT 1 WHERE id IN ($1, $2, $3)") == "SELECT ? WHERE id IN (...)"
+	assert normalize("SELECT 2 WHERE id IN (?, ?)") == normalize("SELECT 3 WHERE id IN (?, ?, ?)")
+
+
+def test_stats_keep_the_slowest_statement():
+	stats = QueryStats(track_statements=True)
+	stats.record("a", 0.1)
+	stats.record("b", 0.3)
+	stats.record("a", 0.2)
+	assert (stats.count, round(stats.duration, 6)) == (3, 0.6)
+	assert (stats.slowest, stats.slowest_statement) == (0.3, "b")
+	assert stats.statements == {"a": 2, "b": 1}
+	assert QueryStats().statements is None
+
+
+async def receive():
+	return {"type": "http.request", "body": b""}
+
+
+@pytest.mark.anyio
+async def test_middleware_attributes_statements_to_the_request(engine, logs, monkeypatch):
+	monkeypatch.setattr(config, "DB_N_PLUS_ONE_THRESHOLD", 3)
+	monkeypatch.setattr(config, "DB_SLOW_QUERY_MS", 1e9)
+	seen = []
+
+	async def app(scope, receive, send):
+		with engine.connect() as connection:
+			for i in range(3):
+				connection.execute(text(f"SELECT {i}"))
+			connection.execute(text("SELECT 'other'"))
+		seen.append(instrumentation.current_stats())
+		await send({"type": "http.response.start", "status": 200, "headers": []})
+		await send({"type": "http.response.body", "body": b""})
+
+	messages = []
+
+	async def send(message):
+		messages.append(message)
+
+	scope = {"type": "http", "method": "GET", "path": "/users"}
+	await QueryStatsMiddleware(app)(scope, receive, send)
+	assert seen[0].count == 4
+	assert instrumentation.current_stats() is None
+	timing = dict(messages[0]["headers"])[b"server-timing"].decode()
+	assert timing.startswith('db;dur=') and 'desc="4 queries"' in timing
+	assert any(line.startswith("GET /users 200") and "db=4q" in line for line in logs)
+	assert not any("N+1" in line for line in logs)  # three different literals, one each
+
+
+@pytest.mark.anyio
+async def test_repeated_statements_and_slow_queries_are_logged(engine, logs, monkeypatch):
+	monkeypatch.setattr(config, "DB_N_PLUS_ONE_THRESHOLD", 3)
+	monkeypatch.setattr(config, "DB_SLOW_QUERY_MS", 0)
+	slow = instrumentation.slow_queries.labels().value
+
+	async def app(scope, receive, send):
+		with engine.connect() as connection:
+			for i in range(3):
+				connection.execute(text("SELECT :id"), {"id": i})
+		await send({"type": "http.response.start", "status": 200, "headers": []})
+
+	async def send(message):
+		pass
+
+	await QueryStatsMiddleware(app)({"type": "http", "method": "GET", "path": "/"}, receive, send)
+	assert any("possible N+1 in GET /: 3 identical statements" in line for line in logs)
+	assert instrumentation.slow_queries.labels().value == slow + 3
@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+import asyncpg
+import pytest
+from loguru import logger
+
+from app.core.config import config
+from app.db import invalidation
+
+
+@pytest.fixture(autouse=True)
+def handlers():
+	yield
+	invalidation.unsubscribe_all()
+
+
+@pytest.fixture
+def errors():
+	messages = []
+	handler = logger.add(lambda message: messages.append(message.record["message"]),
+		level="WARNING")
+	yield messages
+	logger.remove(handler)
+
+
+class Session:
+
+	def __init__(self, dialect: str):
+		self.dialect = dialect
+		self.executed = []
+
+	def get_bind(self):
+		return SimpleNamespace(dialect=SimpleNamespace(name=self.dialect))
+
+	async def execute(self, statement, params):
+		self.executed.append((str(statement), params))
+
+
+@pytest.mark.anyio
+async def test_publish_notifies_on_postgresql_only(monkeypatch):
+	monkeypatch.setattr(config, "DB_NOTIFY_CHANNEL", "test_channel")
+	sqlite, postgres = Session("sqlite"), Session("postgresql")
+	await invalidation.publish(sqlite, "app_users", "01ID")
+	await invalidation.publish(postgres, "app_users", "01ID")
+	assert sqlite.executed == []
+	[(statement, params)] = postgres.executed
+	assert "pg_notify" in statement and params["channel"] == "test_channel"
+	table, id, version = params["payload"].split(":")
+	assert (table, id) == ("app_users", "01ID") and int(version) > 0
+
+
+@pytest.mark.anyio
+async def test_notifications_reach_the_table_handlers(errors):
+	changes = []
+
+	async def on_change(id, version):
+		changes.append((id, version))
+
+	async def failing(id, version):
+		raise RuntimeError("handler bug")
+
+	invalidation.subscribe("app_users", on_change)
+	invalidation.subscribe("app_users", failing)
+	invalidation._dispatch(None, 1, "channel", "app_users:01ID:42")
+	invalidation._dispatch(None, 1, "channel", "other_table:01ID:43")
+	invalidation._dispatch(None, 1, "channel", "garbage")
+	await asyncio.gather(*invalidation._pending, return_exceptions=True)
+	await asyncio.sleep(0)  # the done callbacks
+
+	assert changes == [("01ID", 42)]
+	assert not invalidation._pending
+	assert any("malformed" in message for message in errors)
+	assert "invalidation handler failed" in errors
+
+
+class Connection:
+
+	def __init__(self, dead: bool):
+		self.dead = dead
+		self.listeners = []
+		self.terminated = False
+
+	async def add_listener(self, channel, callback):
+		self.listeners.append((channel, callback))
+
+	async def fetchval(self, query, timeout):
+		if self.dead:
+			raise asyncpg.InterfaceError("connection lost")
+		return 1
+
+	def terminate(self):
+		self.terminated = True
+
+
+@pytest.mark.anyio
+async def test_listen_reconnects_and_resyncs(monkeypatch):
+	monkeypatch.setattr(config, "DB_LISTEN_KEEPALIVE", 0.001)
+	monkeypatch.setattr(invalidation.random, "uniform", lambda a, b: 0.0)
+	outcomes = [OSError("refused"), Connection(dead=True), Connection(dead=False)]
+	connections = [outcome for outcome in outcomes if isinstance(outcome, Connection)]
+	resynced = asyncio.Event()
+	resyncs = []
+
+	async def connect(dsn, timeout):
+		outcome = outcomes.pop(0)
+		if isinstance(outcome, Exception):
+			raise outcome
+		return outcome
+
+	async def on_resync():
+		resyncs.append(len(outcomes))
+		if not outcomes:
+			resynced.set()
+
+	async def on_change(id, version):
+		pass
+
+	monkeypatch.setattr(invalidation.asyncpg, "connect", connect)
+	invalidation.subscribe("app_users", on_change, on_resync)
+	reconnects = invalidation.reconnects.labels().value
+	listener = asyncio.create_task(invalidation.listen("postgresql://test"))
+	await asyncio.wait_for(resynced.wait(), 5)
+	listener.cancel()
+	with pytest.raises(asyncio.CancelledError):
+		await listener
+
+	assert resyncs == [1, 0]  # once per connection
+	assert invalidation.reconnects.labels().value == reconnects + 1
+	assert all(connection.terminated for connection in connections)
+	assert connections[1].listeners == [(config.DB_NOTIFY_CHANNEL, invalidation._dispatch)]
@@ -0,0 +1,128 @@
+import asyncio
+from contextlib import nullcontext
+
+import pytest
+
+from app.core import jobs
+from app.core.config import config
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+	monkeypatch.setattr(jobs, "db", nullcontext)  # handlers here don't touch the database
+	monkeypatch.setattr(jobs, "_handlers", {})
+	monkeypatch.setattr(jobs, "_queue", None)
+	monkeypatch.setattr(config, "JOB_QUEUE_SIZE", 100)
+	monkeypatch.setattr(config, "JOB_BATCH_SIZE", 100)
+	monkeypatch.setattr(config, "JOB_MAX_ATTEMPTS", 3)
+	monkeypatch.setattr(config, "JOB_RETRY_SECONDS", 0.01)
+	monkeypatch.setattr(config, "JOB_DRAIN_SECONDS", 1.0)
+
+
+def recorder(kind: str, fail_times: int = 0):
+	"""A handler recording its batches, failing the first `fail_times` calls."""
+	batches = []
+
+	@jobs.handler(kind)
+	async def handle(payloads):
+		batches.append(payloads)
+		if len(batches) <= fail_times:
+			raise RuntimeError(f"{kind} failed")
+
+	return batches
+
+
+def outcome(kind: str, name: str) -> float:
+	return jobs.jobs_total.labels(kind, name).value
+
+
+async def settle():
+	"""Until the consumer is idle and no retry is pending."""
+	queue = jobs._queue
+	for _ in range(500):
+		await asyncio.sleep(0.005)
+		if not queue.retrying and queue.queue._unfinished_tasks == 0:
+			return
+
+
+@pytest.mark.anyio
+async def test_unknown_kinds_are_refused():
+	with pytest.raises(KeyError):
+		await jobs.enqueue("nope", 1)
+
+
+@pytest.mark.anyio
+async def test_jobs_run_inline_before_start():
+	batches = recorder("inline")
+	failed = recorder("inline-failing", fail_times=1)
+	before = outcome("inline-failing", "failed")
+	await jobs.enqueue("inline", 1)
+	await jobs.enqueue("inline-failing", 2)  # logged, not raised
+	assert batches == [[1]] and failed == [[2]]
+	assert outcome("inline-failing", "failed") == before + 1
+
+
+@pytest.mark.anyio
+async def test_queued_jobs_are_batched_per_kind():
+	logins, emails = recorder("login"), recorder("email")
+	jobs.start()
+	for i in range(3):
+		await jobs.enqueue("login", i)
+		await jobs.enqueue("email", f"m{i}")
+	assert jobs.queue_depth.labels().value == 6
+	await jobs.stop()
+	assert logins == [[0, 1, 2]] and emails == [["m0", "m1", "m2"]]
+	assert jobs._queue is None
+
+
+@pytest.mark.anyio
+async def test_failed_jobs_are_retried_with_backoff():
+	batches = recorder("retried", fail_times=2)
+	done = outcome("retried", "done")
+	jobs.start()
+	await jobs.enqueue("retried", "x")
+	await settle()
+	assert batches == [["x"]] * 3
+	assert outcome("retried", "done") == done + 1
+	await jobs.stop()
+
+
+@pytest.mark.anyio
+async def test_attempts_are_counted_per_job():
+	batches = recorder("mixed", fail_times=10)
+	failed = outcome("mixed", "failed")
+	jobs.start()
+	old, new = jobs.Job("mixed", "old"), jobs.Job("mixed", "new")
+	old.attempts = 2  # a retry grouped with a first attempt
+	await jobs._queue.execute("mixed", [old, new])
+	assert batches == [["old", "new"]]
+	assert outcome("mixed", "failed") == failed + 1  # only "old" gave up
+	assert list(jobs._queue.retrying.values()) == [[new]]
+	await settle()
+	assert batches[1:] == [["new"]] * 2
+	assert outcome("mixed", "failed") == failed + 2
+	await jobs.stop()
+
+
+@pytest.mark.anyio
+async def test_stop_runs_pending_retries_now(monkeypatch):
+	monkeypatch.setattr(config, "JOB_RETRY_SECONDS", 60)
+	batches = recorder("slow-retry", fail_times=1)
+	jobs.start()
+	await jobs.enqueue("slow-retry", "x")
+	for _ in range(100):
+		await asyncio.sleep(0.001)
+		if jobs._queue.retrying:
+			break
+	assert batches == [["x"]]
+	await asyncio.wait_for(jobs.stop(), 5)
+	assert batches == [["x"], ["x"]]
+
+
+@pytest.mark.anyio
+async def test_jobs_enqueued_after_stop_run_inline():
+	batches = recorder("late")
+	jobs.start()
+	await jobs.stop()
+	await jobs.enqueue("late", 1)
+	assert batches == [[1]]
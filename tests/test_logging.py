@@ -0,0 +1,95 @@
+import io
+import json
+import logging
+import threading
+
+import pytest
+from loguru import logger
+
+from app.core.logging import BatchedJSONSink, FastInterceptHandler, level_sampler
+
+
+class GatedStream(io.StringIO):
+	"""Holds the writer in its first write until released."""
+
+	def __init__(self):
+		super().__init__()
+		self.entered, self.release = threading.Event(), threading.Event()
+
+	def write(self, text):
+		self.entered.set()
+		self.release.wait(5)
+		return super().write(text)
+
+
+@pytest.fixture
+def sink_to():
+	handlers = []
+
+	def add(sink, **options):
+		handlers.append(logger.add(sink, format="{message}", **options))
+		return sink
+
+	yield add
+	for handler in handlers:
+		logger.remove(handler)
+
+
+def lines(stream):
+	return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_are_written_as_json_lines(sink_to):
+	stream = io.StringIO()
+	sink = sink_to(BatchedJSONSink(stream, 100, batch_size=2, flush_interval=0.01, block=False))
+	logger.bind(request_id="abc").info("hello {}", "usagi")
+	try:
+		1 / 0
+	except ZeroDivisionError:
+		logger.exception("failed")
+	sink.stop()
+
+	hello, failed = lines(stream)
+	assert hello["message"] == "hello usagi" and hello["level"] == "INFO"
+	assert hello["request_id"] == "abc" and hello["function"] == (
+		"test_records_are_written_as_json_lines")
+	assert failed["level"] == "ERROR" and "ZeroDivisionError" in failed["exception"]
+
+
+def test_a_full_queue_drops_and_reports_records(sink_to):
+	stream = GatedStream()
+	sink = sink_to(BatchedJSONSink(stream, 1, batch_size=10, flush_interval=0.01, block=False))
+	logger.info("first")
+	assert stream.entered.wait(5)  # the writer holds "first"
+	for i in range(10):
+		logger.info("record {}", i)  # "record 0" fills the queue
+	stream.release.set()
+	sink.stop()
+
+	written = lines(stream)
+	assert [line["message"] for line in written] == ["first", "record 0", "dropped 9 log records"]
+	assert sink.dropped == 0
+
+
+def test_level_sampler_keeps_a_fraction_per_level():
+	sample = level_sampler({"DEBUG": 0.0, "info": 1.0})
+
+	def record(level):
+		return {"level": logger.level(level)}
+
+	assert not sample(record("DEBUG"))
+	assert sample(record("INFO")) and sample(record("ERROR"))
+
+
+def test_fast_intercept_keeps_the_stdlib_location(sink_to):
+	records = []
+	sink_to(lambda message: records.append(message.record))
+	stdlib = logging.getLogger("usagi.test")
+	stdlib.handlers, stdlib.propagate = [FastInterceptHandler()], False
+	stdlib.setLevel(logging.INFO)
+	stdlib.warning("carrots %s", "low")
+
+	[record] = records
+	assert record["message"] == "carrots low" and record["level"].name == "WARNING"
+	assert record["extra"]["logger"] == "usagi.test"
+	assert record["extra"]["function"] == "test_fast_intercept_keeps_the_stdlib_location"
@@ -0,0 +1,105 @@
+import json
+import os
+
+import pytest
+
+from app.core import metrics
+from app.core.metrics import Counter, Gauge, Histogram, MultiprocessStore, Registry
+
+DEAD_PID = 2**31 - 1
+
+
+def registry(requests: float = 0, in_flight: float = 0, latencies=()):
+	registry = Registry()
+	registry.register(Counter("requests_total", "requests", ("route", ))).labels("/").inc(requests)
+	registry.register(Gauge("in_flight", "in flight")).labels().set(in_flight)
+	histogram = registry.register(Histogram("latency", "latency", buckets=(0.1, 1.0)))
+	for latency in latencies:
+		histogram.labels().observe(latency)
+	return registry
+
+
+def samples(snapshot, name):
+	return {tuple(values): value for values, value in snapshot[name]["samples"]}
+
+
+def test_labels_and_names_are_checked():
+	counter = Counter("c", "c", ("a", "b"))
+	assert counter.labels("x", "y") is counter.labels("x", "y")
+	with pytest.raises(ValueError):
+		counter.labels("x")
+
+	registry = Registry()
+	registry.register(counter)
+	with pytest.raises(ValueError):
+		registry.register(Counter("c", "another c"))
+
+
+def test_render():
+	text = metrics.render(registry(requests=3, in_flight=2, latencies=(0.05, 0.5, 5)).snapshot())
+	assert "# TYPE requests_total counter\n" in text
+	assert 'requests_total{route="/"} 3\n' in text
+	assert "in_flight 2\n" in text
+	assert 'latency_bucket{le="0.1"} 1\nlatency_bucket{le="1"} 2\n' in text
+	assert 'latency_bucket{le="+Inf"} 3\nlatency_sum 5.55\nlatency_count 3\n' in text
+
+
+def test_render_escapes_label_values():
+	registry = Registry()
+	registry.register(Counter("c", "c", ("path", ))).labels('a"b\\c\n').inc()
+	assert 'c{path="a\\"b\\\\c\\n"} 1' in metrics.render(registry.snapshot())
+
+
+def test_merge_sums_every_sample():
+	merged = metrics.merge([
+		registry(requests=1, in_flight=1, latencies=(0.05, )).snapshot(),
+		registry(requests=2, in_flight=3, latencies=(0.5, 5)).snapshot(),
+	])
+	assert samples(merged, "requests_total") == {("/", ): 3}
+	assert samples(merged, "in_flight") == {(): 4}
+	assert samples(merged, "latency") == {(): ([1, 1, 1], 5.55)}
+
+
+def test_collect_merges_workers_and_archives_exited_ones(tmp_path):
+	store = MultiprocessStore(tmp_path, registry(requests=1, in_flight=1))
+	exited = tmp_path / f"metrics_{DEAD_PID}.json"
+	exited.write_text(json.dumps(registry(requests=5, in_flight=7, latencies=(0.5, )).snapshot()))
+
+	merged = store.collect()
+	assert not exited.exists()
+	assert samples(merged, "requests_total") == {("/", ): 6}
+	assert samples(merged, "in_flight") == {(): 1}  # gauges die with their worker
+	assert samples(merged, "latency") == {(): ([0, 1, 0], 0.5)}
+	assert samples(store.collect(), "requests_total") == {("/", ): 6}  # archived once
+
+
+def test_a_reused_pid_archives_the_previous_file(tmp_path):
+	MultiprocessStore(tmp_path, registry(requests=4)).flush()
+	store = MultiprocessStore(tmp_path, registry(requests=1))  # same pid, fresh registry
+	assert json.loads((tmp_path / metrics.ARCHIVE).read_text())
+	assert samples(store.collect(), "requests_total") == {("/", ): 5}
+
+
+def test_unreadable_files_are_skipped(tmp_path):
+	(tmp_path / f"metrics_{DEAD_PID}.json").write_text("{truncated")
+	store = MultiprocessStore(tmp_path, registry(requests=1))
+	assert samples(store.collect(), "requests_total") == {("/", ): 1}
+	assert os.listdir(tmp_path).count(f"metrics_{DEAD_PID}.json") == 0
+
+
+@pytest.mark.anyio
+async def test_middleware_collapses_unknown_methods():
+
+	async def app(scope, receive, send):
+		await send({"type": "http.response.start", "status": 404, "headers": []})
+		await send({"type": "http.response.body", "body": b""})
+
+	async def send(message):
+		pass
+
+	middleware = metrics.MetricsMiddleware(app)
+	for method in ("PROPFIND", "BREW", "GET"):
+		await middleware({"type": "http", "method": method}, None, send)
+	assert set(middleware.routes) == {("OTHER", "<unmatched>"), ("GET", "<unmatched>")}
+	assert middleware.routes["OTHER", "<unmatched>"].statuses[3].value >= 2
+	assert middleware.in_flight.value == 0
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app.core import openapi
+from app.main import create_app
+
+
+class Carrot(BaseModel):
+	length: int
+
+
+class LongerCarrot(BaseModel):
+	length: float
+
+
+def small_app(model=Carrot, extra_route=False) -> FastAPI:
+	app = FastAPI(openapi_url=None)
+
+	@app.post("/carrots")
+	async def plant(carrot: model) -> model:
+		return carrot
+
+	if extra_route:
+
+		@app.get("/carrots")
+		async def count() -> int:
+			return 0
+
+	schema = openapi.SchemaCache(app)
+	app.add_api_route("/openapi.json", schema.respond, include_in_schema=False)
+	app.state.schema = schema
+	return app
+
+
+def test_fingerprints_are_stable_across_builds():
+	assert openapi.fingerprint(create_app()) == openapi.fingerprint(create_app())
+	assert openapi.fingerprint(small_app()) == openapi.fingerprint(small_app())
+
+
+def test_fingerprints_follow_routes_and_models():
+	base = openapi.fingerprint(small_app())
+	assert openapi.fingerprint(small_app(extra_route=True)) != base
+	assert openapi.fingerprint(small_app(model=LongerCarrot)) != base
+
+
+def test_render_is_fastapis_schema():
+	app = small_app()
+	assert json.loads(openapi.render(app)) == app.openapi()
+
+
+def test_read_needs_a_matching_fingerprint(tmp_path):
+	path = tmp_path / "openapi.json"
+	assert openapi.read(path, "abc") is None
+	openapi.write(path, b"{}", "abc")
+	assert openapi.read(path, "abc") == b"{}"
+	assert openapi.read(path, "def") is None
+	assert sorted(p.name for p in tmp_path.iterdir()) == [
+		"openapi.json", "openapi.json.fingerprint"]
+
+
+@pytest.fixture
+def renders(monkeypatch):
+	calls = []
+	render = openapi.render
+
+	def counting(app):
+		calls.append(app)
+		return render(app)
+
+	monkeypatch.setattr(openapi, "render", counting)
+	return calls
+
+
+@pytest.mark.anyio
+async def test_the_schema_is_built_once_per_route_table(renders):
+	app = small_app()
+	schema = app.state.schema
+	first, second = await schema.get(), await schema.get()
+	assert first is second and len(renders) == 1
+
+	@app.get("/hidden", include_in_schema=False)
+	async def hidden():
+		pass
+
+	assert await schema.get() is first  # same fingerprint, nothing to rebuild
+	app.add_api_route("/more", hidden)
+	assert (await schema.get()).fingerprint != first.fingerprint and len(renders) == 2
+
+
+@pytest.mark.anyio
+async def test_a_prebuilt_schema_is_read_instead(tmp_path, renders):
+	app = small_app()
+	path = tmp_path / "openapi.json"
+	openapi.write(path, b'{"prebuilt": true}', openapi.fingerprint(app))
+	document = await openapi.SchemaCache(app, path).get()
+	assert document.body == b'{"prebuilt": true}' and renders == []
+
+	app.add_api_route("/more", lambda: None)
+	document = await openapi.SchemaCache(app, path).get()
+	assert json.loads(document.body) == app.openapi() and len(renders) == 1
+	assert openapi.read(path, document.fingerprint) == document.body  # written back
+
+
+def test_responses_carry_an_etag_and_revalidate():
+	client = TestClient(small_app())
+	plain = client.get("/openapi.json", headers={"Accept-Encoding": "identity"})
+	etag = plain.headers["ETag"]
+	assert plain.json()["paths"].keys() == {"/carrots"}
+	assert not etag.startswith("W/") and plain.headers["Cache-Control"] == "no-cache"
+
+	compressed = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+	assert compressed.headers["Content-Encoding"] == "gzip"
+	assert compressed.headers["ETag"] == f"W/{etag}"
+	assert compressed.content == plain.content  # decoded by the client
+
+	for validator in (etag, f"W/{etag}"):
+		response = client.get("/openapi.json", headers={"If-None-Match": validator})
+		assert response.status_code == 304 and response.content == b""
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from app.core import profiler
+from app.core.config import config
+from app.core.exceptions import TooManyRequestsException
+
+
+@pytest.fixture(autouse=True)
+def available(monkeypatch):
+	monkeypatch.setattr(profiler, "_available_at", 0.0)
+	monkeypatch.setattr(config, "PROFILER_COOLDOWN_SECONDS", 60)
+
+
+async def nibbling_carrots():
+	await asyncio.sleep(10)
+
+
+@pytest.mark.anyio
+async def test_profile_samples_threads_and_suspended_tasks():
+	task = asyncio.create_task(nibbling_carrots())
+	try:
+		stacks, samples = await profiler.profile(0.1, rate=200)
+	finally:
+		task.cancel()
+	assert samples >= 2
+	lines = stacks.splitlines()
+	assert sum(int(line.rsplit(" ", 1)[1]) for line in lines if line.startswith("awaiting;")
+		and "nibbling_carrots (test_profiler.py:" in line) == samples
+	assert any(line.startswith("thread:MainThread;") for line in lines)
+	assert not any(line.startswith("thread:profiler") for line in lines)
+
+
+@pytest.mark.anyio
+async def test_tasks_can_be_left_out():
+	stacks, _ = await profiler.profile(0.05, rate=100, tasks=False)
+	assert stacks and "awaiting" not in stacks
+
+
+@pytest.mark.anyio
+async def test_one_profile_at_a_time():
+	await profiler.profile(0.01)
+	with pytest.raises(TooManyRequestsException) as raised:
+		await profiler.profile(0.01)
+	assert 0 < float(raised.value.headers["Retry-After"]) <= 60
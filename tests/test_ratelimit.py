@@ -0,0 +1,185 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import ratelimit
+from app.core.config import config
+from app.core.ratelimit import MemoryStore, RateLimit, RedisConnection, RedisStore, parse_rate
+
+
+class Clock:
+
+	def __init__(self):
+		self.now = 1000.0
+
+	def monotonic(self):
+		return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+	clock = Clock()
+	monkeypatch.setattr(ratelimit, "time", clock)
+	return clock
+
+
+@pytest.mark.parametrize("rate, parsed", [
+	("10/minute", (10, 60)),
+	("5/hour", (5, 3600)),
+	("100/15minutes", (100, 900)),
+	("1/second", (1, 1)),
+	("2/day", (2, 86400)),
+])
+def test_parse_rate(rate, parsed):
+	assert parse_rate(rate) == parsed
+
+
+@pytest.mark.parametrize("rate", ["10", "10/fortnight", "0/minute", "x/minute", "-1/hour"])
+def test_parse_rate_rejects(rate):
+	with pytest.raises(ValueError):
+		parse_rate(rate)
+
+
+@pytest.mark.anyio
+async def test_memory_store_admits_a_burst_then_one_per_interval(clock):
+	store = MemoryStore()
+	decisions = [await store.check("k", 3, 3.0) for _ in range(4)]
+	assert [d.allowed for d in decisions] == [True, True, True, False]
+	assert [d.remaining for d in decisions] == [2, 1, 0, 0]
+	assert decisions[2].reset == pytest.approx(3.0)
+	assert decisions[3].retry_after == pytest.approx(1.0)
+
+	clock.now += 1.0
+	assert (await store.check("k", 3, 3.0)).allowed
+	assert not (await store.check("k", 3, 3.0)).allowed
+	assert (await store.check("other", 3, 3.0)).remaining == 2
+
+	clock.now += 10.0  # fully replenished, not beyond the burst
+	assert (await store.check("k", 3, 3.0)).remaining == 2
+
+
+@pytest.mark.anyio
+async def test_memory_store_sweeps_expired_keys(clock):
+	store = MemoryStore()
+	for i in range(1023):
+		await store.check(f"old{i}", 1, 1.0)
+	clock.now += 5.0
+	await store.check("new", 1, 1.0)
+	assert list(store.tats) == ["new"] and store.sweep_at == 1024
+
+
+def test_resp_encoding():
+	assert RedisConnection.encode(("GET", b"key", 12)) == (
+		b"*3\r\n$3\r\nGET\r\n$3\r\nkey\r\n$2\r\n12\r\n")
+
+
+async def fake_redis(replies):
+	"""A server answering each command with the next canned RESP reply."""
+	commands = []
+
+	async def handle(reader, writer):
+		while reply := replies and replies.pop(0):
+			count = int((await reader.readline())[1:])
+			args = []
+			for _ in range(count):
+				size = int((await reader.readline())[1:])
+				args.append((await reader.readexactly(size + 2))[:-2].decode())
+			commands.append(args)
+			writer.write(reply)
+			await writer.drain()
+		writer.close()
+
+	server = await asyncio.start_server(handle, "127.0.0.1", 0)
+	return server, commands
+
+
+@pytest.mark.anyio
+async def test_redis_store_loads_the_script_when_missing():
+	server, commands = await fake_redis([
+		b"+OK\r\n",
+		b"-NOSCRIPT No matching script\r\n",
+		b"*4\r\n:1\r\n:4\r\n:12000000\r\n:0\r\n",
+		b"*4\r\n:0\r\n:0\r\n:11000000\r\n:500000\r\n",
+	])
+	port = server.sockets[0].getsockname()[1]
+	store = RedisStore(f"redis://:secret@127.0.0.1:{port}/0")
+	try:
+		assert await store.check("k", 5, 60) == (True, 4, 12.0, 0.0)
+		assert await store.check("k", 5, 60) == (False, 0, 11.0, 0.5)
+	finally:
+		store.close()
+		server.close()
+	assert commands[0] == ["AUTH", "secret"]
+	assert [args[0] for args in commands[1:]] == ["EVALSHA", "EVAL", "EVALSHA"]
+	assert commands[2][3:] == ["k", "5", "60000000"]
+
+
+@pytest.mark.anyio
+async def test_an_unreachable_redis_fails_fast(monkeypatch):
+	monkeypatch.setattr(config, "RATE_LIMIT_TIMEOUT", 0.05)
+	monkeypatch.setattr(ratelimit, "CONNECT_TIMEOUT", 0.2)
+	attempts = []
+
+	async def open_connection(host, port):
+		attempts.append(port)
+		await asyncio.sleep(10)  # a blackholed host
+
+	monkeypatch.setattr(ratelimit.asyncio, "open_connection", open_connection)
+	store = RedisStore("redis://10.255.255.1:6379")
+	with pytest.raises(asyncio.TimeoutError):
+		await store.check("k", 5, 60)  # the attempt outlives this request
+	with pytest.raises(asyncio.TimeoutError):
+		await store.check("k", 5, 60)  # and is shared with the next one
+	await asyncio.sleep(0.25)
+	with pytest.raises(ConnectionError):
+		await store.check("k", 5, 60)  # backing off, without connecting
+	assert attempts == [6379]
+	store.close()
+
+
+def app_with(rate_limit: RateLimit) -> TestClient:
+	app = FastAPI()
+
+	@app.post("/login", dependencies=[Depends(rate_limit)])
+	async def login():
+		return {}
+
+	return TestClient(app)
+
+
+@pytest.fixture
+def store(monkeypatch):
+	monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", True)
+	monkeypatch.setattr(ratelimit, "_store", MemoryStore())
+
+
+def test_the_dependency_sets_headers_and_rejects(store):
+	rejected = ratelimit.rate_limited.labels("POST /login", "ip").value
+	client = app_with(RateLimit("2/minute"))
+	first = client.post("/login")
+	assert first.status_code == 200
+	assert (first.headers["RateLimit-Limit"], first.headers["RateLimit-Remaining"]) == ("2", "1")
+	assert client.post("/login").status_code == 200
+	third = client.post("/login")
+	assert third.status_code == 429 and int(third.headers["Retry-After"]) == 30
+	assert third.headers["RateLimit-Remaining"] == "0"
+	assert ratelimit.rate_limited.labels("POST /login", "ip").value == rejected + 1
+
+
+def test_a_store_failure_lets_requests_through(store, monkeypatch):
+
+	async def check(key, limit, period):
+		raise ConnectionError("down")
+
+	monkeypatch.setattr(ratelimit, "_store", SimpleNamespace(check=check))
+	response = app_with(RateLimit("1/minute")).post("/login")
+	assert response.status_code == 200 and "RateLimit-Limit" not in response.headers
+
+
+def test_limits_can_be_disabled(store, monkeypatch):
+	monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", False)
+	client = app_with(RateLimit("1/minute"))
+	assert [client.post("/login").status_code for _ in range(3)] == [200] * 3
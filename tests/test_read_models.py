@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import pytest
+
+from app import crud
+from app.models import User
+from app.models.base_model import row_model
+from app.models.user_model import UserRoleEnum, UserRow
+from app.schemas.user_schema import UserOut, UserOutFull
+from app.utils import ulid
+
+
+class Session:
+	"""Returns canned rows from `execute`, as a Core select would."""
+
+	def __init__(self, rows):
+		self.rows = rows
+
+	async def execute(self, query):
+		return iter(self.rows)
+
+
+def user_row(**values):
+	defaults = {
+		"id": ulid.new(),
+		"email": "rabbit@example.com",
+		"alias": "rabbit",
+		"password": "hash",
+		"last_login": datetime(2024, 1, 1),
+		"revoked_at": None,
+		"confirmed": True,
+		"role": UserRoleEnum.USER,
+	}
+	return tuple({**defaults, **values}[column.key] for column in User.__table__.columns)
+
+
+def test_row_model_has_a_field_per_column():
+	assert UserRow._fields == tuple(column.key for column in User.__table__.columns)
+	assert UserRow.__slots__ == ()
+	with pytest.raises(AttributeError):
+		UserRow._make(user_row()).extra = 1
+
+
+def test_row_model_members_are_added():
+	Row = row_model(User, shout=lambda self: self.alias.upper())
+	assert Row._make(user_row()).shout() == "RABBIT"
+
+
+def test_registered_on_comes_from_the_id():
+	row = UserRow._make(user_row())
+	assert row.registered_on == ulid.timestamp(row.id)
+
+
+def test_output_schemas_read_rows():
+	row = UserRow._make(user_row())
+	out = UserOut.from_orm(row)
+	assert (out.id, out.alias, out.registered_on) == (row.id, "rabbit", row.registered_on)
+	assert UserOutFull.from_orm(row).email == "rabbit@example.com"
+
+
+@pytest.mark.anyio
+async def test_get_rows_builds_row_types():
+	rows = [user_row(alias="one"), user_row(alias="two")]
+	result = await crud.user.get_rows(db_session=Session(rows))
+	assert [type(row) for row in result] == [UserRow, UserRow]
+	assert [row.alias for row in result] == ["one", "two"]
@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app import crud
+from app.api.v1.endpoints.user import registration_range
+from app.models import User
+from app.models.base_model import ulid_timestamp_ms
+from app.utils import ulid
+
+
+def test_bounds_pass_through():
+	after, before = datetime(2024, 1, 1), datetime(2024, 1, 2)
+	assert registration_range(after, before) == (after, before)
+	assert registration_range(None, before) == (None, before)
+	assert registration_range(after, None) == (after, None)
+
+
+def test_bounds_must_be_ordered():
+	with pytest.raises(HTTPException) as raised:
+		registration_range(datetime(2024, 1, 2), datetime(2024, 1, 1))
+	assert raised.value.status_code == 400
+	with pytest.raises(HTTPException):
+		registration_range(datetime(2024, 1, 1), datetime(2024, 1, 1))
+
+
+def test_naive_and_aware_bounds_compare_as_utc():
+	naive, aware = datetime(2024, 1, 1), datetime(2024, 1, 2, tzinfo=timezone.utc)
+	assert registration_range(naive, aware) == (naive, aware)
+	with pytest.raises(HTTPException):
+		registration_range(aware, naive)
+
+
+def test_filter_created_is_a_primary_key_range():
+	after, before = datetime(2024, 1, 1), datetime(2024, 2, 1)
+	query = crud.user.filter_created(crud.user.row_query(), after=after, before=before)
+	compiled = query.compile(dialect=postgresql.dialect())
+	sql = str(compiled)
+	assert "app_users.id >= " in sql and "app_users.id < " in sql
+	assert sorted(compiled.params.values()) == [ulid.min_for(after), ulid.min_for(before)]
+
+
+def test_filter_created_without_bounds_is_unchanged():
+	query = crud.user.row_query()
+	assert crud.user.filter_created(query) is query
+
+
+def test_ulid_timestamp_ms_reads_the_uuid_prefix():
+	sql = str(ulid_timestamp_ms(User.id).compile(dialect=postgresql.dialect()))
+	assert "substr(replace(CAST(app_users.id AS TEXT)" in sql
+	assert "BIT(48)" in sql
@@ -0,0 +1,153 @@
+import fcntl
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import revocations
+from app.core.revocations import SEQ_OFFSET, Revocation, RevocationTable, epoch_us
+from app.models.user_model import UserRoleEnum
+from app.utils import ulid
+
+
+@pytest.fixture
+def path(tmp_path):
+	return tmp_path / "revocations"
+
+
+@pytest.fixture
+def table(path):
+	table = RevocationTable(path, 64)
+	yield table
+	table.close()
+
+
+def key() -> bytes:
+	return ulid.to_bytes(ulid.new())
+
+
+def seq(table) -> int:
+	return struct.unpack_from("<Q", table.mm, SEQ_OFFSET)[0]
+
+
+def leave_mid_write(table):
+	struct.pack_into("<Q", table.mm, SEQ_OFFSET, seq(table) + 1)
+
+
+def test_put_and_get(table):
+	a, b = key(), key()
+	table.put(a, 100, UserRoleEnum.BANNED)
+	assert table.get(a) == Revocation(100, UserRoleEnum.BANNED)
+	assert table.get(b) is None
+	assert seq(table) == 2
+
+
+def test_the_later_revocation_is_kept(table):
+	a = key()
+	table.put(a, 200, UserRoleEnum.USER)
+	table.put(a, 100, UserRoleEnum.MODERATOR)
+	assert table.get(a) == Revocation(200, UserRoleEnum.MODERATOR)
+
+
+def test_updates_only_touch_stored_users(table):
+	a = key()
+	table.put(a, 0, UserRoleEnum.USER, insert=False)
+	assert table.get(a) is None
+	table.put(a, 5, UserRoleEnum.BANNED)
+	table.put(a, 0, UserRoleEnum.USER, insert=False)  # unbanned
+	assert table.get(a) == Revocation(5, UserRoleEnum.USER)
+
+
+def test_colliding_keys_probe_on(table):
+	suffix = bytes(8)  # the probe starts from the last 8 bytes
+	keys = [bytes([i]) * 8 + suffix for i in range(1, 6)]
+	for i, k in enumerate(keys):
+		table.put(k, i + 1, UserRoleEnum.USER)
+	assert [table.get(k).revoked_at for k in keys] == [1, 2, 3, 4, 5]
+
+
+def test_a_full_table_stops_taking_users(path):
+	table = RevocationTable(path, 16)
+	keys = [key() for _ in range(20)]
+	for k in keys:
+		table.put(k, 1, UserRoleEnum.BANNED)
+	assert sum(table.get(k) is not None for k in keys) == 15  # inserts stop past 90%
+	assert table.full
+	table.close()
+
+
+def test_workers_share_the_file(path, table):
+	other = RevocationTable(path, 1 << 20)  # an existing table keeps its size
+	assert other.slots == table.slots
+	a = key()
+	other.put(a, 7, UserRoleEnum.BANNED)
+	assert table.get(a) == Revocation(7, UserRoleEnum.BANNED)
+	other.close()
+
+
+def test_other_files_are_refused(path):
+	path.write_bytes(b"not a table".ljust(128, b"\0"))
+	with pytest.raises(ValueError):
+		RevocationTable(path, 64)
+
+
+def test_a_counter_left_odd_is_repaired_on_open(path, table):
+	leave_mid_write(table)
+	RevocationTable(path, 64).close()
+	assert seq(table) % 2 == 0
+
+
+def test_a_counter_left_odd_is_repaired_by_the_next_writer(table):
+	leave_mid_write(table)
+	a = key()
+	table.put(a, 1, UserRoleEnum.BANNED)
+	assert seq(table) % 2 == 0 and table.get(a) is not None
+
+
+def test_readers_repair_a_dead_writers_counter(table, monkeypatch):
+	monkeypatch.setattr(revocations, "READ_RETRIES", 3)
+	a = key()
+	table.put(a, 1, UserRoleEnum.BANNED)
+	leave_mid_write(table)
+	assert table.get(a) is None  # left to the database
+	assert table.get(a) == Revocation(1, UserRoleEnum.BANNED)
+
+
+def test_readers_wait_out_a_live_writer(path, table, monkeypatch):
+	monkeypatch.setattr(revocations, "READ_RETRIES", 3)
+	a = key()
+	table.put(a, 1, UserRoleEnum.BANNED)
+	writer = os.open(path, os.O_RDWR)
+	fcntl.flock(writer, fcntl.LOCK_EX)
+	leave_mid_write(table)
+	try:
+		assert table.get(a) is None
+		assert seq(table) % 2 == 1  # not the reader's to repair
+	finally:
+		os.close(writer)
+
+
+def test_revokes_tokens_issued_before():
+	revoked = datetime(2024, 1, 1, 12)
+	revocation = Revocation(epoch_us(revoked), UserRoleEnum.USER)
+	assert revocation.revokes(revoked - timedelta(seconds=1))
+	assert not revocation.revokes(revoked.replace(tzinfo=timezone.utc))
+	assert not Revocation(0, None).revokes(revoked)
+
+
+def test_record_and_lookup(table, monkeypatch):
+	monkeypatch.setattr(revocations, "_table", table)
+	revoked_at = datetime(2024, 1, 1)
+	user = SimpleNamespace(id=ulid.new(), revoked_at=revoked_at, role=UserRoleEnum.USER)
+	clean = SimpleNamespace(id=ulid.new(), revoked_at=None, role=UserRoleEnum.USER)
+	revocations.record(user)
+	revocations.record(clean)
+	assert revocations.lookup(user.id) == Revocation(epoch_us(revoked_at), UserRoleEnum.USER)
+	assert revocations.lookup(user.id.lower()) is not None
+	assert revocations.lookup(clean.id) is None
+	assert revocations.lookup("not-a-ulid") is None
+
+	monkeypatch.setattr(revocations, "_table", None)
+	assert revocations.lookup(user.id) is None
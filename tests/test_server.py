@@ -0,0 +1,108 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from app.server import Master, default_workers, pool_limits
+
+ROOT = Path(__file__).parent.parent
+
+SERVER = """
+import os, uvicorn
+from app.server import Master
+
+async def app(scope, receive, send):
+	if scope["type"] == "http":
+		await send({"type": "http.response.start", "status": 200, "headers": []})
+		await send({"type": "http.response.body", "body": str(os.getpid()).encode()})
+
+sock = uvicorn.Config(app, host="127.0.0.1", port=0).bind_socket()
+print(sock.getsockname()[1], flush=True)
+Master(app, sock, 2, "asyncio", "h11").run()
+"""
+
+
+def test_pool_limits_fit_the_budget():
+	assert pool_limits(4, 5, 10, None) == (5, 10)
+	assert pool_limits(4, 5, 10, 100) == (5, 10)
+	assert pool_limits(4, 5, 10, 24) == (5, 1)
+	assert pool_limits(4, 5, 10, 8) == (2, 0)
+	with pytest.raises(ValueError):
+		pool_limits(4, 5, 10, 3)
+
+
+def test_default_workers():
+	assert 1 <= default_workers() <= (os.cpu_count() or 1)
+
+
+def exit_with(code: int) -> int:
+	pid = os.fork()
+	if not pid:
+		os._exit(code)
+	return pid
+
+
+def reap(master: Master):
+	deadline = time.monotonic() + 5
+	while master.children and time.monotonic() < deadline:
+		master.reap()
+		time.sleep(0.01)
+
+
+def test_workers_failing_to_boot_back_off():
+	master = Master(None, None, 2)
+	for pid in (exit_with(1), exit_with(1)):
+		master.children[pid] = time.monotonic()
+	reap(master)
+	assert (master.pending, master.failures) == (2, 2)
+	assert master.respawn_at - time.monotonic() > 3
+
+
+def test_recycled_workers_are_replaced_at_once():
+	master = Master(None, None, 1)
+	master.failures = 3
+	master.children[exit_with(0)] = time.monotonic()
+	reap(master)
+	assert (master.pending, master.failures, master.respawn_at) == (1, 0, 0.0)
+
+
+def children(pid: int) -> int:
+	count = 0
+	for stat in Path("/proc").glob("[0-9]*/stat"):
+		try:
+			count += stat.read_text().rsplit(")", 1)[1].split()[1] == str(pid)
+		except (OSError, IndexError):
+			pass
+	return count
+
+
+@pytest.mark.skipif(not Path("/proc/self/stat").exists(), reason="reads workers from /proc")
+def test_serves_from_forked_workers_and_drains_on_sigterm():
+	env = {**os.environ, "PYTHONPATH": str(ROOT), "WORKER_MAX_REQUESTS": "0"}
+	server = subprocess.Popen([sys.executable, "-c", SERVER],
+		env=env,
+		stdout=subprocess.PIPE,
+		stderr=subprocess.DEVNULL,
+		text=True)
+	try:
+		url = f"http://127.0.0.1:{server.stdout.readline().strip()}/"
+		pid, deadline = None, time.monotonic() + 20
+		while time.monotonic() < deadline:
+			try:
+				pid = httpx.get(url, timeout=2).text
+				break
+			except httpx.TransportError:
+				time.sleep(0.1)
+		assert pid and pid != str(server.pid)
+		assert children(server.pid) == 2
+		server.send_signal(signal.SIGTERM)
+		assert server.wait(timeout=30) == 0
+	finally:
+		if server.poll() is None:
+			server.kill()
+			server.wait()
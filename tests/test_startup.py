@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+
+from app import main
+from app.core.config import config
+
+ROOT = Path(__file__).parent.parent
+SETTINGS = ("DB_USER", "DB_PASS", "DB_HOST", "DB_PORT", "DB_NAME", "SECRET_KEY", "ENCRYPT_KEY")
+
+IMPORTS = """
+import app.main, app.init_db, app.db.session, app.db.init_data
+from app.core import config
+assert config._config is None, "settings were read"
+assert "app" not in vars(app.main), "the app was built"
+"""
+
+
+def test_imports_need_no_settings(tmp_path):
+	env = {name: value for name, value in os.environ.items() if name not in SETTINGS}
+	env["PYTHONPATH"] = str(ROOT)
+	result = subprocess.run([sys.executable, "-c", IMPORTS],
+		cwd=tmp_path,
+		env=env,
+		capture_output=True,
+		text=True)
+	assert result.returncode == 0, result.stderr
+
+
+def test_the_app_is_built_on_first_access(monkeypatch):
+	monkeypatch.delitem(vars(main), "app", raising=False)
+	app = main.app
+	assert isinstance(app, FastAPI) and main.app is app
+	assert any(route.path.startswith(config.API_V1_STR) for route in app.routes)
+
+
+def test_create_app_builds_a_new_app():
+	assert main.create_app() is not main.create_app()
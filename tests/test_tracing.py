@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import tracing
+from app.core.config import config
+
+
+@pytest.fixture
+def sampled(monkeypatch):
+	monkeypatch.setattr(config, "TRACE_SAMPLE_RATE", 1.0)
+	monkeypatch.setattr(config, "TRACE_MIN_DURATION_MS", 0.0)
+	monkeypatch.setattr(config, "TRACE_EXPORT_PATH", None)
+	monkeypatch.setattr(tracing, "_traces", None)
+
+
+def names(trace):
+	return [span["name"] for span in trace["spans"]]
+
+
+def test_unsampled_spans_are_the_noop(monkeypatch):
+	monkeypatch.setattr(config, "TRACE_SAMPLE_RATE", 0.0)
+	assert tracing.start_trace("GET /") is tracing.NOOP
+	assert tracing.span("query") is tracing.NOOP
+	with tracing.span("query") as span:
+		span.set_attribute("rows", 1)
+
+
+def test_spans_nest_under_the_current_span(sampled):
+	with tracing.start_trace("job", kind="test") as root:
+		with tracing.span("outer") as outer:
+			with tracing.span("inner") as inner:
+				assert tracing.current_span() is inner
+		with pytest.raises(KeyError):
+			with tracing.span("failing"):
+				raise KeyError
+	assert tracing.current_span() is None
+	assert (inner.parent_id, outer.parent_id) == (outer.span_id, root.span_id)
+
+	[trace] = tracing.recent()
+	assert trace["name"] == "job" and trace["attributes"] == {"kind": "test"}
+	assert names(trace) == ["job", "outer", "inner", "failing"]
+	assert trace["spans"][3]["attributes"] == {"error": "KeyError"}
+
+
+@pytest.mark.anyio
+async def test_traced_functions_and_tasks_keep_their_parent(sampled):
+
+	@tracing.traced()
+	async def fetch():
+		await asyncio.sleep(0)
+
+	@tracing.traced("compute")
+	def compute():
+		return 42
+
+	with tracing.start_trace("request"):
+		await asyncio.gather(fetch(), asyncio.create_task(fetch()))
+		assert compute() == 42
+	assert compute() == 42  # outside a trace
+
+	[trace] = tracing.recent()
+	root_id = trace["spans"][0]["span_id"]
+	assert sorted(names(trace)[1:]) == ["compute", *[fetch.__qualname__] * 2]
+	assert {span["parent_id"] for span in trace["spans"][1:]} == {root_id}
+
+
+def test_recent_filters_and_orders_newest_first(sampled, monkeypatch):
+	for name in ("GET /a", "GET /b", "POST /a"):
+		with tracing.start_trace(name):
+			pass
+	assert [trace["name"] for trace in tracing.recent()] == ["POST /a", "GET /b", "GET /a"]
+	assert [trace["name"] for trace in tracing.recent(name="/a", limit=1)] == ["POST /a"]
+	assert tracing.recent(min_duration_ms=1e9) == []
+
+	monkeypatch.setattr(config, "TRACE_MIN_DURATION_MS", 1e9)
+	with tracing.start_trace("fast"):
+		pass
+	assert tracing.recent()[0]["name"] == "POST /a"
+
+
+def test_otlp_export_format(sampled):
+	with tracing.start_trace("root", sampled=True, rate=0.5, count=3):
+		with tracing.span("child"):
+			pass
+	trace = tracing._traces[-1]
+	[scope] = tracing.otlp(trace)["resourceSpans"][0]["scopeSpans"]
+	child, root = scope["spans"]
+	assert root["kind"] == 2 and "parentSpanId" not in root
+	assert child["parentSpanId"] == root["spanId"] and child["traceId"] == trace.trace_id
+	assert root["attributes"] == [
+		{"key": "sampled", "value": {"boolValue": True}},
+		{"key": "rate", "value": {"doubleValue": 0.5}},
+		{"key": "count", "value": {"intValue": "3"}},
+	]
+
+
+def test_middleware_traces_requests_by_route(sampled):
+	app = FastAPI()
+	router = APIRouter(route_class=tracing.TracedRoute)
+
+	@router.get("/items/{item_id}")
+	async def get_item(item_id: int):
+		with tracing.span("lookup"):
+			return {"id": item_id}
+
+	app.include_router(router)
+	app.add_middleware(tracing.TracingMiddleware)
+	assert TestClient(app).get("/items/7").json() == {"id": 7}
+
+	[trace] = tracing.recent()
+	assert trace["name"] == "GET /items/{item_id}"
+	assert trace["attributes"]["http.status_code"] == 200
+	assert names(trace) == [
+		"GET /items/{item_id}", "endpoint get_item", "lookup", "serialize", "write response"]
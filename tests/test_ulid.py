@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.utils import ulid
+
+
+def test_round_trips_through_bytes_and_int():
+	value = ulid.new()
+	assert len(value) == 26 and ulid.is_valid(value)
+	assert ulid.from_bytes(ulid.to_bytes(value)) == value
+	assert ulid.from_int(ulid.to_int(value)) == value
+
+
+def test_extremes():
+	assert ulid.from_int(0) == "0" * 26
+	assert ulid.from_int((1 << 128) - 1) == "7" + "Z" * 25
+	assert ulid.to_int("7" + "Z" * 25) == (1 << 128) - 1
+
+
+def test_lowercase_is_accepted():
+	value = ulid.new()
+	assert ulid.is_valid(value.lower())
+	assert ulid.to_bytes(value.lower()) == ulid.to_bytes(value)
+	assert ulid.timestamp(value.lower()) == ulid.timestamp(value)
+
+
+@pytest.mark.parametrize("value", ["", "0" * 25, "0" * 27, "8" + "0" * 25, "0" * 25 + "U"])
+def test_invalid_strings(value):
+	assert not ulid.is_valid(value)
+	with pytest.raises(ValueError):
+		ulid.to_bytes(value)
+
+
+def test_from_bytes_needs_16_bytes():
+	with pytest.raises(ValueError):
+		ulid.from_bytes(bytes(15))
+
+
+def test_generation_is_strictly_increasing():
+	values = [ulid.new() for _ in range(10_000)]
+	assert values == sorted(values)
+	assert len(set(values)) == len(values)
+
+
+def test_same_millisecond_increments_the_random_part(monkeypatch):
+	generator = ulid.MonotonicULID()
+	monkeypatch.setattr(ulid.time, "time_ns", lambda: 1_700_000_000_000_000_000)
+	first, second = generator.new_int(), generator.new_int()
+	assert second == first + 1
+	assert first >> ulid.RANDOM_BITS == 1_700_000_000_000
+
+
+def test_clock_going_backwards_keeps_the_order(monkeypatch):
+	generator = ulid.MonotonicULID()
+	now = [1_700_000_000_000_000_000]
+	monkeypatch.setattr(ulid.time, "time_ns", lambda: now[0])
+	first = generator.new_int()
+	now[0] -= 5_000_000_000
+	assert generator.new_int() > first
+
+
+def test_timestamp_is_the_creation_time_in_utc():
+	before = datetime.now(timezone.utc) - timedelta(milliseconds=1)
+	value = ulid.new()
+	created = ulid.timestamp(value)
+	assert created.tzinfo is timezone.utc  # serialized with +00:00, as with ulid-py
+	assert before <= created <= datetime.now(timezone.utc)
+	assert ulid.timestamps([value, value]) == [created, created]
+
+
+def test_min_and_max_for_bound_every_ulid_of_a_millisecond():
+	moment = datetime(2023, 3, 6, 18, 22, 41, 516000, tzinfo=timezone.utc)
+	low, high = ulid.min_for(moment), ulid.max_for(moment)
+	assert ulid.timestamp(low) == ulid.timestamp(high) == moment
+	assert low < high
+	assert ulid.to_int(high) - ulid.to_int(low) == ulid.RANDOM_MAX
+	assert ulid.max_for(moment - timedelta(milliseconds=1)) < low
+
+
+def test_naive_datetimes_are_utc():
+	moment = datetime(2023, 3, 6, 12)
+	assert ulid.min_for(moment) == ulid.min_for(moment.replace(tzinfo=timezone.utc))
+
+
+def test_datetimes_before_the_epoch_clamp_to_zero():
+	assert ulid.datetime_ms(datetime(1960, 1, 1)) == 0
+	assert ulid.min_for(datetime(1960, 1, 1)) == "0" * 26
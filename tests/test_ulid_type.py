@@ -0,0 +1,60 @@
+import uuid
+from pathlib import Path
+
+import pytest
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import crud
+from app.models.base_model import ULIDType
+from app.utils import ulid
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_postgresql_binds_a_uuid_and_reads_it_back():
+	column = ULIDType()
+	value = ulid.new()
+	bound = column.process_bind_param(value, postgresql.dialect())
+	assert isinstance(bound, uuid.UUID)
+	assert bound.bytes == ulid.to_bytes(value)
+	assert column.process_result_value(bound, postgresql.dialect()) == value
+	assert column.process_result_value(str(bound), postgresql.dialect()) == value
+
+
+def test_other_dialects_bind_16_bytes():
+	column = ULIDType()
+	value = ulid.new()
+	bound = column.process_bind_param(value, sqlite.dialect())
+	assert bound == ulid.to_bytes(value) and len(bound) == 16
+	assert column.process_result_value(memoryview(bound), sqlite.dialect()) == value
+
+
+def test_none_passes_through():
+	column = ULIDType()
+	assert column.process_bind_param(None, postgresql.dialect()) is None
+	assert column.process_result_value(None, postgresql.dialect()) is None
+
+
+def test_uuid_order_is_creation_order():
+	ids = [ulid.new() for _ in range(100)]
+	bound = [ULIDType().process_bind_param(value, postgresql.dialect()) for value in ids]
+	assert sorted(bound, key=lambda u: u.bytes) == bound
+
+
+@pytest.mark.anyio
+async def test_malformed_ids_are_misses():
+	session = object()  # never used, a malformed id can't match a row
+	assert await crud.user.get(id="not-a-ulid", db_session=session) is None
+	assert await crud.user.get_row(id="x" * 26, db_session=session) is None
+	assert await crud.user.get_by_ids(list_ids=["nope", "8" * 26], db_session=session) == []
+
+
+def test_migrations_chain_from_a_baseline():
+	config = Config(str(ROOT / "alembic.ini"))
+	config.set_main_option("script_location", str(ROOT / "alembic"))
+	script = ScriptDirectory.from_config(config)
+	revisions = list(script.walk_revisions())  # head first
+	assert [revision.revision for revision in revisions] == ["4f1c2a9e7b3d", "0c5e8d1b2a47"]
+	assert revisions[-1].down_revision is None